@@ -0,0 +1,69 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.services.lifecycle import readiness
+from app.services.metrics import REGISTRY
+from app.services.executor import inference_pool
+from app.services.style_transfer import inference_batcher
+from app.services.style_cache import style_cache
+from app.services.result_cache import result_cache
+from app.services.style_gallery import style_gallery
+from app.services.shape_buckets import shape_buckets
+from app.services.batch_jobs import job_manager
+from app.api.websocket import ACTIVE_SESSIONS
+router = APIRouter()
+
+def _cache_samples(kind: str):
+    stats = {"style": style_cache.stats, "result": result_cache.stats}[kind]()
+    samples = [({"cache": kind, "result": "hit"}, stats["hits"]), ({"cache": kind, "result": "miss"}, stats["misses"])]
+    if kind == "result":
+        samples.append(({"cache": kind, "result": "disk_hit"}, stats["disk_hits"]))
+    return samples
+
+# Số liệu đọc từ stats() của từng service lúc scrape
+REGISTRY.collector(
+    "inference_pool_jobs", "Job trong inference pool (in_flight gồm cả queued)",
+    lambda: [({"state": s}, inference_pool.stats()[s]) for s in ("in_flight", "queued")]
+)
+REGISTRY.collector(
+    "inference_pool_failures", "Job bị từ chối (pool đầy) hoặc quá thời gian",
+    lambda: [({"reason": s}, inference_pool.stats()[s]) for s in ("rejected", "timed_out")], kind="counter"
+)
+REGISTRY.collector("inference_batcher_pending", "Request đang chờ gom batch", lambda: [({}, inference_batcher.pending())])
+REGISTRY.collector(
+    "cache_lookups", "Lượt tra cache style features / kết quả",
+    lambda: _cache_samples("style") + _cache_samples("result"), kind="counter"
+)
+REGISTRY.collector(
+    "cache_bytes", "Dung lượng cache trong RAM",
+    lambda: [({"cache": "style"}, style_cache.stats()["bytes"]), ({"cache": "result"}, result_cache.stats()["bytes"])]
+)
+REGISTRY.collector(
+    "style_gallery_styles", "Style trong gallery theo trạng thái",
+    lambda: [({"state": s}, style_gallery.stats()[s]) for s in ("styles", "decoded", "prepared")]
+)
+REGISTRY.collector(
+    "shape_bucket_lookups", "Lượt đưa content về bucket",
+    lambda: [({"result": "hit"}, shape_buckets.stats()["hits"]), ({"result": "miss"}, shape_buckets.stats()["misses"])],
+    kind="counter"
+)
+REGISTRY.collector(
+    "batch_jobs", "Batch job theo trạng thái", lambda: [({"state": s}, n) for s, n in job_manager.stats().items()]
+)
+REGISTRY.collector("ws_active_sessions", "Session WebSocket video đang mở", lambda: [({}, len(ACTIVE_SESSIONS))])
+REGISTRY.collector("worker_ready", "1 nếu worker đã warmup xong", lambda: [({}, int(readiness.status()["ready"]))])
+
+@router.get("/healthz")
+def healthz():
+    # Process còn sống và event loop còn phục vụ request
+    return {"status": "ok"}
+
+@router.get("/readyz")
+def readyz():
+    # 503 cho tới khi warmup xong: load balancer chưa gửi traffic tới worker này
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@router.get("/metrics")
+def metrics():
+    # Text format của Prometheus, mỗi worker (process) có bộ đếm riêng
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
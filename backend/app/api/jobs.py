@@ -0,0 +1,110 @@
+import math
+import os
+import shutil
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from app import config
+from app.services.batch_jobs import (
+    OUTPUT_KINDS, count_archive, iter_archive, job_manager, read_image_file, resolve_manifest
+)
+from app.services.style_gallery import style_gallery
+from app.utils import decode_image_bytes
+
+router = APIRouter()
+
+def _save_upload(upload: UploadFile, path: str) -> None:
+    # Copy từng khối: archive có thể lớn hơn RAM
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, 1024 * 1024)
+
+@router.post("/api/jobs", status_code=202)
+async def create_job(
+    archive: UploadFile = File(None),
+    manifest: str = Form(None),
+    style_image: UploadFile = File(None),
+    style_id: str = Form(None),
+    model: str = Form("adain"),
+    alpha: float = Form(1.0),
+    output: str = Form("zip"),
+    batch_size: int = Form(config.JOB_BATCH_SIZE),
+    max_side: int = Form(config.JOB_MAX_SIDE)
+):
+    """
+    Stylize hàng loạt ảnh trong nền: `archive` (zip / tar ảnh content) hoặc `manifest` (path trong
+    JOB_INPUT_DIR, JSON list hoặc mỗi dòng 1 path), 1 style cho cả job. Trả về job để theo dõi qua
+    GET /api/jobs/{id}.
+    """
+    if (archive is None) == (manifest is None):
+        raise HTTPException(status_code=400, detail="Cần đúng 1 trong archive hoặc manifest")
+    if style_id is None and style_image is None:
+        raise HTTPException(status_code=400, detail="Cần style_image hoặc style_id")
+    if style_id is not None and style_id not in style_gallery:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy style_id: {style_id}")
+    if model not in ["adain", "sanet"]:
+        raise HTTPException(status_code=400, detail=f"model phải là 'adain' hoặc 'sanet', nhận được: {model}")
+    if not math.isfinite(alpha):
+        raise HTTPException(status_code=400, detail=f"alpha không hợp lệ: {alpha}")
+    if output not in OUTPUT_KINDS:
+        raise HTTPException(status_code=400, detail=f"output phải là một trong {list(OUTPUT_KINDS)}, nhận được: {output}")
+
+    style_np = None
+    if style_id is None:
+        try:
+            style_np = decode_image_bytes(await style_image.read(), "style")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if manifest is not None:
+        try:
+            entries = resolve_manifest(manifest, config.JOB_INPUT_DIR)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    job = job_manager.create(
+        model, alpha=alpha, output=output, batch_size=batch_size, max_side=max_side, style_id=style_id
+    )
+    if archive is not None:
+        job.input_path = os.path.join(job.dir, "input")
+        await run_in_threadpool(_save_upload, archive, job.input_path)
+        try:
+            job.total = await run_in_threadpool(count_archive, job.input_path)
+        except ValueError as e:
+            shutil.rmtree(job.dir, ignore_errors=True)
+            raise HTTPException(status_code=400, detail=str(e))
+        items, load = iter_archive(job.input_path), decode_image_bytes
+    else:
+        job.total = len(entries)
+        items, load = iter(entries), read_image_file
+
+    job_manager.submit(job, items, load, style_np)
+    return JSONResponse(job.to_dict(), status_code=202)
+
+@router.get("/api/jobs")
+def list_jobs():
+    return job_manager.list()
+
+@router.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy job: {job_id}")
+    return job.to_dict()
+
+@router.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    # Ảnh đã ghi vẫn giữ, job dừng sau batch đang chạy
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy job: {job_id}")
+    return job_manager.get(job_id).to_dict()
+
+@router.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy job: {job_id}")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"Job đang {job.state}")
+    if job.output != "zip" or not job.output_path or not os.path.exists(job.output_path):
+        raise HTTPException(status_code=404, detail=f"Kết quả không phải file zip: {job.output_path}")
+    return FileResponse(job.output_path, media_type="application/zip", filename=f"{job.id}.zip")
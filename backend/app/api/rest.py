@@ -1,28 +1,115 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Response
-from app.utils import style_transfer_bytes
-import os, glob
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Response
+from app.utils import style_transfer_bytes_async, style_transfer_sweep_async
+from app.services.executor import PoolOverloaded, InferenceTimeout, inference_pool
+from app.services.style_gallery import style_gallery
+from app.services.style_cache import style_cache
+from app.services.result_cache import result_cache
+from app.services.shape_buckets import shape_buckets
+from app.services.batch_jobs import job_manager
+from app.services.style_transfer import inference_batcher
 from app import config
+import base64
+import math
 router = APIRouter()
 
-os.makedirs(config.STYLE_DIR, exist_ok=True)
-LIST_STYLES = glob.glob(os.path.join(config.STYLE_DIR, "*"))
-STYLE_NAMES = [os.path.basename(f) for f in LIST_STYLES]
-
 @router.get("/api/styles")
 def get_styles():
-    return [{"id": name, "thumbnail": f"/static/styles/{name}.jpg"} for name in STYLE_NAMES]
+    return [
+        {"id": style_id, "thumbnail": f"/static/styles/{style_gallery.filename(style_id)}"}
+        for style_id in style_gallery.ids()
+    ]
+
+@router.get("/api/stats")
+def get_stats():
+    return {
+        "shape_buckets": shape_buckets.stats(),
+        "batcher": inference_batcher.stats(),
+        "inference_pool": inference_pool.stats(),
+        "style_cache": style_cache.stats(),
+        "style_gallery": style_gallery.stats(),
+        "result_cache": result_cache.stats(),
+        "batch_jobs": job_manager.stats(),
+    }
 
 @router.post("/api/style/image")
 async def style_image(
     content_file: UploadFile = File(...),
     style_image: UploadFile = File(None),
-    model: str = Form(...)
+    style_id: str = Form(None),
+    model: str = Form(...),
+    alpha: float = Form(1.0),
+    if_none_match: str = Header(None)
 ):
+    if not math.isfinite(alpha):
+        raise HTTPException(status_code=400, detail=f"alpha không hợp lệ: {alpha}")
+    if style_id is None and style_image is None:
+        raise HTTPException(status_code=400, detail="Cần style_image hoặc style_id")
+    if style_id is not None and style_id not in style_gallery:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy style_id: {style_id}")
+
     content_bytes = await content_file.read()
-    style_bytes = await style_image.read()
-    result_bytes = style_transfer_bytes(content_bytes, style_bytes, model)
+    style_bytes = await style_image.read() if style_id is None else None
+    try:
+        result_bytes, etag = await style_transfer_bytes_async(
+            content_bytes, style_bytes, model, style_id=style_id, alpha=alpha, if_none_match=if_none_match
+        )
+    except PoolOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except InferenceTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # return Response(content=result_bytes, media_type="image/jpeg")
-    return Response(content=result_bytes, media_type="image/jpeg")
+    # ETag = hash của input (content, style, model, alpha) -> kết quả không đổi
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if result_bytes is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=result_bytes, media_type="image/jpeg", headers=headers)
 
+@router.post("/api/style/sweep")
+async def style_sweep(
+    content_file: UploadFile = File(...),
+    style_image: UploadFile = File(None),
+    style_id: str = Form(None),
+    alphas: str = Form("0.25,0.5,0.75,1.0")
+):
+    """
+    Nhiều mức alpha (AdaIN) trong 1 request: encode 1 lần, decoder chạy 1 batch cho mọi alpha.
+    Trả về JSON, mỗi ảnh dạng data URL JPEG.
+    """
+    try:
+        alpha_list = [float(a) for a in alphas.split(",") if a.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"alphas không hợp lệ: {alphas}")
+    if not alpha_list or len(alpha_list) > config.ALPHA_SWEEP_MAX:
+        raise HTTPException(status_code=400, detail=f"Cần từ 1 đến {config.ALPHA_SWEEP_MAX} alpha")
+    if not all(math.isfinite(a) for a in alpha_list):
+        raise HTTPException(status_code=400, detail=f"alphas không hợp lệ: {alphas}")
+
+    if style_id is None and style_image is None:
+        raise HTTPException(status_code=400, detail="Cần style_image hoặc style_id")
+    if style_id is not None and style_id not in style_gallery:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy style_id: {style_id}")
+
+    content_bytes = await content_file.read()
+    style_bytes = await style_image.read() if style_id is None else None
+    try:
+        results = await style_transfer_sweep_async(content_bytes, style_bytes, alpha_list, style_id=style_id)
+    except PoolOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except InferenceTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    return {
+        "model": "adain",
+        "results": [
+            {
+                "alpha": alpha,
+                "etag": etag,
+                "image": "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii"),
+            }
+            for alpha, (data, etag) in zip(alpha_list, results)
+        ],
+    }
@@ -1,101 +1,92 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, UploadFile, File
-import cv2
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import math
 import numpy as np
-import asyncio
-import time
-from app.utils import style_transfer_bytes  
+import uuid
+from app.utils import decode_image_bytes
+from app.services.video_session import VideoSession
+from app.services.style_gallery import style_gallery
+from app.logger import get_logger
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-processing = False
-latest_frame = None
-CURRENT_STYLE_IMAGE = None
-CURRENT_MODEL_NAME = "adain"
-FRAME_INTERVAL = 1 / 2     # xử lý tối đa 5 FPS
-last_frame_time = 0
+# Style đã set qua /ws/set theo session_id (ảnh style, model, alpha, style_id trong gallery hoặc None).
+# Giữ lại sau khi connection nhận để client reconnect cùng session_id vẫn có style; LRU, session cũ nhất hết hạn trước
+MAX_SESSION_STYLES = 256
+SESSION_STYLES: "OrderedDict[str, Tuple[np.ndarray, str, float, Optional[str]]]" = OrderedDict()
+ACTIVE_SESSIONS: Dict[str, VideoSession] = {}
 
 
 @router.post("/ws/set")
-async def set_style(style_image: UploadFile = File(...), model: str = "adain"):
-    global CURRENT_STYLE_IMAGE, CURRENT_MODEL_NAME
-
-    bytes_data = await style_image.read()
-
-    img_np = np.frombuffer(bytes_data, np.uint8)
-    CURRENT_STYLE_IMAGE = cv2.imdecode(img_np, cv2.IMREAD_COLOR)
-    CURRENT_MODEL_NAME = model
-
-    return {"ok": True}
+async def set_style(
+    style_image: UploadFile = File(None),
+    style_id: str = Form(None),
+    model: str = Form("adain"),
+    alpha: float = Form(1.0)
+):
+    if model not in ["adain", "sanet"]:
+        raise HTTPException(status_code=400, detail=f"model phải là 'adain' hoặc 'sanet', nhận được: {model}")
+    if not math.isfinite(alpha):
+        raise HTTPException(status_code=400, detail=f"alpha không hợp lệ: {alpha}")
+
+    if style_id is not None:
+        if style_id not in style_gallery:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy style_id: {style_id}")
+        style_np = style_gallery.get_image(style_id)
+    elif style_image is not None:
+        bytes_data = await style_image.read()
+        try:
+            style_np = decode_image_bytes(bytes_data, "style")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        raise HTTPException(status_code=400, detail="Cần style_image hoặc style_id")
+
+    session_id = uuid.uuid4().hex
+    SESSION_STYLES[session_id] = (style_np, model, alpha, style_id)
+    while len(SESSION_STYLES) > MAX_SESSION_STYLES:
+        SESSION_STYLES.popitem(last=False)
+
+    return {"ok": True, "session_id": session_id}
 
 
 @router.websocket("/ws/video")
-async def websocket_video(ws: WebSocket):
-    global processing, latest_frame, last_frame_time
-    processing = False
-    latest_frame = None
-    last_frame_time = 0
+async def websocket_video(ws: WebSocket, session_id: Optional[str] = None):
+    style = SESSION_STYLES.get(session_id) if session_id else None
+    if style is not None:
+        SESSION_STYLES.move_to_end(session_id)
 
     await ws.accept()
-    print("🔌 WebSocket connected")
-
-    async def process_loop():
-        """Process newest frame only, skip old frames."""
-        global processing, latest_frame
-
-        if processing:
-            return
-
-        processing = True
-
-        while latest_frame is not None:
-            frame_bytes = latest_frame
-            latest_frame = None
-
-            # Decode content frame
-            np_arr = np.frombuffer(frame_bytes, np.uint8)
-            content_np = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            if content_np is None:
-                print("❌ decode content failed")
-                processing = False
-                return
-
-            # Encode style image
-            ok, style_buf = cv2.imencode(".jpg", CURRENT_STYLE_IMAGE)
-            style_bytes = style_buf.tobytes()
-
-            # Encode content
-            ok, content_buf = cv2.imencode(".jpg", content_np)
-            content_bytes = content_buf.tobytes()
-
-            # Apply style transfer
-            try:
-                output_bytes = style_transfer_bytes(
-                    content_bytes=content_bytes,
-                    style_bytes=style_bytes,
-                    model_name=CURRENT_MODEL_NAME
-                )
-            except Exception as e:
-                print("❌ Style transfer error:", e)
-                processing = False
-                return
-
-            await ws.send_bytes(output_bytes)
-
-        processing = False
+    if style is None:
+        await ws.send_json({
+            "type": "error", "detail": "session_id không tồn tại hoặc đã hết hạn, gọi POST /ws/set trước"
+        })
+        await ws.close(code=1008)
+        return
+
+    style_np, model_name, alpha, style_id = style
+    session = VideoSession(
+        ws.send_bytes, style_np, model_name, alpha, session_id=session_id, send_json=ws.send_json,
+        style_id=style_id
+    )
+    ACTIVE_SESSIONS[session.session_id] = session
+    logger.info(
+        "🔌 WebSocket connected",
+        extra={"session": session.session_id[:8], "model": model_name, "active": len(ACTIVE_SESSIONS)}
+    )
 
     try:
+        await session.prepare()
         while True:
             frame_bytes = await ws.receive_bytes()
-
-            # ==== FPS LIMIT HERE ====
-            now = time.time()
-            if now - last_frame_time < FRAME_INTERVAL:
-                continue  # skip frame (too soon)
-            last_frame_time = now
-            # =========================
-
-            latest_frame = frame_bytes
-            asyncio.create_task(process_loop())
+            session.submit_frame(frame_bytes)
 
     except WebSocketDisconnect:
-        print("🔌 WebSocket closed")
+        logger.info("🔌 WebSocket closed", extra=session.stats())
+    finally:
+        await session.close()
+        # Client reconnect cùng session_id có thể đã thay entry trước khi connection cũ đóng
+        if ACTIVE_SESSIONS.get(session.session_id) is session:
+            del ACTIVE_SESSIONS[session.session_id]
@@ -0,0 +1,313 @@
+"""
+Benchmark pipeline serving trên CPU: `apply_style` đầu-cuối và từng bước của nó
+(decode, preprocess, run_inference, postprocess, encode) theo ma trận
+model x kích thước x batch size x số intra-op thread x provider.
+
+Mỗi case báo latency p50/p95/p99 (ms), throughput (ảnh/giây) và peak RSS (MB), ghi ra JSON.
+Nếu có --baseline thì so với report cũ: bước nào có p50 chậm hơn quá --tolerance (và quá
+--min-delta-ms) bị đánh dấu regression và lệnh trả về exit code 1 (dùng làm gate trong CI).
+
+Chạy từ thư mục backend/:
+    python -m app.benchmark --models adain --sizes 256x256 512x512 --batch-sizes 1 4 --threads 1 4
+    python -m app.benchmark --baseline benchmark_baseline.json --save-baseline   # ghi baseline mới
+    python -m app.benchmark --baseline benchmark_baseline.json                   # so với baseline
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from app import config
+from app.models import loader
+from app.models.loader import MODEL_NAMES, has_stages
+from app.services.inference import run_inference_batch
+from app.services.preprocess import postprocess_tensor, preprocess_image
+from app.services.shape_buckets import parse_buckets
+from app.services.style_transfer import apply_style, use_fused_io
+from app.utils import decode_image_bytes, encode_result
+
+# Ảnh mặc định: content mẫu trong results/ và style đầu tiên trong gallery
+DEFAULT_CONTENT_GLOB = os.path.join(os.path.dirname(config.BASE_DIR), "results", "*", "*content*.jpg")
+
+
+def _first_image(paths: List[str], seed: int) -> np.ndarray:
+    """Ảnh RGB uint8 đầu tiên đọc được, không có thì ảnh nhiễu cố định theo seed."""
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            return np.ascontiguousarray(image[..., ::-1])
+    print(f"⚠ Không có ảnh, dùng ảnh nhiễu (seed={seed})")
+    return np.random.default_rng(seed).integers(0, 256, (512, 512, 3), dtype=np.uint8)
+
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM của process (Linux), để peak RSS đo riêng từng case."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS của process (MB): VmHWM trên Linux, ru_maxrss ở nơi khác (không reset được)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS trả về byte, Linux trả về KB
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+def measure(fn: Callable[[], object], warmup: int, repeats: int) -> List[float]:
+    """Chạy fn `warmup` lần không đo rồi `repeats` lần, trả về latency từng lần (ms)."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings: List[float], batch_size: int) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(np.mean(timings)), 3),
+        "throughput_ips": round(batch_size * 1000 / float(np.mean(timings)), 3),
+    }
+
+
+def pin_sessions(model_name: str, providers: List[str]) -> None:
+    """
+    Tạo lại session (đọc ORT_INTRA_OP_THREADS hiện tại) với providers cho trước cho mọi graph
+    mà apply_style / run_inference sẽ dùng: load_model sau đó lấy đúng session này từ cache.
+    """
+    loader.clear_cache()
+    loader.load_model(model_name, providers=providers)
+    staged = has_stages(model_name)
+    fused = use_fused_io(model_name, staged)
+    if staged:
+        # Style features luôn tính bằng encoder không fused (get_style_features)
+        loader.load_model(model_name, providers=providers, stage="encoder")
+        for stage in loader.STAGES:
+            loader.load_model(model_name, providers=providers, stage=stage, fused=fused)
+    elif fused:
+        loader.load_model(model_name, providers=providers, fused=True)
+
+
+def run_case(
+    model_name: str,
+    size: Tuple[int, int],
+    batch_size: int,
+    content: np.ndarray,
+    style: np.ndarray,
+    warmup: int,
+    repeats: int
+) -> Dict[str, Dict[str, float]]:
+    """
+    Đo từng bước cho 1 case (session đã được pin_sessions). `apply_style` chỉ đo khi batch_size = 1
+    (API phục vụ từng ảnh), các bước còn lại chạy cho cả batch.
+    """
+    width, height = size
+    normalize = model_name == "adain"
+    content = cv2.resize(content, (width, height), interpolation=cv2.INTER_AREA)
+    content_jpeg = encode_result(content)
+    session = loader.load_model(model_name)
+
+    def decode():
+        return [decode_image_bytes(content_jpeg) for _ in range(batch_size)]
+
+    def preprocess(images):
+        return np.concatenate([preprocess_image(image, target_size=None, normalize=normalize) for image in images])
+
+    style_tensor = preprocess_image(style, target_size=(256, 256), normalize=normalize)
+
+    def infer(tensors):
+        return run_inference_batch(session, tensors, style_tensor, model_name=model_name)
+
+    def postprocess(outputs):
+        return [postprocess_tensor(outputs[i:i + 1], denormalize=normalize) for i in range(len(outputs))]
+
+    def encode(images):
+        return [encode_result(image) for image in images]
+
+    images = decode()
+    tensors = preprocess(images)
+    outputs = infer(tensors)
+    results = postprocess(outputs)
+
+    stages = {}
+    if batch_size == 1:
+        stages["apply_style"] = measure(lambda: apply_style(content, style, model_name), warmup, repeats)
+    stages["decode"] = measure(decode, warmup, repeats)
+    stages["preprocess"] = measure(lambda: preprocess(images), warmup, repeats)
+    stages["run_inference"] = measure(lambda: infer(tensors), warmup, repeats)
+    stages["postprocess"] = measure(lambda: postprocess(outputs), warmup, repeats)
+    stages["encode"] = measure(lambda: encode(results), warmup, repeats)
+    stages["pipeline"] = measure(lambda: encode(postprocess(infer(preprocess(decode())))), warmup, repeats)
+    return {stage: summarize(timings, batch_size) for stage, timings in stages.items()}
+
+
+def case_key(row: dict) -> str:
+    return "|".join(
+        str(row[name]) for name in ("model", "size", "batch_size", "threads", "provider", "precision", "stage")
+    )
+
+
+def compare(
+    rows: List[dict],
+    baseline_rows: List[dict],
+    tolerance: float,
+    min_delta_ms: float
+) -> List[dict]:
+    """
+    Thêm baseline_p50_ms / change vào từng row có trong baseline.
+
+    Returns:
+        List[dict]: Các row bị regression (p50 tăng quá tolerance và quá min_delta_ms)
+    """
+    baseline = {case_key(row): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        base = baseline.get(case_key(row))
+        if base is None:
+            continue
+        row["baseline_p50_ms"] = base["p50_ms"]
+        row["change"] = round(row["p50_ms"] / base["p50_ms"] - 1, 4) if base["p50_ms"] else 0.0
+        row["regression"] = row["change"] > tolerance and row["p50_ms"] - base["p50_ms"] > min_delta_ms
+        if row["regression"]:
+            regressions.append(row)
+    return regressions
+
+
+def environment() -> dict:
+    """Thông tin môi trường để biết 2 report có so sánh được với nhau không."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows / macOS
+        cpus = os.cpu_count()
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": cpus,
+        "python": platform.python_version(),
+        "onnxruntime": ort.__version__,
+        "numpy": np.__version__,
+        "model_precision": config.MODEL_PRECISION,
+        "fused_io": config.FUSED_IO,
+        "shape_buckets": config.SHAPE_BUCKETS_ENABLED,
+        "graph_optimization_level": config.ORT_GRAPH_OPTIMIZATION_LEVEL,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark apply_style và từng bước của pipeline")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_NAMES), choices=MODEL_NAMES)
+    parser.add_argument("--sizes", nargs="+", default=["256x256", "512x512"], help="Kích thước content WxH")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--threads", nargs="+", type=int, default=[0], help="ORT intra-op threads, 0 = mặc định")
+    parser.add_argument(
+        "--providers", nargs="+", default=["CPUExecutionProvider"], choices=ort.get_available_providers()
+    )
+    parser.add_argument("--content", default=None, help=f"Ảnh content (mặc định ảnh đầu tiên của {DEFAULT_CONTENT_GLOB})")
+    parser.add_argument("--style", default=None, help="Ảnh style (mặc định ảnh đầu tiên trong STYLE_DIR)")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default="benchmark_report.json", help="File JSON report")
+    parser.add_argument("--baseline", default=None, help="Report cũ để so sánh")
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả lần này vào --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Regression nếu p50 chậm hơn baseline quá tỉ lệ này")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Bỏ qua chênh lệch p50 nhỏ hơn (ms)")
+    args = parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline cần --baseline")
+
+    sizes = [tuple(size) for size in parse_buckets(",".join(args.sizes))]
+    style_paths = sorted(
+        p for p in glob.glob(os.path.join(config.STYLE_DIR, "*"))
+        if p.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    content = _first_image([args.content] if args.content else sorted(glob.glob(DEFAULT_CONTENT_GLOB)), seed=0)
+    style = _first_image([args.style] if args.style else style_paths, seed=1)
+
+    rows = []
+    can_reset_rss = _reset_peak_rss()
+    for model_name in args.models:
+        for provider in args.providers:
+            for threads in args.threads:
+                config.ORT_INTRA_OP_THREADS = threads
+                pin_sessions(model_name, [provider])
+                for size in sizes:
+                    for batch_size in args.batch_sizes:
+                        _reset_peak_rss()
+                        stages = run_case(model_name, size, batch_size, content, style, args.warmup, args.repeats)
+                        case = {
+                            "model": model_name,
+                            "size": f"{size[0]}x{size[1]}",
+                            "batch_size": batch_size,
+                            "threads": threads,
+                            "provider": provider,
+                            "precision": config.MODEL_PRECISION,
+                        }
+                        rss = round(peak_rss_mb(), 1)
+                        for stage, summary in stages.items():
+                            rows.append({**case, "stage": stage, **summary, "peak_rss_mb": rss})
+                        pipeline = stages["pipeline"]
+                        print(
+                            f"⏱ {model_name} {case['size']} b{batch_size} t{threads} {provider}: "
+                            f"pipeline p50 {pipeline['p50_ms']:.1f}ms p99 {pipeline['p99_ms']:.1f}ms, "
+                            f"{pipeline['throughput_ips']:.2f} ảnh/s, peak RSS {rss}MB"
+                        )
+
+    regressions = []
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline_rows = json.load(f)["results"]
+        regressions = compare(rows, baseline_rows, args.tolerance, args.min_delta_ms)
+        for row in regressions:
+            print(
+                f"❌ Regression {case_key(row)}: p50 {row['baseline_p50_ms']}ms -> {row['p50_ms']}ms "
+                f"({row['change']:+.1%})"
+            )
+        if not regressions:
+            print(f"✅ Không có regression so với {args.baseline} (tolerance {args.tolerance:.0%})")
+
+    report = {
+        "environment": environment(),
+        "warmup": args.warmup,
+        "repeats": args.repeats,
+        "peak_rss_per_case": can_reset_rss,
+        "baseline": args.baseline,
+        "tolerance": args.tolerance,
+        "results": rows,
+    }
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report: {path}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
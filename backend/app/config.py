@@ -1,2 +1,120 @@
-STYLE_DIR = "styles"
-MODEL_DIR = "backend/models"
\ No newline at end of file
+import os
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))  # backend/app/
+BASE_DIR = os.path.dirname(APP_DIR)  # backend/
+
+# Logging: LOG_FORMAT "text" hoặc "json" (1 dòng JSON mỗi log, có field riêng cho model, thời gian...)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Thư mục style có sẵn (gallery), tham chiếu bằng style_id = tên file không đuôi
+STYLE_DIR = os.getenv("STYLE_DIR", os.path.join(APP_DIR, "styles"))
+MODEL_DIR = "backend/models"
+
+# Bộ nhớ tối đa (byte) cho cache style features
+STYLE_CACHE_MAX_BYTES = int(os.getenv("STYLE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Cache .npy (mmap) cho ảnh đã resize + style features của gallery, "" = chỉ giữ trong memory
+STYLE_GALLERY_CACHE_DIR = os.getenv("STYLE_GALLERY_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "styles"))
+# Tính sẵn style features của gallery lúc khởi động server
+STYLE_GALLERY_WARMUP = _env_bool("STYLE_GALLERY_WARMUP", True)
+
+# Khởi động: load song song và chạy thử các model, /readyz chỉ trả 200 khi xong
+WARMUP_ENABLED = _env_bool("WARMUP_ENABLED", True)
+WARMUP_MODELS = [m.strip() for m in os.getenv("WARMUP_MODELS", "adain,sanet").split(",") if m.strip()]
+# Kích thước content (width x height) chạy thử, phân cách bằng dấu phẩy
+WARMUP_SHAPES = os.getenv("WARMUP_SHAPES", "512x512")
+
+# Precision tier của model: fp32, fp16, int8_dynamic, int8_static (tạo bởi python -m app.models.quantize)
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+
+# ONNX Runtime SessionOptions, 0 = để ORT tự chọn số thread
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", 0))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", 0))
+# Số process chạy model trên cùng máy (vd. uvicorn --workers): khi ORT_INTRA_OP_THREADS=0, mỗi process
+# dùng (số CPU được phép chạy) / ORT_WORKERS_PER_HOST intra-op thread thay vì mọi process đều dùng hết CPU
+ORT_WORKERS_PER_HOST = int(os.getenv("ORT_WORKERS_PER_HOST", os.getenv("WEB_CONCURRENCY", 1)))
+# Ghim intra-op thread vào CPU, cú pháp session.intra_op_thread_affinities của ORT (vd. "1;2;3"), "" = không ghim
+ORT_THREAD_AFFINITIES = os.getenv("ORT_THREAD_AFFINITIES", "")
+# Thread chờ việc có spin không (tắt khi nhiều process chung CPU để không đốt CPU lúc rảnh)
+ORT_ALLOW_SPINNING = _env_bool("ORT_ALLOW_SPINNING", True)
+# "sequential" hoặc "parallel"
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential")
+# "disable", "basic", "extended" hoặc "all"
+ORT_GRAPH_OPTIMIZATION_LEVEL = os.getenv("ORT_GRAPH_OPTIMIZATION_LEVEL", "all")
+ORT_ENABLE_CPU_MEM_ARENA = _env_bool("ORT_ENABLE_CPU_MEM_ARENA", True)
+ORT_ENABLE_MEM_PATTERN = _env_bool("ORT_ENABLE_MEM_PATTERN", True)
+# Lưu graph đã tối ưu để lần khởi động sau bỏ qua bước optimize, "" = tắt
+ORT_OPTIMIZED_MODEL_DIR = os.getenv("ORT_OPTIMIZED_MODEL_DIR", os.path.join(BASE_DIR, ".cache", "ort"))
+
+# Dùng model fused (uint8 NHWC vào/ra, tạo bởi python -m app.models.fuse_io) nếu có file
+FUSED_IO = _env_bool("FUSED_IO", True)
+
+# Cache kết quả (JPEG) theo hash content/style + model + alpha: tầng memory + tầng disk
+RESULT_CACHE_ENABLED = _env_bool("RESULT_CACHE_ENABLED", True)
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# "" hoặc RESULT_CACHE_DISK_MAX_BYTES=0 để tắt tầng disk
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "results"))
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+
+# Số alpha tối đa cho 1 request /api/style/sweep
+ALPHA_SWEEP_MAX = int(os.getenv("ALPHA_SWEEP_MAX", 8))
+
+# Micro-batching: gom request đồng thời cùng (model, shape) thành 1 lần session.run
+BATCHING_ENABLED = _env_bool("BATCHING_ENABLED", True)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 10))
+
+# Worker pool cho inference: "thread" (ORT nhả GIL) hoặc "process"
+INFERENCE_POOL_KIND = os.getenv("INFERENCE_POOL_KIND", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+# Số job được phép chờ thêm; vượt quá -> HTTP 503
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 16))
+# Timeout cho mỗi job (giây), 0 = không giới hạn
+INFERENCE_TIMEOUT_S = float(os.getenv("INFERENCE_TIMEOUT_S", 30)) or None
+
+# WebSocket video: số frame tối đa xử lý mỗi giây cho mỗi connection (FPS mục tiêu)
+WS_MAX_FPS = float(os.getenv("WS_MAX_FPS", 2))
+# Governor: tự giảm độ phân giải / FPS để giữ latency mục tiêu
+WS_ADAPTIVE = _env_bool("WS_ADAPTIVE", True)
+WS_TARGET_LATENCY_MS = float(os.getenv("WS_TARGET_LATENCY_MS", 500))
+WS_MIN_FPS = float(os.getenv("WS_MIN_FPS", 0.5))
+# Các mức cạnh dài tối đa của frame khi inference, từ cao xuống thấp
+WS_RESOLUTIONS = [int(x) for x in os.getenv("WS_RESOLUTIONS", "512,384,320,256,192").split(",")]
+# Chất lượng JPEG cho frame trả về qua WebSocket
+WS_JPEG_QUALITY = int(os.getenv("WS_JPEG_QUALITY", 85))
+
+# Shape bucketing: đưa content về kích thước chuẩn (width x height) để ORT dùng lại memory plan
+# và các request khác kích thước batch được với nhau. "pad" = reflect-pad rồi crop, "resize" = co giãn
+SHAPE_BUCKETS_ENABLED = _env_bool("SHAPE_BUCKETS_ENABLED", False)
+SHAPE_BUCKET_MODE = os.getenv("SHAPE_BUCKET_MODE", "pad")
+SHAPE_BUCKETS = os.getenv(
+    "SHAPE_BUCKETS",
+    "256x256,384x384,512x384,384x512,512x512,768x512,512x768,768x768,1024x768,768x1024,1024x1024"
+)
+
+# Batch job (/api/jobs): stylize hàng loạt ảnh trong nền, archive upload + kết quả nằm trong JOB_DIR/<job_id>
+JOB_DIR = os.getenv("JOB_DIR", os.path.join(BASE_DIR, ".cache", "jobs"))
+# Thư mục gốc cho đường dẫn trong manifest (path ngoài thư mục này bị từ chối), "" = không nhận manifest
+JOB_INPUT_DIR = os.getenv("JOB_INPUT_DIR", "")
+# Số job chạy cùng lúc (ngoài inference_pool, không chiếm hàng đợi của request REST / WebSocket)
+JOB_MAX_CONCURRENT = int(os.getenv("JOB_MAX_CONCURRENT", 1))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 4))
+# Ảnh có cạnh dài hơn được thu nhỏ (giữ tỉ lệ) trước khi stylize, 0 = giữ nguyên (ảnh > TILE_MAX_SIDE chạy theo tile)
+JOB_MAX_SIDE = int(os.getenv("JOB_MAX_SIDE", 1024))
+# Số ảnh tối đa đang decode trước / chờ gom batch / chờ encode + ghi: giới hạn RAM của 1 job
+JOB_PREFETCH = int(os.getenv("JOB_PREFETCH", 16))
+# Thread decode / encode chạy song song với inference
+JOB_IO_WORKERS = int(os.getenv("JOB_IO_WORKERS", 2))
+# Số job đã xong giữ lại trong GET /api/jobs, job cũ hơn bị xoá cả JOB_DIR/<job_id>
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", 100))
+
+# Tiling cho ảnh lớn: ảnh có cạnh dài > TILE_MAX_SIDE được stylize theo tile TILE_SIZE x TILE_SIZE
+TILE_MAX_SIDE = int(os.getenv("TILE_MAX_SIDE", 1024))
+TILE_SIZE = int(os.getenv("TILE_SIZE", 512))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", 32))
+# Số tile mỗi lần session.run
+TILE_BATCH_SIZE = int(os.getenv("TILE_BATCH_SIZE", 2))
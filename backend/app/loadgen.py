@@ -0,0 +1,570 @@
+"""
+Load generator cho /api/style/image và /ws/video: bao nhiêu request / stream video đồng thời
+mà 1 node chịu được.
+
+- REST: closed loop (--concurrency client gửi liên tục) hoặc open loop (--rate request/giây,
+  khoảng cách Poisson, latency tính từ thời điểm request lẽ ra được gửi nên không bị che khi server chậm).
+  Ảnh content lấy theo tỉ lệ --sizes (vd. 320x240:3,1024x768:1) và model theo --models (vd. adain:3,sanet:1).
+- WebSocket: --streams kết nối, mỗi kết nối gửi frame --frame-size theo nhịp webcam --fps như frontend.
+
+Báo throughput, latency p50/p95/p99, tỉ lệ status, tỉ lệ frame bị drop và FPS thực tế mỗi stream.
+Server giữ frame mới nhất và bỏ frame cũ nên kết quả không gắn được với frame đã gửi: latency video
+lấy từ histogram ws_frame_seconds của server (/metrics) trước và sau khi chạy.
+
+Mặc định chạy app trong cùng process (không qua mạng), --url để bắn vào server đang chạy
+(WebSocket qua mạng cần package websockets).
+
+Chạy từ thư mục backend/:
+    python -m app.loadgen --concurrency 8 --duration 30
+    python -m app.loadgen --rate 5 --sizes 320x240:3,1024x768:1 --models adain:3,sanet:1
+    python -m app.loadgen --url http://localhost:8000 --streams 4 --fps 15 --concurrency 0
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import cv2
+import httpx
+import numpy as np
+
+from app import config
+from app.services.shape_buckets import parse_buckets
+
+try:
+    import websockets
+except ImportError:  # chỉ cần khi bắn WebSocket vào server qua mạng
+    websockets = None
+
+DEFAULT_CONTENT_GLOB = os.path.join(os.path.dirname(config.BASE_DIR), "results", "*", "*content*.jpg")
+_BUCKET_LINE = re.compile(r'^(\w+)_bucket\{(.*)\} (\S+)$')
+
+
+def parse_weighted(spec: str) -> List[Tuple[str, float]]:
+    """"adain:3,sanet:1" -> [("adain", 3.0), ("sanet", 1.0)], không ghi trọng số thì là 1."""
+    items = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, weight = item.partition(":")
+        items.append((name, float(weight) if weight else 1.0))
+    if not items:
+        raise ValueError(f"Danh sách rỗng: {spec!r}")
+    return items
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(max(values)), 2),
+    }
+
+
+def histogram_buckets(metrics_text: str, name: str) -> Dict[float, float]:
+    """Bucket cộng dồn {le: count} của 1 histogram trong text /metrics, cộng qua mọi label khác."""
+    buckets: Dict[float, float] = {}
+    for line in metrics_text.splitlines():
+        match = _BUCKET_LINE.match(line)
+        if match is None or match.group(1) != name:
+            continue
+        le = re.search(r'le="([^"]+)"', match.group(2)).group(1)
+        bound = float("inf") if le == "+Inf" else float(le)
+        buckets[bound] = buckets.get(bound, 0.0) + float(match.group(3))
+    return buckets
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """Như histogram_quantile của Prometheus: nội suy tuyến tính trong bucket chứa quantile."""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] <= 0:
+        return None
+    rank = q * buckets[bounds[-1]]
+    lower, lower_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            if count == lower_count:
+                return bound
+            return lower + (bound - lower) * (rank - lower_count) / (count - lower_count)
+        lower, lower_count = bound, count
+    return lower
+
+
+def _content_image(path: Optional[str]) -> np.ndarray:
+    paths = [path] if path else sorted(glob.glob(DEFAULT_CONTENT_GLOB))
+    for p in paths:
+        image = cv2.imread(p, cv2.IMREAD_COLOR)
+        if image is not None:
+            return image
+    return np.random.default_rng(0).integers(0, 256, (768, 1024, 3), dtype=np.uint8)
+
+
+def make_variants(image: np.ndarray, size: Tuple[int, int], count: int, quality: int, seed: int) -> List[bytes]:
+    """
+    `count` JPEG khác nhau (đổi vài pixel) cùng kích thước: request lặp lại ảnh sau `count` lần,
+    nên result cache chỉ hit khi số biến thể nhỏ hơn số request.
+    """
+    rng = np.random.default_rng(seed)
+    base = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    variants = []
+    for _ in range(count):
+        variant = base.copy()
+        variant[:4, :4] = rng.integers(0, 256, (4, 4, 3), dtype=np.uint8)
+        ok, buffer = cv2.imencode(".jpg", variant, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        variants.append(buffer.tobytes())
+    return variants
+
+
+class _ASGIWebSocket:
+    """WebSocket client nói chuyện thẳng với ASGI app (không qua mạng), cùng interface với _NetWebSocket."""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path, _, self.query = path.partition("?")
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "root_path": "",
+            "query_string": self.query.encode(),
+            "headers": [(b"host", b"loadgen")],
+            "client": ("127.0.0.1", 0),
+            "server": ("loadgen", 80),
+            "subprotocols": [],
+        }
+        await self._to_app.put({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self.app(scope, self._to_app.get, self._from_app.put))
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"WebSocket bị từ chối: {message}")
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self._to_app.put({"type": "websocket.receive", "bytes": data})
+
+    async def recv(self) -> Optional[Union[bytes, str]]:
+        """Message tiếp theo từ server, None nếu server đóng kết nối."""
+        message = await self._from_app.get()
+        if message["type"] == "websocket.close":
+            return None
+        return message.get("bytes") if message.get("bytes") is not None else message.get("text")
+
+    async def close(self) -> None:
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=10)
+            except Exception:
+                self._task.cancel()
+
+
+class _NetWebSocket:
+    def __init__(self, url: str):
+        self.url = url
+        self._ws = None
+
+    async def connect(self) -> None:
+        if websockets is None:
+            raise RuntimeError("Cần cài websockets để bắn WebSocket qua mạng (pip install websockets)")
+        self._ws = await websockets.connect(self.url, max_size=None)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self._ws.send(data)
+
+    async def recv(self) -> Optional[Union[bytes, str]]:
+        try:
+            return await self._ws.recv()
+        except websockets.ConnectionClosed:
+            return None
+
+    async def close(self) -> None:
+        await self._ws.close()
+
+
+class LoadGenerator:
+    """
+    Chạy tải REST + WebSocket vào 1 app FastAPI trong process (`app`) hoặc 1 server (`url`).
+    """
+
+    def __init__(self, app=None, url: Optional[str] = None, timeout_s: float = 120.0):
+        if (app is None) == (url is None):
+            raise ValueError("Cần đúng 1 trong app hoặc url")
+        self.app = app
+        self.url = url.rstrip("/") if url else None
+        if app is not None:
+            transport = httpx.ASGITransport(app=app)
+            self.client = httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=timeout_s)
+        else:
+            self.client = httpx.AsyncClient(base_url=self.url, timeout=timeout_s)
+        self._lifespan: Optional[Tuple[asyncio.Task, asyncio.Queue, asyncio.Queue]] = None
+
+    async def start(self, ready_timeout_s: float = 300.0) -> None:
+        """Chạy startup của app (trong process) và chờ /readyz trả 200."""
+        if self.app is not None:
+            receive: asyncio.Queue = asyncio.Queue()
+            send: asyncio.Queue = asyncio.Queue()
+            task = asyncio.create_task(self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive.get, send.put))
+            await receive.put({"type": "lifespan.startup"})
+            message = await send.get()
+            if message["type"] != "lifespan.startup.complete":
+                raise RuntimeError(f"Startup lỗi: {message}")
+            self._lifespan = (task, receive, send)
+
+        deadline = time.monotonic() + ready_timeout_s
+        while True:
+            try:
+                response = await self.client.get("/readyz")
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError("Server chưa ready")
+            await asyncio.sleep(0.5)
+
+    async def stop(self) -> None:
+        await self.client.aclose()
+        if self._lifespan is not None:
+            task, receive, send = self._lifespan
+            await receive.put({"type": "lifespan.shutdown"})
+            await send.get()
+            await task
+
+    async def metrics_text(self) -> str:
+        try:
+            response = await self.client.get("/metrics")
+            return response.text if response.status_code == 200 else ""
+        except httpx.TransportError:
+            return ""
+
+    async def default_style_id(self) -> Optional[str]:
+        response = await self.client.get("/api/styles")
+        styles = response.json() if response.status_code == 200 else []
+        return styles[0]["id"] if styles else None
+
+    async def _post_image(self, content: bytes, model_name: str, style: dict) -> int:
+        files = {"content_file": ("content.jpg", content, "image/jpeg")}
+        data = {"model": model_name}
+        if style.get("style_bytes") is not None:
+            files["style_image"] = ("style.jpg", style["style_bytes"], "image/jpeg")
+        else:
+            data["style_id"] = style["style_id"]
+        response = await self.client.post("/api/style/image", files=files, data=data)
+        return response.status_code
+
+    async def run_rest(
+        self,
+        images: Dict[str, List[bytes]],
+        size_weights: List[Tuple[str, float]],
+        model_weights: List[Tuple[str, float]],
+        style: dict,
+        duration_s: float,
+        concurrency: int = 0,
+        rate: float = 0.0,
+        max_outstanding: int = 256,
+        seed: int = 0
+    ) -> dict:
+        """
+        Closed loop nếu `concurrency` > 0, ngược lại open loop `rate` request/giây.
+
+        Returns:
+            dict: Số request, status, throughput (request 200 / giây) và latency, tổng và theo (model, size)
+        """
+        rng = random.Random(seed)
+        sizes, size_w = zip(*size_weights)
+        models, model_w = zip(*model_weights)
+        records: List[Tuple[str, str, int, float]] = []  # (model, size, status, latency ms)
+        counters = Counter()
+
+        async def one(scheduled: float) -> None:
+            size = rng.choices(sizes, size_w)[0]
+            model_name = rng.choices(models, model_w)[0]
+            content = images[size][counters[size] % len(images[size])]
+            counters[size] += 1
+            try:
+                status = await self._post_image(content, model_name, style)
+            except httpx.TimeoutException:
+                status = 0
+            except httpx.TransportError:
+                status = -1
+            records.append((model_name, size, status, (time.perf_counter() - scheduled) * 1000))
+
+        start = time.perf_counter()
+        end = start + duration_s
+        if concurrency > 0:
+            async def worker() -> None:
+                while time.perf_counter() < end:
+                    await one(time.perf_counter())
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        else:
+            pending = set()
+            skipped = 0
+            next_at = start
+            while next_at < end:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(pending) >= max_outstanding:
+                    skipped += 1  # phía client quá tải, không gửi thêm
+                else:
+                    task = asyncio.create_task(one(next_at))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                next_at += rng.expovariate(rate)
+            if pending:
+                await asyncio.gather(*pending)
+            counters["skipped"] = skipped
+        elapsed = time.perf_counter() - start
+
+        def summarize(rows) -> dict:
+            ok = [latency for _, _, status, latency in rows if status == 200]
+            return {
+                "requests": len(rows),
+                "ok": len(ok),
+                "status": dict(Counter(str(status) for _, _, status, _ in rows)),
+                "throughput_rps": round(len(ok) / elapsed, 3),
+                **percentiles(ok),
+            }
+
+        groups: Dict[str, list] = {}
+        for row in records:
+            groups.setdefault(f"{row[0]}|{row[1]}", []).append(row)
+        return {
+            "mode": "closed" if concurrency > 0 else "open",
+            "concurrency": concurrency,
+            "rate": rate,
+            "elapsed_s": round(elapsed, 3),
+            "client_skipped": counters["skipped"],
+            **summarize(records),
+            "by_case": {key: summarize(rows) for key, rows in sorted(groups.items())},
+        }
+
+    async def _connect_ws(self, path: str):
+        if self.app is not None:
+            ws = _ASGIWebSocket(self.app, path)
+        else:
+            parts = urlsplit(self.url)
+            scheme = "wss" if parts.scheme == "https" else "ws"
+            ws = _NetWebSocket(f"{scheme}://{parts.netloc}{path}")
+        await ws.connect()
+        return ws
+
+    async def _stream(self, frames: List[bytes], model_name: str, style: dict, fps: float, duration_s: float) -> dict:
+        files, data = {}, {"model": model_name}
+        if style.get("style_bytes") is not None:
+            files["style_image"] = ("style.jpg", style["style_bytes"], "image/jpeg")
+        else:
+            data["style_id"] = style["style_id"]
+        response = await self.client.post("/ws/set", files=files or None, data=data)
+        response.raise_for_status()
+        ws = await self._connect_ws(f"/ws/video?session_id={response.json()['session_id']}")
+
+        sent = 0
+        received_at: List[float] = []
+        settings: List[dict] = []
+
+        async def receiver() -> None:
+            while True:
+                message = await ws.recv()
+                if message is None:
+                    return
+                if isinstance(message, bytes):
+                    received_at.append(time.perf_counter())
+                else:
+                    settings.append(json.loads(message))
+
+        receive_task = asyncio.create_task(receiver())
+        start = time.perf_counter()
+        # Nhịp webcam: frame thứ i gửi ở start + i / fps, không chờ kết quả
+        while time.perf_counter() - start < duration_s:
+            await ws.send_bytes(frames[sent % len(frames)])
+            sent += 1
+            delay = start + sent / fps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elapsed = time.perf_counter() - start
+        # Chờ kết quả của frame cuối (nếu server còn đang xử lý)
+        await asyncio.sleep(min(2.0, 2 / fps))
+        await ws.close()
+        receive_task.cancel()
+        try:
+            await receive_task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+        intervals = list(np.diff(received_at) * 1000) if len(received_at) > 1 else []
+        return {
+            "sent": sent,
+            "received": len(received_at),
+            "fps": round(len(received_at) / elapsed, 3),
+            "intervals": intervals,
+            "last_settings": settings[-1] if settings else None,
+        }
+
+    async def run_ws(
+        self,
+        frames: List[bytes],
+        model_weights: List[Tuple[str, float]],
+        style: dict,
+        streams: int,
+        fps: float,
+        duration_s: float,
+        seed: int = 0
+    ) -> dict:
+        """
+        `streams` kết nối video đồng thời.
+
+        Returns:
+            dict: Frame gửi / nhận, tỉ lệ drop, FPS mỗi stream (trung bình, thấp nhất) và khoảng cách giữa 2 kết quả
+        """
+        rng = random.Random(seed)
+        models, model_w = zip(*model_weights)
+        results = await asyncio.gather(*(
+            self._stream(frames, rng.choices(models, model_w)[0], style, fps, duration_s) for _ in range(streams)
+        ), return_exceptions=True)
+        errors = [f"{type(r).__name__}: {r}" for r in results if isinstance(r, Exception)]
+        results = [r for r in results if not isinstance(r, Exception)]
+        sent = sum(r["sent"] for r in results)
+        received = sum(r["received"] for r in results)
+        stream_fps = [r["fps"] for r in results]
+        intervals = [i for r in results for i in r["intervals"]]
+        return {
+            "streams": streams,
+            "target_fps": fps,
+            "errors": errors,
+            "frames_sent": sent,
+            "frames_received": received,
+            "drop_rate": round(1 - received / sent, 4) if sent else None,
+            "fps_mean": round(float(np.mean(stream_fps)), 3) if stream_fps else None,
+            "fps_min": round(float(np.min(stream_fps)), 3) if stream_fps else None,
+            "total_fps": round(sum(stream_fps), 3),
+            "result_interval": percentiles(intervals),
+            "server_settings": [r["last_settings"] for r in results],
+        }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.url:
+        generator = LoadGenerator(url=args.url, timeout_s=args.timeout)
+    else:
+        from app.main import app
+        generator = LoadGenerator(app=app, timeout_s=args.timeout)
+
+    content = _content_image(args.content)
+    size_weights = parse_weighted(args.sizes)
+    model_weights = parse_weighted(args.models)
+    images = {}
+    for i, (size, _) in enumerate(size_weights):
+        width, height = parse_buckets(size)[0]
+        images[size] = make_variants(content, (width, height), args.variants, 90, seed=args.seed * 1000 + i)
+    width, height = parse_buckets(args.frame_size)[0]
+    frames = make_variants(content, (width, height), max(1, int(args.fps)), 80, seed=args.seed * 1000 + 999)
+
+    await generator.start()
+    try:
+        if args.style:
+            with open(args.style, "rb") as f:
+                style = {"style_bytes": f.read()}
+        else:
+            style_id = args.style_id or await generator.default_style_id()
+            if style_id is None:
+                raise SystemExit("Server không có style trong gallery, cần --style")
+            style = {"style_id": style_id}
+
+        before = await generator.metrics_text()
+        tasks = {}
+        if args.concurrency > 0 or args.rate > 0:
+            tasks["rest"] = generator.run_rest(
+                images, size_weights, model_weights, style, args.duration,
+                concurrency=args.concurrency, rate=args.rate, seed=args.seed
+            )
+        if args.streams > 0:
+            tasks["ws"] = generator.run_ws(
+                frames, model_weights, style, args.streams, args.fps, args.duration, seed=args.seed
+            )
+        report = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        after = await generator.metrics_text()
+    finally:
+        await generator.stop()
+
+    if "ws" in report:
+        # Latency frame phía server trong lúc chạy: hiệu 2 lần scrape histogram
+        start_buckets = histogram_buckets(before, "ws_frame_seconds")
+        delta = {le: count - start_buckets.get(le, 0.0) for le, count in histogram_buckets(after, "ws_frame_seconds").items()}
+        report["ws"]["server_latency"] = {
+            f"p{int(q * 100)}_ms": None if value is None else round(value * 1000, 1)
+            for q, value in ((q, histogram_quantile(q, delta)) for q in (0.5, 0.95, 0.99))
+        }
+    report["target"] = args.url or "in-process"
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/style/image và /ws/video")
+    parser.add_argument("--url", default=None, help="Server đang chạy (vd. http://localhost:8000), mặc định chạy app trong process")
+    parser.add_argument("--duration", type=float, default=30.0, help="Thời gian tạo tải (giây)")
+    parser.add_argument("--concurrency", type=int, default=4, help="REST closed loop: số client, 0 = tắt")
+    parser.add_argument("--rate", type=float, default=0.0, help="REST open loop: request/giây (dùng khi --concurrency 0)")
+    parser.add_argument("--sizes", default="512x512", help="Kích thước content kèm trọng số, vd. 320x240:3,1024x768:1")
+    parser.add_argument("--models", default="adain", help="Model kèm trọng số, vd. adain:3,sanet:1")
+    parser.add_argument("--variants", type=int, default=16, help="Số ảnh khác nhau mỗi kích thước (result cache)")
+    parser.add_argument("--content", default=None, help=f"Ảnh content gốc (mặc định ảnh đầu tiên của {DEFAULT_CONTENT_GLOB})")
+    parser.add_argument("--style", default=None, help="Ảnh style upload kèm request")
+    parser.add_argument("--style-id", default=None, help="Style trong gallery (mặc định style đầu tiên)")
+    parser.add_argument("--streams", type=int, default=0, help="Số stream WebSocket video đồng thời")
+    parser.add_argument("--fps", type=float, default=15.0, help="Nhịp gửi frame mỗi stream")
+    parser.add_argument("--frame-size", default="320x240", help="Kích thước frame video WxH")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout mỗi request (giây)")
+    parser.add_argument("--seed", type=int, default=0, help="Đổi seed để có ảnh mới (không trúng result cache của lần chạy trước)")
+    parser.add_argument("--output", default=None, help="Ghi report JSON ra file")
+    args = parser.parse_args()
+    if args.concurrency <= 0 and args.rate <= 0 and args.streams <= 0:
+        parser.error("Cần --concurrency, --rate hoặc --streams")
+
+    report = asyncio.run(run(args))
+
+    rest = report.get("rest")
+    if rest:
+        print(
+            f"🌐 REST ({rest['mode']}): {rest['requests']} request, {rest['ok']} OK, {rest['throughput_rps']} req/s, "
+            f"p50 {rest['p50_ms']}ms p95 {rest['p95_ms']}ms p99 {rest['p99_ms']}ms, status {rest['status']}"
+        )
+    ws = report.get("ws")
+    if ws:
+        print(
+            f"🎥 WebSocket: {ws['streams']} stream @ {ws['target_fps']} FPS -> {ws['fps_mean']} FPS/stream "
+            f"(min {ws['fps_min']}), drop {ws['drop_rate']}, latency server p50 {ws['server_latency']['p50_ms']}ms "
+            f"p99 {ws['server_latency']['p99_ms']}ms"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report: {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
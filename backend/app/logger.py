@@ -0,0 +1,59 @@
+import json
+import logging
+import sys
+import time
+
+from app import config
+
+# Thuộc tính có sẵn của LogRecord, phần còn lại (truyền qua extra=...) là field có cấu trúc
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_configured = False
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_")}
+
+class TextFormatter(logging.Formatter):
+    """`time level logger message key=value ...`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:7s} {record.name}: {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """1 dòng JSON mỗi log: ts, level, logger, msg và các field truyền qua extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging() -> None:
+    """Cấu hình logger "app" theo LOG_LEVEL / LOG_FORMAT (gọi 1 lần, các lần sau bỏ qua)."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+    logger = logging.getLogger("app")
+    logger.handlers[:] = [handler]
+    logger.setLevel(config.LOG_LEVEL.upper())
+    logger.propagate = False
+    _configured = True
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger con của "app", vd. get_logger(__name__) trong app.models.loader."""
+    setup_logging()
+    return logging.getLogger(name if name.startswith("app") else f"app.{name}")
@@ -1,14 +1,52 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from app.api import rest, websocket
+from app.api import rest, websocket, health, jobs
 from app import config
+from app.services.executor import inference_pool
+from app.services.batch_jobs import job_manager
+from app.services import lifecycle
+from app.services.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+from app.logger import setup_logging
+import asyncio
+import time
 import os
 from fastapi.middleware.cors import CORSMiddleware
 
+setup_logging()
 app = FastAPI(title="Style Transfer API")
 
 os.makedirs(config.STYLE_DIR, exist_ok=True)
 app.mount("/static/styles", StaticFiles(directory=config.STYLE_DIR), name="styles")
 
 app.include_router(rest.router)
-app.include_router(websocket.router)
\ No newline at end of file
+app.include_router(websocket.router)
+app.include_router(health.router)
+app.include_router(jobs.router)
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Dùng path template của route (/api/style/image) thay vì URL thật để label không bùng nổ
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, route=path, status=str(status))
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=path)
+
+@app.on_event("startup")
+async def start_warmup():
+    # Chạy nền: server nhận /healthz ngay, /readyz trả 503 tới khi load + warmup model xong
+    app.state.warmup_task = asyncio.create_task(lifecycle.startup())
+
+@app.on_event("shutdown")
+def shutdown_inference_pool():
+    task = getattr(app.state, "warmup_task", None)
+    if task is not None and not task.done():
+        task.cancel()
+    job_manager.shutdown()
+    inference_pool.shutdown()
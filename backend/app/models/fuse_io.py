@@ -0,0 +1,170 @@
+"""
+Gộp tiền/hậu xử lý ảnh vào graph ONNX: tạo biến thể "fused" của model đầy đủ và các stage
+nhận ảnh uint8 NHWC (RGB) và trả về ảnh uint8 NHWC thay vì tensor float32 NCHW.
+
+- input:  uint8 (N, H, W, 3) -> Cast -> Transpose NCHW -> Mul scale -> Add bias
+- output: Transpose NHWC -> Mul scale -> Add bias (+0.5 để làm tròn) -> Clip [0, 255] -> Cast uint8
+
+scale/bias giống services/preprocess.py (AdaIN: ImageNet normalize, SANet: chỉ /255),
+ORT chạy các phép này trong C++ (đa luồng) thay cho NumPy.
+
+Chạy từ thư mục backend/ (sau app.models.split nếu muốn có cả stage fused):
+    python -m app.models.fuse_io --models adain sanet
+"""
+import argparse
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from app.models.loader import MODEL_DIR, MODEL_NAMES, get_model_path
+from app.services.preprocess import IMAGENET_MEAN, IMAGENET_STD
+
+# stage (None = graph đầy đủ) -> input/output ảnh được chuyển sang uint8 NHWC
+FUSE_SPECS = {
+    None: {"inputs": ["content", "style"], "outputs": ["output"]},
+    "encoder": {"inputs": ["image"], "outputs": []},
+    "decoder": {"inputs": [], "outputs": ["output"]},
+}
+
+
+def io_scale_bias(model_name: str) -> Dict[str, np.ndarray]:
+    """
+    scale/bias theo kênh RGB cho input (uint8 -> tensor model) và output (tensor model -> [0, 255]).
+    """
+    if model_name == "adain":
+        return {
+            "in_scale": 1.0 / (255.0 * IMAGENET_STD),
+            "in_bias": -IMAGENET_MEAN / IMAGENET_STD,
+            "out_scale": 255.0 * IMAGENET_STD,
+            "out_bias": 255.0 * IMAGENET_MEAN + 0.5,
+        }
+    return {
+        "in_scale": np.full(3, 1.0 / 255.0),
+        "in_bias": np.zeros(3),
+        "out_scale": np.full(3, 255.0),
+        "out_bias": np.full(3, 0.5),
+    }
+
+
+def _const(graph: onnx.GraphProto, name: str, value: np.ndarray) -> str:
+    graph.initializer.append(numpy_helper.from_array(np.asarray(value, dtype=np.float32), name))
+    return name
+
+
+def _dims(value_info: onnx.ValueInfoProto) -> List:
+    return [d.dim_param or d.dim_value or None for d in value_info.type.tensor_type.shape.dim]
+
+
+def fuse_image_input(graph: onnx.GraphProto, name: str, scale: np.ndarray, bias: np.ndarray) -> None:
+    """
+    Thay input float32 NCHW `name` bằng input uint8 NHWC cùng tên.
+    """
+    index = next(i for i, v in enumerate(graph.input) if v.name == name)
+    old = graph.input[index]
+    n, _, h, w = _dims(old)
+    inner = f"{name}_nchw"
+
+    for node in graph.node:
+        for i, input_name in enumerate(node.input):
+            if input_name == name:
+                node.input[i] = inner
+
+    prefix = f"fused_in_{name}"
+    nodes = [
+        helper.make_node("Cast", [name], [f"{prefix}_float"], to=TensorProto.FLOAT),
+        helper.make_node("Transpose", [f"{prefix}_float"], [f"{prefix}_chw"], perm=[0, 3, 1, 2]),
+        helper.make_node("Mul", [f"{prefix}_chw", _const(graph, f"{prefix}_scale", scale.reshape(1, 3, 1, 1))],
+                         [f"{prefix}_scaled"]),
+        helper.make_node("Add", [f"{prefix}_scaled", _const(graph, f"{prefix}_bias", bias.reshape(1, 3, 1, 1))],
+                         [inner]),
+    ]
+    for i, node in enumerate(nodes):
+        graph.node.insert(i, node)
+
+    graph.input.remove(old)
+    graph.input.insert(index, helper.make_tensor_value_info(name, TensorProto.UINT8, [n, h, w, 3]))
+
+
+def fuse_image_output(graph: onnx.GraphProto, name: str, scale: np.ndarray, bias: np.ndarray) -> None:
+    """
+    Thay output float32 NCHW `name` bằng output uint8 NHWC cùng tên.
+    """
+    index = next(i for i, v in enumerate(graph.output) if v.name == name)
+    old = graph.output[index]
+    n = _dims(old)[0]
+    inner = f"{name}_nchw"
+
+    for node in graph.node:
+        for i, output_name in enumerate(node.output):
+            if output_name == name:
+                node.output[i] = inner
+        for i, input_name in enumerate(node.input):
+            if input_name == name:
+                node.input[i] = inner
+
+    prefix = f"fused_out_{name}"
+    graph.node.extend([
+        helper.make_node("Transpose", [inner], [f"{prefix}_hwc"], perm=[0, 2, 3, 1]),
+        helper.make_node("Mul", [f"{prefix}_hwc", _const(graph, f"{prefix}_scale", scale)], [f"{prefix}_scaled"]),
+        helper.make_node("Add", [f"{prefix}_scaled", _const(graph, f"{prefix}_bias", bias)], [f"{prefix}_shifted"]),
+        helper.make_node(
+            "Clip",
+            [f"{prefix}_shifted", _const(graph, f"{prefix}_min", np.array(0.0)),
+             _const(graph, f"{prefix}_max", np.array(255.0))],
+            [f"{prefix}_clipped"]
+        ),
+        helper.make_node("Cast", [f"{prefix}_clipped"], [name], to=TensorProto.UINT8),
+    ])
+
+    graph.output.remove(old)
+    graph.output.insert(index, helper.make_tensor_value_info(name, TensorProto.UINT8, [n, None, None, 3]))
+
+
+def fuse_model(model_name: str, stage: Optional[str] = None, model_dir: str = MODEL_DIR) -> str:
+    """
+    Tạo biến thể fused của model (hoặc stage) và lưu cạnh file gốc.
+
+    Returns:
+        str: Đường dẫn file .onnx fused
+    """
+    if model_name not in MODEL_NAMES:
+        raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+
+    model = onnx.load(get_model_path(model_name, stage, model_dir=model_dir))
+    params = io_scale_bias(model_name)
+    spec = FUSE_SPECS[stage]
+    for name in spec["inputs"]:
+        fuse_image_input(model.graph, name, params["in_scale"], params["in_bias"])
+    for name in spec["outputs"]:
+        fuse_image_output(model.graph, name, params["out_scale"], params["out_bias"])
+    onnx.checker.check_model(model)
+
+    fused_path = get_model_path(model_name, stage, model_dir=model_dir, fused=True)
+    onnx.save_model(
+        model,
+        fused_path,
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location=os.path.basename(fused_path) + ".data",
+    )
+    print(f"✅ {model_name} {stage or 'full'} (fused): {fused_path}")
+    return fused_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gộp normalize/layout uint8 NHWC vào model ONNX")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_NAMES), choices=MODEL_NAMES)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        for stage in FUSE_SPECS:
+            if os.path.exists(get_model_path(model_name, stage, model_dir=args.model_dir)):
+                fuse_model(model_name, stage, model_dir=args.model_dir)
+
+
+if __name__ == "__main__":
+    main()
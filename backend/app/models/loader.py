@@ -1,8 +1,24 @@
+import glob
+import hashlib
 import onnxruntime as ort
 import os
-from typing import Optional
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from app import config
+from app.logger import get_logger
+from app.services.metrics import MODEL_LOAD_SECONDS, MODEL_LOADS
+
+logger = get_logger(__name__)
 
 _sessions = {}
+# Lock theo cache key: nhiều thread của inference pool cold-load cùng model thì chỉ một thread tạo session
+_load_locks: Dict[str, threading.Lock] = {}
+_load_locks_guard = threading.Lock()
+# id(session) -> cache key, dùng làm label "graph" cho metric session.run
+_session_names = {}
 
 # Tự động xác định thư mục models dựa trên vị trí file này
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # backend/
@@ -10,26 +26,130 @@ MODEL_DIR = os.path.join(BASE_DIR, "models")
 ADAIN_MODEL_PATH = os.path.join(MODEL_DIR, "adain.onnx")
 SANET_MODEL_PATH = os.path.join(MODEL_DIR, "sanet.onnx")
 
-def load_model(model_name: str, providers: Optional[list] = None) -> ort.InferenceSession:
+MODEL_NAMES = ("adain", "sanet")
+# Stage tách từ graph đầy đủ bằng app/models/split.py
+STAGES = ("encoder", "decoder")
+# Precision tier, các biến thể khác fp32 tạo bởi app/models/quantize.py
+PRECISIONS = ("fp32", "fp16", "int8_dynamic", "int8_static")
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+def get_model_path(
+    model_name: str,
+    stage: Optional[str] = None,
+    model_dir: str = MODEL_DIR,
+    fused: bool = False,
+    precision: str = "fp32"
+) -> str:
+    """
+    Đường dẫn file ONNX của model (graph đầy đủ) hoặc của một stage.
+    fused=True: biến thể nhận/trả ảnh uint8 NHWC (tạo bởi app/models/fuse_io.py).
+    precision khác "fp32": biến thể quantize (tạo bởi app/models/quantize.py).
+    """
+    filename = model_name if stage is None else f"{model_name}_{stage}"
+    if fused:
+        filename += "_fused"
+    if precision != "fp32":
+        filename += f"_{precision}"
+    return os.path.join(model_dir, f"{filename}.onnx")
+
+def has_stages(model_name: str, fused: bool = False, precision: str = "fp32") -> bool:
+    """
+    Kiểm tra model đã được tách thành encoder/decoder chưa.
+    """
+    return all(
+        os.path.exists(get_model_path(model_name, stage, fused=fused, precision=precision))
+        for stage in STAGES
+    )
+
+def has_fused(model_name: str, stage: Optional[str] = None, precision: str = "fp32") -> bool:
+    """
+    Kiểm tra đã có biến thể fused (uint8 NHWC) của model / stage chưa.
+    """
+    return os.path.exists(get_model_path(model_name, stage, fused=True, precision=precision))
+
+def load_model(
+    model_name: str,
+    providers: Optional[list] = None,
+    stage: Optional[str] = None,
+    fused: bool = False,
+    precision: Optional[str] = None
+) -> ort.InferenceSession:
     """
     Load ONNX model vào memory và trả về InferenceSession.
+
+    Args:
+        model_name: "adain" hoặc "sanet"
+        providers: List providers cho ONNX Runtime
+        stage: None (graph đầy đủ), "encoder" hoặc "decoder"
+        fused: Dùng biến thể nhận ảnh uint8 NHWC và trả về ảnh uint8 NHWC
+            (normalize/transpose/clip nằm trong graph, xem app/models/fuse_io.py)
+        precision: "fp32", "fp16", "int8_dynamic" hoặc "int8_static", None = config.MODEL_PRECISION.
+            Nếu chưa có file cho precision này thì dùng bản fp32
     """
-    print(f"🟢 Loading model: {model_name}...")
-    
-    if model_name not in ["adain", "sanet"]:
+    if model_name not in MODEL_NAMES:
         raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+    if stage is not None and stage not in STAGES:
+        raise ValueError(f"stage phải là 'encoder' hoặc 'decoder', nhận được: {stage}")
+    if precision is None:
+        precision = config.MODEL_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision phải là một trong {PRECISIONS}, nhận được: {precision}")
     
-    if model_name in _sessions:
-        print(f"⚡ Model '{model_name}' đã được load sẵn, dùng cache.")
-        return _sessions[model_name]
+    cache_key = model_name if stage is None else f"{model_name}_{stage}"
+    if fused:
+        cache_key += "_fused"
+    if precision != "fp32":
+        cache_key += f"_{precision}"
+    session = _sessions.get(cache_key)
+    if session is not None:
+        return session
+
+    with _load_locks_guard:
+        lock = _load_locks.setdefault(cache_key, threading.Lock())
+    with lock:
+        session = _sessions.get(cache_key)
+        if session is None:
+            session = _load_session(cache_key, model_name, stage, fused, precision, providers)
+        return session
+
+def _load_session(
+    cache_key: str,
+    model_name: str,
+    stage: Optional[str],
+    fused: bool,
+    precision: str,
+    providers: Optional[list]
+) -> ort.InferenceSession:
+    """Tạo session cho cache_key và lưu vào _sessions. Gọi khi đang giữ lock của cache_key."""
+    logger.info(f"🟢 Loading model: {cache_key}...", extra={"graph": cache_key})
     
     # Chọn path model
-    model_path = ADAIN_MODEL_PATH if model_name == "adain" else SANET_MODEL_PATH
+    model_path = get_model_path(model_name, stage, fused=fused, precision=precision)
+    if precision != "fp32" and not os.path.exists(model_path):
+        logger.warning(
+            f"⚠ Model '{cache_key}' chưa có, dùng bản fp32. Chạy python -m app.models.quantize để tạo.",
+            extra={"graph": cache_key, "path": model_path}
+        )
+        model_path = get_model_path(model_name, stage, fused=fused)
 
     if not os.path.exists(model_path):
+        if fused:
+            hint = "python -m app.models.fuse_io"
+        else:
+            hint = "convert_to_onnx.py" if stage is None else "python -m app.models.split"
         raise FileNotFoundError(
-            f"Model {model_name} không tìm thấy tại {model_path}. "
-            f"Hãy chạy convert_to_onnx.py để tạo file ONNX."
+            f"Model {cache_key} không tìm thấy tại {model_path}. "
+            f"Hãy chạy {hint} để tạo file ONNX."
         )
     
     # Chọn providers nếu chưa có
@@ -53,19 +173,189 @@ def load_model(model_name: str, providers: Optional[list] = None) -> ort.Inferen
             providers.append('CPUExecutionProvider')
     
     # Load ONNX Runtime session
+    start = time.perf_counter()
     try:
-        session = ort.InferenceSession(model_path, providers=providers)
-        print(f"✅ Model '{model_name}' loaded thành công với providers: {providers}")
+        session, source = _create_session(model_path, providers)
     except Exception as e:
         if 'CPUExecutionProvider' not in providers:
-            print(f"⚠ GPU provider failed, fallback CPU: {e}")
-            session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+            logger.warning(f"⚠ GPU provider failed, fallback CPU: {e}", extra={"graph": cache_key})
+            providers = ['CPUExecutionProvider']
+            session, source = _create_session(model_path, providers)
         else:
             raise
+    seconds = time.perf_counter() - start
+    MODEL_LOADS.inc(graph=cache_key, source=source)
+    MODEL_LOAD_SECONDS.observe(seconds, graph=cache_key)
+    logger.info(
+        f"✅ Model '{cache_key}' loaded thành công",
+        extra={"graph": cache_key, "providers": providers, "source": source, "seconds": round(seconds, 3)}
+    )
     
-    _sessions[model_name] = session
+    _sessions[cache_key] = session
+    _session_names[id(session)] = cache_key
     return session
 
+def session_name(session: ort.InferenceSession) -> str:
+    """Cache key (vd. "adain_encoder_fused") của session tạo bởi load_model, "unknown" nếu không phải."""
+    return _session_names.get(id(session), "unknown")
+
+def intra_op_threads() -> int:
+    """
+    Số intra-op thread cho mỗi session, 0 = để ORT tự chọn.
+    Khi nhiều process chạy model trên cùng máy (ORT_WORKERS_PER_HOST, process pool), số CPU
+    được phép chạy (theo affinity / taskset) được chia đều để các process không tranh nhau.
+    """
+    if config.ORT_INTRA_OP_THREADS > 0:
+        return config.ORT_INTRA_OP_THREADS
+    processes = max(1, config.ORT_WORKERS_PER_HOST)
+    if config.INFERENCE_POOL_KIND == "process":
+        processes *= max(1, config.INFERENCE_WORKERS)
+    if processes == 1:
+        return 0
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows / macOS
+        cpus = os.cpu_count() or 1
+    return max(1, cpus // processes)
+
+def make_session_options(
+    optimized_model_path: Optional[str] = None,
+    graph_optimization_level: Optional[str] = None,
+    providers: Optional[List[str]] = None
+) -> ort.SessionOptions:
+    """
+    SessionOptions theo config (ORT_*).
+
+    Args:
+        optimized_model_path: Nếu có, ORT ghi graph đã tối ưu ra file này khi tạo session
+        graph_optimization_level: Ghi đè ORT_GRAPH_OPTIMIZATION_LEVEL
+        providers: Providers của session (DirectML không hỗ trợ mem pattern / parallel)
+    """
+    level = graph_optimization_level or config.ORT_GRAPH_OPTIMIZATION_LEVEL
+    if level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"ORT_GRAPH_OPTIMIZATION_LEVEL phải là một trong {list(GRAPH_OPTIMIZATION_LEVELS)}, nhận được: {level}")
+    if config.ORT_EXECUTION_MODE not in EXECUTION_MODES:
+        raise ValueError(f"ORT_EXECUTION_MODE phải là một trong {list(EXECUTION_MODES)}, nhận được: {config.ORT_EXECUTION_MODE}")
+    dml = 'DmlExecutionProvider' in (providers or [])
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads()
+    options.inter_op_num_threads = config.ORT_INTER_OP_THREADS
+    options.execution_mode = EXECUTION_MODES["sequential" if dml else config.ORT_EXECUTION_MODE]
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[level]
+    options.enable_cpu_mem_arena = config.ORT_ENABLE_CPU_MEM_ARENA
+    options.enable_mem_pattern = config.ORT_ENABLE_MEM_PATTERN and not dml
+    if not config.ORT_ALLOW_SPINNING:
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+    if config.ORT_THREAD_AFFINITIES:
+        options.add_session_config_entry("session.intra_op_thread_affinities", config.ORT_THREAD_AFFINITIES)
+    if optimized_model_path:
+        options.optimized_model_filepath = optimized_model_path
+        # Weight ghi ra file .data riêng cạnh graph tối ưu: nếu không, initializer chưa bị optimize vẫn trỏ tới
+        # file .data của model gốc theo đường dẫn tương đối và graph trong cache không load lại được
+        options.add_session_config_entry(
+            "session.optimized_model_external_initializers_file_name", f"{os.path.basename(optimized_model_path)}.data"
+        )
+        options.add_session_config_entry("session.optimized_model_external_initializers_min_size_in_bytes", "1024")
+    return options
+
+def _cache_levels() -> Tuple[str, str]:
+    """
+    (mức optimize lưu vào cache, mức optimize khi load graph từ cache). Mức "all" có rewrite riêng
+    phần cứng (vd. NchwcTransformer) nên graph chỉ được lưu tới "extended", phần còn lại chạy lúc load:
+    thư mục cache dùng chung giữa nhiều máy / nằm trong image không mang graph của CPU khác.
+    """
+    level = config.ORT_GRAPH_OPTIMIZATION_LEVEL
+    if level == "all":
+        return "extended", "all"
+    return level, "disable"
+
+def optimized_model_path(model_path: str, providers: List[str]) -> Optional[str]:
+    """
+    File graph đã tối ưu trong ORT_OPTIMIZED_MODEL_DIR cho model + providers + mức optimize lưu
+    (xem _cache_levels) + phiên bản ORT. None nếu tắt cache.
+    """
+    if not config.ORT_OPTIMIZED_MODEL_DIR or config.ORT_GRAPH_OPTIMIZATION_LEVEL == "disable":
+        return None
+    level, _ = _cache_levels()
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{ort.__version__}|{level}|{','.join(providers)}".encode())
+    for path in (model_path, f"{model_path}.data"):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(config.ORT_OPTIMIZED_MODEL_DIR, f"{name}.{level}.{digest.hexdigest()}.onnx")
+
+def _create_session(model_path: str, providers: List[str]) -> Tuple[ort.InferenceSession, str]:
+    """
+    Tạo session; nếu đã có graph tối ưu sẵn thì load graph đó (chỉ còn chạy phần optimize riêng phần cứng
+    của mức "all", khởi động nhanh hơn), nếu chưa thì tối ưu, lưu graph cho lần sau rồi tạo session.
+
+    Returns:
+        Tuple[ort.InferenceSession, str]: (session, "optimized_cache" hoặc "model")
+    """
+    cached_path = optimized_model_path(model_path, providers)
+    save_level, load_level = _cache_levels()
+    if cached_path and os.path.exists(cached_path):
+        try:
+            options = make_session_options(graph_optimization_level=load_level, providers=providers)
+            session = ort.InferenceSession(cached_path, sess_options=options, providers=providers)
+            logger.info("⚡ Dùng graph đã tối ưu", extra={"path": cached_path})
+            return session, "optimized_cache"
+        except Exception as e:
+            logger.warning(f"⚠ Graph tối ưu hỏng, tạo lại: {e}", extra={"path": cached_path})
+
+    if cached_path is not None:
+        try:
+            os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        except OSError as e:
+            logger.warning(f"⚠ Không tạo được thư mục graph tối ưu, bỏ qua cache: {e}")
+            cached_path = None
+    if cached_path is None:
+        options = make_session_options(providers=providers)
+        return ort.InferenceSession(model_path, sess_options=options, providers=providers), "model"
+
+    # Ghi ra file tạm rồi rename: nhiều worker khởi động cùng lúc không đọc phải file đang ghi dở.
+    # File weight (<tmp>.data) giữ nguyên tên vì graph tham chiếu tới nó; tên tạm riêng cho mỗi lần
+    # tạo (pid + uuid) để các process / thread không ghi đè file của nhau.
+    tmp_path = f"{cached_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    data_path = f"{tmp_path}.data"
+    try:
+        options = make_session_options(
+            optimized_model_path=tmp_path, graph_optimization_level=save_level, providers=providers
+        )
+        session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, cached_path)
+            _remove_stale_data_files(cached_path, keep=data_path)
+            data_path = None
+    finally:
+        for path in (tmp_path, data_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    if load_level != "disable":
+        # Session vừa tạo mới tối ưu tới save_level: tạo lại từ graph đã lưu với mức optimize đầy đủ
+        source = cached_path if os.path.exists(cached_path) else model_path
+        options = make_session_options(graph_optimization_level=load_level, providers=providers)
+        session = ort.InferenceSession(source, sess_options=options, providers=providers)
+    return session, "model"
+
+def _remove_stale_data_files(cached_path: str, keep: str):
+    """
+    Xóa file weight của các graph tối ưu cũ đã bị os.replace ghi đè. Bỏ qua file còn graph .tmp đi kèm
+    (process khác đang tạo dở, chưa rename).
+    """
+    for path in glob.glob(f"{glob.escape(cached_path)}.*.tmp.data"):
+        if path == keep or os.path.exists(path[:-len(".data")]):
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"⚠ Không xóa được weight graph cũ: {e}", extra={"path": path})
+
 def get_model_info(model_name: str) -> dict:
     session = load_model(model_name)
     info = {
@@ -79,4 +369,5 @@ def clear_cache():
     """Xóa cache models."""
     global _sessions
     _sessions.clear()
-    print("⚡ Cache models đã được xóa.")
+    _session_names.clear()
+    logger.info("⚡ Cache models đã được xóa.")
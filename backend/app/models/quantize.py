@@ -0,0 +1,448 @@
+"""
+Tạo các biến thể precision thấp của model (graph đầy đủ và các stage nếu đã tách) cho node CPU:
+
+- fp16:         weights + phép tính float16, input/output vẫn float32 (keep_io_types)
+- int8_dynamic: weights int8, activation được quantize lúc chạy (không cần calibration)
+- int8_static:  weights + activation int8 (QDQ, per-channel), calibrate trên ảnh content/style local
+
+File được lưu cạnh bản fp32 với hậu tố `_<precision>` (xem loader.get_model_path), server chọn
+tier bằng biến môi trường MODEL_PRECISION.
+
+Sau khi tạo, mỗi tier được benchmark so với fp32 trên cùng cặp ảnh: latency p50, speedup,
+SSIM/PSNR (và LPIPS nếu có cài lpips) của ảnh kết quả. Report được ghi ra JSON; tier nào có
+SSIM thấp hơn --min-ssim thì bị đánh dấu fail và lệnh trả về exit code 1 (dùng làm gate trong CI).
+
+Chạy từ thư mục backend/ (sau app.models.split nếu muốn có cả stage):
+    python -m app.models.quantize --models adain sanet
+    python -m app.models.quantize --benchmark-only --report quantize_report.json
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from app import config
+from app.models.loader import MODEL_DIR, MODEL_NAMES, PRECISIONS, STAGES, get_model_path, make_session_options
+from app.services.inference import adain_transform, encode_image, encode_style, run_inference, run_staged_inference
+from app.services.preprocess import postprocess_tensor, preprocess_image
+
+QUANTIZED_PRECISIONS = tuple(p for p in PRECISIONS if p != "fp32")
+
+# Ảnh calibration/benchmark mặc định: content mẫu trong results/ và style trong gallery
+DEFAULT_CONTENT_GLOB = os.path.join(os.path.dirname(config.BASE_DIR), "results", "*", "*content*.jpg")
+
+
+def load_images(paths: List[str], size: int) -> List[np.ndarray]:
+    """Đọc ảnh RGB uint8 và resize về (size, size)."""
+    images = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"⚠ Skip unreadable image: {path}")
+            continue
+        image = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+        images.append(np.ascontiguousarray(image[..., ::-1]))
+    return images
+
+
+def image_pairs(contents: List[np.ndarray], styles: List[np.ndarray], count: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Tối đa `count` cặp (content, style), lần lượt mỗi content với mọi style."""
+    return list(itertools.islice(itertools.product(contents, styles), count))
+
+
+def split_pairs(
+    pairs: List[Tuple[np.ndarray, np.ndarray]],
+    calib_count: int,
+    eval_count: int
+) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Chia cặp ảnh thành (calibration, benchmark) không trùng nhau.
+
+    Không đủ `calib_count + eval_count` cặp thì chia theo tỉ lệ calib_count : eval_count,
+    giữ ít nhất 1 cặp benchmark và 1 cặp calibration (nếu calib_count > 0).
+    """
+    wanted = calib_count + eval_count
+    if len(pairs) >= wanted:
+        return pairs[:calib_count], pairs[calib_count:wanted]
+    min_calib = 1 if calib_count > 0 else 0
+    if len(pairs) < min_calib + 1:
+        raise ValueError(f"Cần ít nhất {min_calib + 1} cặp (content, style), có {len(pairs)}")
+    n_eval = max(1, min(len(pairs) - min_calib, round(len(pairs) * eval_count / wanted)))
+    n_calib = len(pairs) - n_eval
+    return pairs[:n_calib], pairs[n_calib:]
+
+
+def _session(path: str) -> ort.InferenceSession:
+    providers = ["CPUExecutionProvider"]
+    return ort.InferenceSession(path, sess_options=make_session_options(providers=providers), providers=providers)
+
+
+def _tensor(image: np.ndarray, model_name: str) -> np.ndarray:
+    size = image.shape[1], image.shape[0]
+    return preprocess_image(image, target_size=size, normalize=(model_name == "adain"))
+
+
+def calibration_feeds(
+    model_name: str,
+    stage: Optional[str],
+    pairs: List[Tuple[np.ndarray, np.ndarray]],
+    model_dir: str = MODEL_DIR
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Input của graph cần quantize cho từng cặp ảnh. Với decoder, features được tính bằng
+    encoder fp32 (và AdaIN bằng NumPy) giống đường chạy trong services/inference.py.
+    """
+    if stage == "decoder":
+        encoder = _session(get_model_path(model_name, "encoder", model_dir=model_dir))
+    elif stage is None:
+        graph = onnx.load(get_model_path(model_name, model_dir=model_dir), load_external_data=False)
+        has_alpha = any(i.name == "alpha" for i in graph.graph.input)
+
+    for content, style in pairs:
+        content_tensor = _tensor(content, model_name)
+        style_tensor = _tensor(style, model_name)
+
+        if stage == "encoder":
+            yield {"image": content_tensor}
+            yield {"image": style_tensor}
+        elif stage == "decoder":
+            content_feats = encode_image(encoder, content_tensor)
+            style_features = encode_style(encoder, style_tensor, model_name)
+            if model_name == "adain":
+                yield {"features": adain_transform(content_feats[0], style_features["mean"], style_features["std"])}
+            else:
+                yield {
+                    "content4_1": content_feats[0],
+                    "style4_1": style_features["style4_1"],
+                    "content5_1": content_feats[1],
+                    "style5_1": style_features["style5_1"],
+                }
+        else:
+            feeds = {"content": content_tensor, "style": style_tensor}
+            if has_alpha:
+                feeds["alpha"] = np.array([1.0], dtype=np.float32)
+            yield feeds
+
+
+class FeedsReader(CalibrationDataReader):
+    """CalibrationDataReader đọc lần lượt các feed của calibration_feeds."""
+
+    def __init__(self, make_feeds: Callable[[], Iterator[Dict[str, np.ndarray]]]):
+        self._make_feeds = make_feeds
+        self._feeds = make_feeds()
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        return next(self._feeds, None)
+
+    def rewind(self) -> None:
+        self._feeds = self._make_feeds()
+
+
+def _drop_duplicate_nodes(graph: onnx.GraphProto) -> None:
+    """
+    convert_float_to_float16 có thể chèn nhiều Cast giống hệt nhau (cùng tên, cùng output)
+    cho 1 tensor dùng bởi nhiều node giữ fp32, graph như vậy không hợp lệ: giữ node đầu tiên.
+    """
+    seen = set()
+    nodes = []
+    for node in graph.node:
+        key = (node.name, tuple(node.output))
+        if node.name and key in seen:
+            continue
+        seen.add(key)
+        nodes.append(node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+
+def _save_external(model: onnx.ModelProto, path: str) -> None:
+    onnx.save_model(
+        model,
+        path,
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location=os.path.basename(path) + ".data",
+    )
+
+
+def quantize_variant(
+    model_name: str,
+    stage: Optional[str],
+    precision: str,
+    pairs: List[Tuple[np.ndarray, np.ndarray]],
+    model_dir: str = MODEL_DIR
+) -> str:
+    """
+    Tạo 1 biến thể precision của model (hoặc stage) từ bản fp32.
+
+    Returns:
+        str: Đường dẫn file .onnx đã tạo
+    """
+    if precision not in QUANTIZED_PRECISIONS:
+        raise ValueError(f"precision phải là một trong {QUANTIZED_PRECISIONS}, nhận được: {precision}")
+
+    source = get_model_path(model_name, stage, model_dir=model_dir)
+    target = get_model_path(model_name, stage, model_dir=model_dir, precision=precision)
+    # onnx ghi nối vào file external data đã có: xoá bản cũ để chạy lại không làm file phình ra
+    for path in (target, f"{target}.data"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    if precision == "fp16":
+        from onnxruntime.transformers.float16 import convert_float_to_float16
+
+        model = convert_float_to_float16(onnx.load(source), keep_io_types=True)
+        _drop_duplicate_nodes(model.graph)
+        _save_external(model, target)
+    elif precision == "int8_dynamic":
+        quantize_dynamic(source, target, weight_type=QuantType.QInt8, use_external_data_format=True)
+    else:
+        reader = FeedsReader(lambda: calibration_feeds(model_name, stage, pairs, model_dir))
+        quantize_static(
+            source,
+            target,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            use_external_data_format=True,
+        )
+
+    print(f"✅ {model_name} {stage or 'full'} ({precision}): {target}")
+    return target
+
+
+def ssim(a: np.ndarray, b: np.ndarray) -> float:
+    """SSIM (Gaussian 11x11, sigma 1.5) trung bình trên các kênh của 2 ảnh uint8."""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    x = a.astype(np.float64)
+    y = b.astype(np.float64)
+
+    def blur(image):
+        return cv2.GaussianBlur(image, (11, 11), 1.5)
+
+    mu_x, mu_y = blur(x), blur(y)
+    sigma_x = blur(x * x) - mu_x ** 2
+    sigma_y = blur(y * y) - mu_y ** 2
+    sigma_xy = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / (
+        (mu_x ** 2 + mu_y ** 2 + c1) * (sigma_x + sigma_y + c2)
+    )
+    return float(ssim_map.mean())
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def _lpips_metric() -> Optional[Callable[[np.ndarray, np.ndarray], float]]:
+    """LPIPS (AlexNet) nếu có cài lpips + torch, ngược lại None."""
+    try:
+        import lpips
+        import torch
+    except ImportError:
+        return None
+
+    net = lpips.LPIPS(net="alex", verbose=False)
+
+    def distance(a: np.ndarray, b: np.ndarray) -> float:
+        def to_tensor(image):
+            return torch.from_numpy(image).permute(2, 0, 1)[None].float() / 127.5 - 1.0
+
+        with torch.no_grad():
+            return float(net(to_tensor(a), to_tensor(b)).item())
+
+    return distance
+
+
+def _file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, f"{path}.data") if os.path.exists(p))
+
+
+def _make_runner(
+    model_name: str,
+    path_kind: str,
+    precision: str,
+    model_dir: str
+) -> Optional[Tuple[Callable[[np.ndarray, np.ndarray], np.ndarray], int]]:
+    """
+    Hàm (content, style) -> ảnh uint8 cho 1 tier và tổng dung lượng file, None nếu thiếu file.
+    path_kind "staged": style features tính trước (giống cache của server), chỉ đo encode content + decode.
+    """
+    stages = (None,) if path_kind == "full" else STAGES
+    paths = [get_model_path(model_name, stage, model_dir=model_dir, precision=precision) for stage in stages]
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    size = sum(_file_size(p) for p in paths)
+    normalize = (model_name == "adain")
+
+    if path_kind == "full":
+        session = _session(paths[0])
+
+        def run(content_tensor, style_tensor):
+            return run_inference(session, content_tensor, style_tensor, 1.0, model_name)
+    else:
+        encoder, decoder = _session(paths[0]), _session(paths[1])
+        features = {}
+
+        def run(content_tensor, style_tensor):
+            key = id(style_tensor)
+            if key not in features:
+                features[key] = encode_style(encoder, style_tensor, model_name)
+            return run_staged_inference(encoder, decoder, content_tensor, features[key], 1.0, model_name)
+
+    def runner(content_tensor, style_tensor):
+        return postprocess_tensor(run(content_tensor, style_tensor), denormalize=normalize)
+
+    return runner, size
+
+
+def benchmark(
+    model_name: str,
+    precisions: List[str],
+    pairs: List[Tuple[np.ndarray, np.ndarray]],
+    model_dir: str = MODEL_DIR,
+    repeats: int = 3,
+    min_ssim: float = 0.9
+) -> List[dict]:
+    """
+    So sánh từng tier với fp32 trên cùng cặp ảnh, cho graph đầy đủ và đường chạy staged.
+
+    Returns:
+        List[dict]: Mỗi phần tử 1 (path, precision): latency p50 (ms), speedup so với fp32,
+        SSIM mean/min, PSNR mean, LPIPS mean (nếu có), dung lượng file và kết quả gate
+    """
+    lpips_distance = _lpips_metric()
+    tensors = [(_tensor(c, model_name), _tensor(s, model_name)) for c, s in pairs]
+    rows = []
+
+    for path_kind in ("full", "staged"):
+        reference = None
+        for precision in ["fp32"] + [p for p in precisions if p != "fp32"]:
+            made = _make_runner(model_name, path_kind, precision, model_dir)
+            if made is None:
+                continue
+            runner, size = made
+
+            outputs = [runner(c, s) for c, s in tensors]  # cũng là warmup
+            timings = []
+            for _ in range(repeats):
+                for c, s in tensors:
+                    start = time.perf_counter()
+                    runner(c, s)
+                    timings.append((time.perf_counter() - start) * 1000)
+            latency = float(np.median(timings))
+
+            if precision == "fp32":
+                reference = {"outputs": outputs, "latency": latency}
+            if reference is None:
+                print(f"⚠ {model_name} {path_kind}: thiếu bản fp32, bỏ qua {precision}")
+                continue
+
+            ssims = [ssim(ref, out) for ref, out in zip(reference["outputs"], outputs)]
+            row = {
+                "model": model_name,
+                "path": path_kind,
+                "precision": precision,
+                "latency_p50_ms": round(latency, 2),
+                "speedup": round(reference["latency"] / latency, 3),
+                "ssim_mean": round(float(np.mean(ssims)), 4),
+                "ssim_min": round(float(np.min(ssims)), 4),
+                "psnr_mean": round(float(np.mean(
+                    [psnr(ref, out) for ref, out in zip(reference["outputs"], outputs)]
+                )), 2),
+                "size_mb": round(size / 1024 / 1024, 2),
+            }
+            if lpips_distance is not None:
+                row["lpips_mean"] = round(float(np.mean(
+                    [lpips_distance(ref, out) for ref, out in zip(reference["outputs"], outputs)]
+                )), 4)
+            row["passed"] = row["ssim_min"] >= min_ssim
+            rows.append(row)
+            print(
+                f"📊 {model_name:5s} {path_kind:6s} {precision:12s} "
+                f"p50 {row['latency_p50_ms']:8.2f} ms  x{row['speedup']:.2f}  "
+                f"SSIM {row['ssim_mean']:.4f} (min {row['ssim_min']:.4f})  "
+                f"PSNR {row['psnr_mean']:.2f}  {row['size_mb']:.1f} MB  "
+                f"{'✅' if row['passed'] else '❌'}"
+            )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo và benchmark model fp16 / int8")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_NAMES), choices=MODEL_NAMES)
+    parser.add_argument("--precisions", nargs="+", default=list(QUANTIZED_PRECISIONS), choices=QUANTIZED_PRECISIONS)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--contents", nargs="+", default=None, help=f"Ảnh content (mặc định {DEFAULT_CONTENT_GLOB})")
+    parser.add_argument("--style-dir", default=config.STYLE_DIR)
+    parser.add_argument("--size", type=int, default=256, help="Cạnh ảnh calibration/benchmark")
+    parser.add_argument("--calib-count", type=int, default=16, help="Số cặp (content, style) để calibrate")
+    parser.add_argument("--eval-count", type=int, default=8, help="Số cặp (content, style) để benchmark")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-ssim", type=float, default=0.9, help="Gate: SSIM tối thiểu so với fp32")
+    parser.add_argument("--report", default=None, help="File JSON report (mặc định <model-dir>/quantize_report.json)")
+    parser.add_argument("--benchmark-only", action="store_true", help="Chỉ benchmark các file đã có")
+    args = parser.parse_args()
+
+    content_paths = args.contents or sorted(glob.glob(DEFAULT_CONTENT_GLOB))
+    style_paths = sorted(
+        p for p in glob.glob(os.path.join(args.style_dir, "*"))
+        if p.lower().endswith((".jpg", ".jpeg", ".png"))
+    )
+    contents = load_images(content_paths, args.size)
+    styles = load_images(style_paths, args.size)
+    if not contents or not styles:
+        parser.error("Cần ít nhất 1 ảnh content và 1 ảnh style")
+    # Cặp benchmark tách riêng khỏi cặp calibration, SSIM không bị đo trên chính dữ liệu đã calibrate
+    calib_count = 0 if args.benchmark_only else args.calib_count
+    pairs = image_pairs(contents, styles, calib_count + args.eval_count)
+    try:
+        calib_pairs, eval_pairs = split_pairs(pairs, calib_count, args.eval_count)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"🖼 {len(contents)} content x {len(styles)} style, "
+          f"{len(calib_pairs)} cặp calibrate + {len(eval_pairs)} cặp benchmark, {args.size}px")
+
+    rows = []
+    for model_name in args.models:
+        if not args.benchmark_only:
+            for stage in (None,) + STAGES:
+                if not os.path.exists(get_model_path(model_name, stage, model_dir=args.model_dir)):
+                    continue
+                for precision in args.precisions:
+                    quantize_variant(model_name, stage, precision, calib_pairs, args.model_dir)
+        rows += benchmark(
+            model_name, args.precisions, eval_pairs, args.model_dir, args.repeats, args.min_ssim
+        )
+
+    report_path = args.report or os.path.join(args.model_dir, "quantize_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"size": args.size, "pairs": len(eval_pairs),
+                   "min_ssim": args.min_ssim, "results": rows}, f, indent=2)
+    print(f"📝 Report: {report_path}")
+
+    if not all(row["passed"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
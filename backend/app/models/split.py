@@ -0,0 +1,223 @@
+"""
+Tách graph ONNX đầy đủ (adain.onnx, sanet.onnx) thành 2 stage:
+
+- encoder: ảnh -> VGG features (dùng chung cho content và style)
+- decoder: features -> ảnh (SANet: transform + decoder, AdaIN: chỉ decoder,
+  phép AdaIN được tính bằng NumPy trong services/inference.py)
+
+Nhờ vậy style features có thể được cache và chỉ phải encode content mỗi request.
+
+Chạy từ thư mục backend/:
+    python -m app.models.split --models adain sanet
+"""
+import argparse
+import os
+from typing import Dict, List, Optional, Tuple
+
+import onnx
+from onnx import TensorProto, helper
+
+from app.models.loader import MODEL_DIR, MODEL_NAMES, get_model_path
+
+# Tên tensor trung gian trong graph export hiện tại.
+# (tensor gốc -> tên mới trong stage graph)
+# Rewrites: tensor shape/scalar phụ thuộc vào input ảnh gốc -> (feature, start, end, squeeze),
+# được tính lại từ feature map để stage graph không cần ảnh gốc.
+SPLIT_SPECS = {
+    "adain": {
+        "encoder": {
+            "inputs": {"content": "image"},
+            "outputs": {"relu_8": "features"},
+            "rewrites": {},
+        },
+        "decoder": {
+            "inputs": {"features": "features"},
+            "outputs": {"output": "output"},
+            "rewrites": {},
+        },
+    },
+    "sanet": {
+        "encoder": {
+            "inputs": {"style": "image"},
+            "outputs": {"relu_8": "relu4_1", "relu_12": "relu5_1"},
+            "rewrites": {},
+        },
+        "decoder": {
+            "inputs": {
+                "relu_21": "content4_1",
+                "relu_8": "style4_1",
+                "relu_25": "content5_1",
+                "relu_12": "style5_1",
+            },
+            "outputs": {"output": "output"},
+            "rewrites": {
+                "val_0": ("relu_21", 0, 1, False),
+                "add_795": ("relu_21", 2, 3, True),
+                "add_797": ("relu_21", 3, 4, True),
+                "add_855": ("relu_8", 2, 3, True),
+                "add_857": ("relu_8", 3, 4, True),
+                "add_977": ("relu_25", 2, 3, True),
+                "add_978": ("relu_25", 3, 4, True),
+                "add_1035": ("relu_12", 2, 3, True),
+                "add_1036": ("relu_12", 3, 4, True),
+            },
+        },
+    },
+}
+
+
+def _shape_nodes(rewrites: Dict[str, Tuple[str, int, int, bool]]) -> List[onnx.NodeProto]:
+    """Tạo node Shape(/Squeeze) thay thế cho các tensor phụ thuộc kích thước ảnh gốc."""
+    nodes = []
+    for target, (source, start, end, squeeze) in rewrites.items():
+        shape_out = f"{target}_shape" if squeeze else target
+        nodes.append(helper.make_node(
+            "Shape", [source], [shape_out], name=f"split_shape_{target}", start=start, end=end
+        ))
+        if squeeze:
+            nodes.append(helper.make_node("Squeeze", [shape_out], [target], name=f"split_squeeze_{target}"))
+    return nodes
+
+
+def _rename(names, mapping: Dict[str, str]) -> List[str]:
+    return [mapping.get(name, name) for name in names]
+
+
+def extract_stage(
+    model: onnx.ModelProto,
+    inputs: Dict[str, str],
+    outputs: Dict[str, str],
+    rewrites: Optional[Dict[str, Tuple[str, int, int, bool]]] = None,
+    graph_name: str = "stage"
+) -> onnx.ModelProto:
+    """
+    Cắt subgraph từ `inputs` tới `outputs` và đổi tên các tensor biên.
+
+    Args:
+        model: Model ONNX đầy đủ
+        inputs: {tên tensor gốc: tên input mới}
+        outputs: {tên tensor gốc: tên output mới}
+        rewrites: Tensor cần tính lại từ shape của feature map (xem SPLIT_SPECS)
+        graph_name: Tên graph mới
+
+    Returns:
+        onnx.ModelProto: Model của stage
+    """
+    graph = model.graph
+    rewrites = rewrites or {}
+
+    # Node thay thế đứng đầu vì chỉ phụ thuộc vào input của stage
+    nodes = _shape_nodes(rewrites) + [
+        node for node in graph.node if not set(node.output) & set(rewrites)
+    ]
+    producers = {out: idx for idx, node in enumerate(nodes) for out in node.output}
+
+    keep = set()
+    stack = list(outputs)
+    seen = set()
+    while stack:
+        name = stack.pop()
+        if name in seen or name in inputs or not name:
+            continue
+        seen.add(name)
+        idx = producers.get(name)
+        if idx is None or idx in keep:
+            continue
+        keep.add(idx)
+        stack.extend(nodes[idx].input)
+
+    kept_nodes = [nodes[idx] for idx in sorted(keep)]
+
+    initializers = {init.name: init for init in graph.initializer}
+    produced = {out for node in kept_nodes for out in node.output}
+    used = {name for node in kept_nodes for name in node.input if name}
+    missing = used - produced - set(initializers) - set(inputs)
+    if missing:
+        raise ValueError(f"Stage '{graph_name}' vẫn phụ thuộc vào tensor ngoài input: {sorted(missing)}")
+
+    mapping = {**inputs, **outputs}
+    new_nodes = []
+    for node in kept_nodes:
+        new_node = onnx.NodeProto()
+        new_node.CopyFrom(node)
+        del new_node.input[:]
+        del new_node.output[:]
+        new_node.input.extend(_rename(node.input, mapping))
+        new_node.output.extend(_rename(node.output, mapping))
+        new_nodes.append(new_node)
+
+    graph_inputs = {inp.name: inp for inp in graph.input}
+    new_inputs = []
+    for old, new in inputs.items():
+        if old in graph_inputs:
+            value_info = onnx.ValueInfoProto()
+            value_info.CopyFrom(graph_inputs[old])
+            value_info.name = new
+        else:
+            value_info = helper.make_tensor_value_info(
+                new, TensorProto.FLOAT, ["batch", None, f"{new}_height", f"{new}_width"]
+            )
+        new_inputs.append(value_info)
+
+    new_outputs = [
+        helper.make_tensor_value_info(new, TensorProto.FLOAT, ["batch", None, None, None])
+        for new in outputs.values()
+    ]
+    new_initializers = [initializers[name] for name in sorted(used & set(initializers))]
+
+    new_graph = helper.make_graph(new_nodes, graph_name, new_inputs, new_outputs, new_initializers)
+    stage_model = helper.make_model(
+        new_graph,
+        opset_imports=list(model.opset_import),
+        producer_name="style-transfer-split",
+    )
+    stage_model.ir_version = model.ir_version
+    return stage_model
+
+
+def split_model(model_name: str, model_dir: str = MODEL_DIR) -> Dict[str, str]:
+    """
+    Tách model đầy đủ thành encoder/decoder và lưu cạnh file gốc.
+
+    Returns:
+        Dict[str, str]: {stage: đường dẫn file .onnx}
+    """
+    if model_name not in MODEL_NAMES:
+        raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+
+    model_path = get_model_path(model_name, model_dir=model_dir)
+    model = onnx.load(model_path)
+
+    paths = {}
+    for stage, spec in SPLIT_SPECS[model_name].items():
+        stage_model = extract_stage(
+            model, spec["inputs"], spec["outputs"], spec["rewrites"],
+            graph_name=f"{model_name}_{stage}"
+        )
+        onnx.checker.check_model(stage_model)
+
+        stage_path = get_model_path(model_name, stage, model_dir=model_dir)
+        onnx.save_model(
+            stage_model,
+            stage_path,
+            save_as_external_data=True,
+            all_tensors_to_one_file=True,
+            location=os.path.basename(stage_path) + ".data",
+        )
+        paths[stage] = stage_path
+        print(f"✅ {model_name} {stage}: {stage_path}")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tách model ONNX thành encoder/decoder stage")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_NAMES), choices=MODEL_NAMES)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        split_model(model_name, model_dir=args.model_dir)
+
+
+if __name__ == "__main__":
+    main()
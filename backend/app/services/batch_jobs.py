@@ -0,0 +1,373 @@
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.services.metrics import JOB_IMAGES
+from app.services.style_gallery import style_gallery
+from app.services.style_transfer import stylize_stream
+from app.utils import decode_image_bytes, encode_result
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+OUTPUT_KINDS = ("zip", "dir")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+MAX_ERRORS_KEPT = 20
+
+def _is_image(name: str) -> bool:
+    base = os.path.basename(name)
+    return base.lower().endswith(IMAGE_EXTENSIONS) and not base.startswith(".") and "__MACOSX" not in name
+
+def count_archive(path: str) -> int:
+    """Số ảnh trong archive zip / tar (chỉ đọc danh sách entry)."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return sum(1 for info in archive.infolist() if not info.is_dir() and _is_image(info.filename))
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            return sum(1 for member in archive if member.isfile() and _is_image(member.name))
+    raise ValueError("archive phải là file zip hoặc tar")
+
+def iter_archive(path: str) -> Iterator[Tuple[str, bytes]]:
+    """(tên entry, bytes) của từng ảnh trong archive, đọc dần từng entry."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile() and _is_image(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError("archive phải là file zip hoặc tar")
+
+def resolve_manifest(text: str, root: str) -> List[Tuple[str, str]]:
+    """
+    Manifest (JSON list hoặc mỗi dòng 1 path, bỏ dòng trống / bắt đầu bằng #) -> [(tên, path tuyệt đối)].
+    Path tương đối tính từ `root`, path nằm ngoài `root` bị từ chối.
+    """
+    if not root:
+        raise ValueError("Server chưa cấu hình JOB_INPUT_DIR, chỉ nhận archive")
+    stripped = text.strip()
+    if stripped.startswith("["):
+        entries = [str(entry) for entry in json.loads(stripped)]
+    else:
+        entries = [line.strip() for line in stripped.splitlines()]
+    entries = [entry for entry in entries if entry and not entry.startswith("#")]
+    if not entries:
+        raise ValueError("Manifest rỗng")
+
+    root = os.path.realpath(root)
+    resolved = []
+    for entry in entries:
+        path = os.path.realpath(os.path.join(root, entry))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"Path nằm ngoài JOB_INPUT_DIR: {entry}")
+        resolved.append((os.path.relpath(path, root), path))
+    return resolved
+
+def read_image_file(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        return decode_image_bytes(f.read(), os.path.basename(path))
+
+class OutputWriter:
+    """Ghi kết quả JPEG vào thư mục hoặc 1 file zip (ZIP_STORED, JPEG đã nén sẵn), tên theo ảnh gốc."""
+
+    def __init__(self, kind: str, job_dir: str):
+        if kind not in OUTPUT_KINDS:
+            raise ValueError(f"output phải là một trong {OUTPUT_KINDS}, nhận được: {kind}")
+        self.kind = kind
+        self._names: set = set()
+        if kind == "zip":
+            self.path = os.path.join(job_dir, "result.zip")
+            self._zip = zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED)
+        else:
+            self.path = os.path.join(job_dir, "output")
+            os.makedirs(self.path, exist_ok=True)
+            self._zip = None
+
+    def _output_name(self, name: str) -> str:
+        # Bỏ phần path tuyệt đối / ".." để không ghi ra ngoài thư mục kết quả, trùng tên thì thêm _n
+        parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+        stem = os.path.splitext("/".join(parts) or "image")[0]
+        candidate, n = f"{stem}.jpg", 1
+        while candidate in self._names:
+            candidate = f"{stem}_{n}.jpg"
+            n += 1
+        self._names.add(candidate)
+        return candidate
+
+    def write(self, name: str, data: bytes) -> None:
+        output_name = self._output_name(name)
+        if self._zip is not None:
+            self._zip.writestr(output_name, data)
+            return
+        path = os.path.join(self.path, output_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+
+class BatchJob:
+    """Trạng thái 1 job: tiến độ, lỗi từng ảnh, nơi ghi kết quả."""
+
+    def __init__(
+        self,
+        model_name: str,
+        alpha: float = 1.0,
+        output: str = "zip",
+        batch_size: int = config.JOB_BATCH_SIZE,
+        max_side: int = config.JOB_MAX_SIDE,
+        style_id: Optional[str] = None
+    ):
+        if model_name not in ["adain", "sanet"]:
+            raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+        if output not in OUTPUT_KINDS:
+            raise ValueError(f"output phải là một trong {OUTPUT_KINDS}, nhận được: {output}")
+        self.id = uuid.uuid4().hex
+        self.dir = os.path.join(config.JOB_DIR, self.id)
+        self.model_name = model_name
+        self.alpha = alpha
+        self.output = output
+        self.batch_size = max(1, batch_size)
+        self.max_side = max(0, max_side)
+        self.style_id = style_id
+        self.state = "queued"
+        self.total: Optional[int] = None
+        self.processed = 0
+        self.failed = 0
+        self.errors: Deque[dict] = deque(maxlen=MAX_ERRORS_KEPT)
+        self.error: Optional[str] = None
+        self.output_path: Optional[str] = None
+        self.input_path: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        done = self.processed + self.failed
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - done if self.total is not None else None
+        return {
+            "id": self.id,
+            "state": self.state,
+            "model": self.model_name,
+            "alpha": self.alpha,
+            "style_id": self.style_id,
+            "output": self.output,
+            "total": self.total,
+            "processed": self.processed,
+            "failed": self.failed,
+            "progress": round(done / self.total, 4) if self.total else None,
+            "images_per_s": round(rate, 3),
+            "eta_s": round(remaining / rate, 1) if remaining is not None and rate > 0 and not self.finished else None,
+            "errors": list(self.errors),
+            "error": self.error,
+            "output_path": self.output_path,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """
+    Chạy batch job trong nền: tối đa `max_concurrent` job cùng lúc, mỗi job 1 thread chạy inference
+    (stylize_stream) và `io_workers` thread dùng chung để decode / encode song song.
+
+    Job không đi qua inference_pool nên không chiếm hàng đợi của request REST / WebSocket
+    (chỉ chia CPU với chúng).
+    """
+
+    def __init__(self, max_concurrent: int = 1, io_workers: int = 2, history: int = 100):
+        self.max_concurrent = max(1, max_concurrent)
+        self.io_workers = max(1, io_workers)
+        self.history = history
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self._runner: Optional[ThreadPoolExecutor] = None
+        self._io: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executors(self) -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+        with self._lock:
+            if self._runner is None:
+                self._runner = ThreadPoolExecutor(self.max_concurrent, thread_name_prefix="batch-job")
+                self._io = ThreadPoolExecutor(self.io_workers, thread_name_prefix="batch-io")
+            return self._runner, self._io
+
+    def create(self, model_name: str, **kwargs: Any) -> BatchJob:
+        job = BatchJob(model_name, **kwargs)
+        os.makedirs(job.dir, exist_ok=True)
+        return job
+
+    def submit(
+        self,
+        job: BatchJob,
+        items: Iterator[Tuple[str, Any]],
+        load: Callable[[Any], np.ndarray],
+        style_np: Optional[np.ndarray] = None
+    ) -> BatchJob:
+        """
+        Xếp job vào hàng chạy.
+
+        Args:
+            items: (tên ảnh, payload) lấy dần, `load(payload)` trả về ảnh RGB uint8
+            style_np: Ảnh style upload, None nếu job dùng style_id của gallery
+        """
+        if style_np is None and job.style_id is None:
+            raise ValueError("Cần style_np hoặc style_id")
+        runner, _ = self._executors()
+        with self._lock:
+            self._jobs[job.id] = job
+        runner.submit(self._run, job, items, load, style_np)
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {state: sum(1 for job in jobs if job.state == state) for state in JOB_STATES}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            runner, io = self._runner, self._io
+            self._runner = self._io = None
+        for job in jobs:
+            job.cancel_event.set()
+        for executor in (runner, io):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _write(self, job: BatchJob, writer: OutputWriter, name: str, future: Future) -> None:
+        try:
+            writer.write(name, future.result())
+        except Exception as e:
+            self._record_error(job, name, e)
+            return
+        job.processed += 1
+        JOB_IMAGES.inc(model=job.model_name, status="ok")
+
+    def _record_error(self, job: BatchJob, name: str, error: Exception) -> None:
+        job.failed += 1
+        job.errors.append({"name": name, "error": f"{type(error).__name__}: {error}"})
+        JOB_IMAGES.inc(model=job.model_name, status="error")
+
+    def _run(
+        self,
+        job: BatchJob,
+        items: Iterator[Tuple[str, Any]],
+        load: Callable[[Any], np.ndarray],
+        style_np: Optional[np.ndarray]
+    ) -> None:
+        if job.cancel_event.is_set():
+            job.state = "cancelled"
+            job.finished_at = time.time()
+            self._cleanup(job)
+            return
+
+        _, io = self._executors()
+        job.state = "running"
+        job.started_at = time.time()
+        logger.info("📦 Batch job bắt đầu", extra={"job": job.id[:8], "model": job.model_name, "total": job.total})
+        writer = None
+        stream = None
+        pending: Deque[Tuple[str, Future]] = deque()
+        try:
+            # Style chuẩn bị 1 lần cho cả job
+            if job.style_id is not None:
+                style_np = style_gallery.get_image(job.style_id)
+                prepared_style = style_gallery.get_style(job.style_id, job.model_name)
+            else:
+                prepared_style = None
+            writer = OutputWriter(job.output, job.dir)
+            job.output_path = writer.path
+            stream = stylize_stream(
+                items, load, style_np, job.model_name, job.alpha,
+                prepared_style=prepared_style,
+                batch_size=job.batch_size,
+                max_side=job.max_side,
+                prefetch=config.JOB_PREFETCH,
+                executor=io
+            )
+            for name, result in stream:
+                if job.cancel_event.is_set():
+                    break
+                if isinstance(result, Exception):
+                    self._record_error(job, name, result)
+                    continue
+                pending.append((name, io.submit(encode_result, result)))
+                # Ghi theo thứ tự, không để quá JOB_PREFETCH ảnh chờ encode
+                while pending and (len(pending) > config.JOB_PREFETCH or pending[0][1].done()):
+                    self._write(job, writer, *pending.popleft())
+            while pending:
+                name, future = pending.popleft()
+                if job.cancel_event.is_set():
+                    future.cancel()
+                    continue
+                self._write(job, writer, name, future)
+            job.state = "cancelled" if job.cancel_event.is_set() else "done"
+        except Exception as e:
+            job.state = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            logger.error(f"❌ Batch job lỗi: {e}", extra={"job": job.id[:8]})
+        finally:
+            if stream is not None:
+                stream.close()
+            if writer is not None:
+                writer.close()
+            job.finished_at = time.time()
+            self._cleanup(job)
+        logger.info(
+            f"📦 Batch job {job.state}",
+            extra={"job": job.id[:8], "processed": job.processed, "failed": job.failed,
+                   "seconds": round(job.finished_at - job.started_at, 2)}
+        )
+
+    def _cleanup(self, job: BatchJob) -> None:
+        # Archive upload không cần nữa; job cũ bị bỏ khỏi danh sách thì xoá luôn JOB_DIR/<id> (không còn tải được)
+        if job.input_path and os.path.exists(job.input_path):
+            os.remove(job.input_path)
+        with self._lock:
+            finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+            evicted = [self._jobs.pop(job_id) for job_id in finished[:max(0, len(finished) - self.history)]]
+        for old in evicted:
+            shutil.rmtree(old.dir, ignore_errors=True)
+
+job_manager = JobManager(config.JOB_MAX_CONCURRENT, config.JOB_IO_WORKERS, config.JOB_HISTORY)
@@ -0,0 +1,119 @@
+import asyncio
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app import config
+from app.services.executor import InferencePool
+
+BatchFn = Callable[[Hashable, List[Any]], Sequence[Any]]
+
+class MicroBatcher:
+    """
+    Gom các request đồng thời theo bucket (vd: model + shape input) trong tối đa
+    `max_wait_ms` hoặc tới `max_batch_size`, chạy 1 lần `run_batch` rồi trả kết quả
+    về cho từng coroutine đang chờ.
+
+    `run_batch(key, items)` là hàm blocking (session.run), được chạy trong `pool`
+    (mặc định: default executor của event loop) để không chặn event loop, và phải
+    trả về list kết quả cùng thứ tự với `items`. Lỗi của batch (kể cả PoolOverloaded,
+    InferenceTimeout) được trả về cho tất cả coroutine trong batch.
+    """
+
+    def __init__(
+        self,
+        run_batch: BatchFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        pool: Optional[InferencePool] = None
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size phải >= 1, nhận được: {max_batch_size}")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.pool = pool
+
+        self.batches_run = 0
+        self.items_run = 0
+
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """
+        Đưa 1 item vào bucket `key` và chờ kết quả của nó.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        bucket = self._pending.setdefault(key, [])
+        bucket.append((item, future))
+
+        if len(bucket) >= self.max_batch_size or self.max_wait_ms <= 0:
+            self._flush(key)
+        elif len(bucket) == 1:
+            self._timers[key] = loop.call_later(self.max_wait_ms / 1000.0, self._flush, key)
+
+        return await future
+
+    def pending(self) -> int:
+        return sum(len(bucket) for bucket in self._pending.values())
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches_run,
+            "items": self.items_run,
+            "avg_batch_size": self.items_run / self.batches_run if self.batches_run else 0.0,
+            "pending": self.pending(),
+        }
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        bucket = self._pending.pop(key, None)
+        if not bucket:
+            return
+
+        task = asyncio.ensure_future(self._run(key, bucket))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, bucket: List[Tuple[Any, asyncio.Future]]) -> None:
+        # Bỏ item mà coroutine chờ đã bị cancel
+        bucket = [(item, future) for item, future in bucket if not future.done()]
+        if not bucket:
+            return
+
+        items = [item for item, _ in bucket]
+        try:
+            if self.pool is not None:
+                results = await self.pool.run(self.run_batch, key, items)
+            else:
+                loop = asyncio.get_running_loop()
+                results = await loop.run_in_executor(None, self.run_batch, key, items)
+        except Exception as e:
+            for _, future in bucket:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_run += len(items)
+
+        for (_, future), result in zip(bucket, results):
+            if not future.done():
+                future.set_result(result)
+
+def create_batcher(run_batch: BatchFn, pool: Optional[InferencePool] = None) -> MicroBatcher:
+    """
+    Tạo MicroBatcher theo cấu hình trong app/config.py.
+    """
+    max_batch_size = config.BATCH_MAX_SIZE if config.BATCHING_ENABLED else 1
+    return MicroBatcher(
+        run_batch,
+        max_batch_size=max_batch_size,
+        max_wait_ms=config.BATCH_MAX_WAIT_MS,
+        pool=pool
+    )
@@ -0,0 +1,144 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app import config
+from app.services.metrics import POOL_WAIT_SECONDS
+
+class PoolOverloaded(Exception):
+    """Hàng đợi của pool đã đầy, request nên bị từ chối (HTTP 503)."""
+
+class InferenceTimeout(Exception):
+    """Job không hoàn thành trong thời gian cho phép (HTTP 504)."""
+
+def _timed_call(submitted_at: float, fn: Callable[[], Any]) -> Any:
+    POOL_WAIT_SECONDS.observe(time.perf_counter() - submitted_at)
+    return fn()
+
+async def run_light(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Chạy bước nhẹ không dùng model (decode/encode ảnh, hash key, đọc/ghi result cache) ngoài event loop
+    bằng asyncio.to_thread: không chiếm slot của inference_pool nên không bị PoolOverloaded sau khi
+    request đã chạy xong inference, và cache hit vẫn trả được khi pool đầy.
+    """
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+class InferencePool:
+    """
+    Pool worker có giới hạn cho các job chạy model (preprocess + session.run, encode style).
+    Bước nhẹ không dùng model đi qua run_light.
+
+    - Thread pool mặc định: ONNX Runtime nhả GIL trong session.run nên thread là đủ.
+    - Process pool (kind="process"): mỗi process có session và style cache riêng,
+      `fn` và tham số phải picklable.
+
+    Tối đa `max_workers` job chạy cùng lúc và `max_queue` job chờ; vượt quá sẽ raise
+    PoolOverloaded ngay thay vì xếp hàng vô hạn.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_queue: int = 16,
+        timeout_s: Optional[float] = 30.0,
+        kind: str = "thread"
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"kind phải là 'thread' hoặc 'process', nhận được: {kind}")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.kind = kind
+
+        self.rejected = 0
+        self.timed_out = 0
+
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="inference"
+                )
+        return self._executor
+
+    @property
+    def in_flight(self) -> int:
+        """Số job đang chạy hoặc đang chờ trong pool."""
+        return self._in_flight
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolOverloaded(
+                    f"Inference pool đầy ({self._in_flight} job, "
+                    f"{self.max_workers} worker + {self.max_queue} queue)"
+                )
+            self._in_flight += 1
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Chạy `fn(*args, **kwargs)` trong pool và chờ kết quả.
+
+        Raises:
+            PoolOverloaded: Pool đã đủ max_workers + max_queue job
+            InferenceTimeout: Quá `timeout` (mặc định self.timeout_s)
+        """
+        self._acquire()
+        try:
+            job = functools.partial(fn, *args, **kwargs)
+            if self.kind == "thread":
+                # Đo thời gian chờ trong hàng đợi (process pool: clock khác process, không đo)
+                cf_future = self.executor.submit(_timed_call, time.perf_counter(), job)
+            else:
+                cf_future = self.executor.submit(job)
+        except Exception:
+            self._release()
+            raise
+        # Slot chỉ được trả khi job thật sự kết thúc (kể cả khi caller đã timeout)
+        cf_future.add_done_callback(self._release)
+
+        timeout = self.timeout_s if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cf_future), timeout)
+        except asyncio.TimeoutError as e:
+            cf_future.cancel()
+            self.timed_out += 1
+            raise InferenceTimeout(f"Job vượt quá {timeout}s") from e
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - self.max_workers),
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+inference_pool = InferencePool(
+    max_workers=config.INFERENCE_WORKERS,
+    max_queue=config.INFERENCE_QUEUE_SIZE,
+    timeout_s=config.INFERENCE_TIMEOUT_S,
+    kind=config.INFERENCE_POOL_KIND,
+)
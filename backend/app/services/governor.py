@@ -0,0 +1,127 @@
+from typing import Optional, Sequence, Tuple
+
+from app import config
+
+# SANet cộng relu4_1 với relu5_1 đã upsample x2 -> cạnh ảnh phải chia hết cho 16
+SIZE_MULTIPLE = 16
+
+def fit_size(height: int, width: int, max_side: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    Kích thước (width, height) sau khi thu nhỏ để cạnh dài <= max_side, làm tròn xuống
+    bội số của SIZE_MULTIPLE. Trả về None nếu không cần resize.
+    """
+    if max_side is None or max(height, width) <= max_side:
+        return None
+    scale = max_side / max(height, width)
+    new_w = max(SIZE_MULTIPLE, int(width * scale) // SIZE_MULTIPLE * SIZE_MULTIPLE)
+    new_h = max(SIZE_MULTIPLE, int(height * scale) // SIZE_MULTIPLE * SIZE_MULTIPLE)
+    return new_w, new_h
+
+class FrameGovernor:
+    """
+    Điều chỉnh độ phân giải inference và số frame nhận mỗi giây của 1 video session
+    để giữ FPS/latency mục tiêu.
+
+    - Đo EWMA thời gian inference (trong worker) và latency end-to-end (nhận frame -> gửi xong).
+    - Vượt latency mục tiêu hoặc inference lâu hơn ngân sách 1/target_fps -> giảm độ phân giải.
+    - Dư nhiều (< 50% cả hai ngưỡng) -> tăng lại độ phân giải.
+    - FPS nhận frame = min(target_fps, khả năng xử lý ở độ phân giải hiện tại).
+    """
+
+    def __init__(
+        self,
+        target_fps: float = config.WS_MAX_FPS,
+        target_latency_ms: float = config.WS_TARGET_LATENCY_MS,
+        resolutions: Sequence[int] = config.WS_RESOLUTIONS,
+        min_fps: float = config.WS_MIN_FPS,
+        adaptive: bool = config.WS_ADAPTIVE,
+        smoothing: float = 0.3,
+        cooldown_frames: int = 5
+    ):
+        self.target_fps = target_fps
+        self.target_latency_ms = target_latency_ms
+        self.resolutions = sorted(resolutions, reverse=True)
+        self.min_fps = min_fps
+        self.adaptive = adaptive
+        self.smoothing = smoothing
+        self.cooldown_frames = cooldown_frames
+
+        self.level = 0
+        self.fps = target_fps
+        self.inference_ms: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+
+        self._last_accept = float("-inf")
+        self._frames_since_change = 0
+
+    @property
+    def max_side(self) -> Optional[int]:
+        """Cạnh dài tối đa của frame khi inference (None = giữ nguyên)."""
+        if not self.adaptive or not self.resolutions:
+            return None
+        return self.resolutions[self.level]
+
+    def accept(self, now: float) -> bool:
+        """
+        Frame đến lúc `now` (time.monotonic) có được nhận không.
+        """
+        if self.fps > 0 and now - self._last_accept < 1.0 / self.fps:
+            return False
+        self._last_accept = now
+        return True
+
+    def record(self, inference_s: float, latency_s: float) -> bool:
+        """
+        Ghi nhận 1 frame đã xử lý xong.
+
+        Returns:
+            bool: True nếu thiết lập (fps / độ phân giải) thay đổi, cần báo cho client
+        """
+        self.inference_ms = self._ewma(self.inference_ms, inference_s * 1000.0)
+        self.latency_ms = self._ewma(self.latency_ms, latency_s * 1000.0)
+
+        if not self.adaptive:
+            return False
+
+        self._frames_since_change += 1
+        if self._frames_since_change < self.cooldown_frames:
+            return False
+
+        old_settings = (self.level, round(self.fps, 1))
+        budget_ms = 1000.0 / self.target_fps if self.target_fps > 0 else float("inf")
+
+        if self.latency_ms > self.target_latency_ms or self.inference_ms > budget_ms:
+            if self.level < len(self.resolutions) - 1:
+                self.level += 1
+        elif (self.latency_ms < 0.5 * self.target_latency_ms
+              and self.inference_ms < 0.5 * budget_ms and self.level > 0):
+            self.level -= 1
+
+        capacity_fps = 1000.0 / self.inference_ms if self.inference_ms > 0 else self.target_fps
+        self.fps = max(self.min_fps, min(self.target_fps, capacity_fps))
+
+        changed = (self.level, round(self.fps, 1)) != old_settings
+        if changed:
+            self._frames_since_change = 0
+            if self.level != old_settings[0]:
+                # Số đo cũ thuộc độ phân giải khác
+                self.inference_ms = None
+                self.latency_ms = None
+        return changed
+
+    def settings(self) -> dict:
+        """Control message gửi cho client."""
+        return {
+            "type": "settings",
+            "fps": round(self.fps, 2),
+            "max_side": self.max_side,
+            "inference_ms": round(self.inference_ms, 1) if self.inference_ms is not None else None,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "target_fps": self.target_fps,
+            "target_latency_ms": self.target_latency_ms,
+        }
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return (1 - self.smoothing) * current + self.smoothing * value
@@ -1,6 +1,23 @@
+import time
 import numpy as np
 import onnxruntime as ort
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from app.models.loader import session_name
+from app.services.metrics import ORT_RUN_SECONDS
+
+ADAIN_EPS = 1e-5
+
+def run_session(
+    session: ort.InferenceSession,
+    output_names: Optional[List[str]],
+    inputs: Dict[str, np.ndarray]
+) -> List[np.ndarray]:
+    """session.run kèm đo thời gian vào ort_session_run_seconds{graph}."""
+    start = time.perf_counter()
+    outputs = session.run(output_names, inputs)
+    ORT_RUN_SECONDS.observe(time.perf_counter() - start, graph=session_name(session))
+    return outputs
 
 def run_inference(
     session: ort.InferenceSession,
@@ -44,7 +61,7 @@ def run_inference(
         }
     
     try:
-        outputs = session.run(output_names, inputs)
+        outputs = run_session(session, output_names, inputs)
     except Exception as e:
         if 'DmlExecutionProvider' in str(session.get_providers()):
             raise RuntimeError(
@@ -70,25 +87,138 @@ def run_inference_batch(
     Args:
         session: ONNX Runtime InferenceSession
         content_tensors: Batch content tensors, shape (batch, 3, H, W)
-        style_tensors: Batch style tensors, shape (batch, 3, H, W)
+        style_tensors: Batch style tensors, shape (batch, 3, H, W) hoặc (1, 3, H, W) (dùng chung)
         alpha: Style strength
         model_name: "adain" hoặc "sanet"
     
     Returns:
         np.ndarray: Batch output tensors, shape (batch, 3, H, W)
     """
-    batch_size = content_tensors.shape[0]
-    outputs = []
-    
-    for i in range(batch_size):
-        output = run_inference(
-            session,
-            content_tensors[i:i+1],
-            style_tensors[i:i+1],
-            alpha,
-            model_name
-        )
-        outputs.append(output[0])
-    
-    return np.stack(outputs, axis=0)
+    # Graph export có batch dim động -> chạy 1 lần session.run cho cả batch
+    if style_tensors.shape[0] != content_tensors.shape[0]:
+        style_tensors = _repeat_batch(style_tensors, content_tensors.shape[0])
+
+    return run_inference(session, content_tensors, style_tensors, alpha, model_name)
+
+def encode_image(encoder: ort.InferenceSession, image_tensor: np.ndarray) -> List[np.ndarray]:
+    """
+    Chạy encoder stage (xem app/models/split.py).
+
+    Args:
+        encoder: Session của stage "encoder"
+        image_tensor: Image tensor, shape (batch, 3, H, W)
+
+    Returns:
+        List[np.ndarray]: AdaIN: [relu4_1], SANet: [relu4_1, relu5_1]
+    """
+    input_name = encoder.get_inputs()[0].name
+    return run_session(encoder, None, {input_name: image_tensor})
+
+def encode_style(
+    encoder: ort.InferenceSession,
+    style_tensor: np.ndarray,
+    model_name: str = "adain"
+) -> Dict[str, np.ndarray]:
+    """
+    Tính style features dùng lại được cho nhiều content.
+
+    Returns:
+        Dict[str, np.ndarray]: AdaIN: {"mean", "std"} shape (1, 512, 1, 1),
+        SANet: {"style4_1", "style5_1"}
+    """
+    features = encode_image(encoder, style_tensor)
+    if model_name == "adain":
+        mean, std = calc_mean_std(features[0])
+        return {"mean": mean, "std": std}
+    return {"style4_1": features[0], "style5_1": features[1]}
+
+def calc_mean_std(feat: np.ndarray, eps: float = ADAIN_EPS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean/std theo từng channel, giống torch.std (unbiased) + eps trong AdaINet.adain.
+    """
+    mean = feat.mean(axis=(2, 3), keepdims=True)
+    std = feat.std(axis=(2, 3), ddof=1, keepdims=True) + eps
+    return mean, std
+
+def adain_transform(
+    content_feat: np.ndarray,
+    style_mean: np.ndarray,
+    style_std: np.ndarray,
+    alpha: float = 1.0
+) -> np.ndarray:
+    """
+    AdaIN trên feature map: chuẩn hóa content theo thống kê của style rồi blend theo alpha.
+    """
+    content_mean, content_std = calc_mean_std(content_feat)
+    target = (content_feat - content_mean) / content_std * style_std + style_mean
+    if alpha != 1.0:
+        target = alpha * target + (1 - alpha) * content_feat
+    return target.astype(np.float32, copy=False)
+
+def run_staged_inference(
+    encoder: ort.InferenceSession,
+    decoder: ort.InferenceSession,
+    content_tensor: np.ndarray,
+    style_features: Dict[str, np.ndarray],
+    alpha: float = 1.0,
+    model_name: str = "adain"
+) -> np.ndarray:
+    """
+    Inference với style features đã tính sẵn: chỉ encode content rồi decode.
+
+    Args:
+        encoder: Session của stage "encoder"
+        decoder: Session của stage "decoder"
+        content_tensor: Content image tensor, shape (batch, 3, H, W)
+        style_features: Kết quả của encode_style
+        alpha: Style strength, chỉ dùng cho AdaIN
+        model_name: "adain" hoặc "sanet"
+
+    Returns:
+        np.ndarray: Output tensor, shape (batch, 3, H, W)
+    """
+    content_feats = encode_image(encoder, content_tensor)
+
+    if model_name == "adain":
+        target = adain_transform(content_feats[0], style_features["mean"], style_features["std"], alpha)
+        inputs = {"features": target}
+    else:
+        batch_size = content_tensor.shape[0]
+        inputs = {
+            "content4_1": content_feats[0],
+            "style4_1": _repeat_batch(style_features["style4_1"], batch_size),
+            "content5_1": content_feats[1],
+            "style5_1": _repeat_batch(style_features["style5_1"], batch_size),
+        }
+
+    return run_session(decoder, ["output"], inputs)[0]
+
+def run_alpha_sweep(
+    encoder: ort.InferenceSession,
+    decoder: ort.InferenceSession,
+    content_tensor: np.ndarray,
+    style_features: Dict[str, np.ndarray],
+    alphas: List[float]
+) -> np.ndarray:
+    """
+    AdaIN với nhiều alpha: encode content và tính AdaIN target 1 lần,
+    chỉ blend theo từng alpha rồi decode tất cả trong 1 batch.
+
+    Args:
+        content_tensor: Content image tensor, shape (1, 3, H, W)
+        style_features: {"mean", "std"} từ encode_style
+        alphas: Danh sách alpha
+
+    Returns:
+        np.ndarray: Output tensor, shape (len(alphas), 3, H, W), theo thứ tự alphas
+    """
+    content_feat = encode_image(encoder, content_tensor)[0]
+    target = adain_transform(content_feat, style_features["mean"], style_features["std"], 1.0)
+    delta = target - content_feat
+    features = np.concatenate([content_feat + alpha * delta for alpha in alphas], axis=0)
+    return run_session(decoder, ["output"], {"features": features.astype(np.float32, copy=False)})[0]
 
+def _repeat_batch(tensor: np.ndarray, batch_size: int) -> np.ndarray:
+    if tensor.shape[0] == batch_size:
+        return tensor
+    return np.repeat(tensor, batch_size, axis=0)
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.services.shape_buckets import parse_buckets
+from app.services.style_gallery import style_gallery
+from app.services.style_transfer import warmup_model
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+class Readiness:
+    """
+    Trạng thái khởi động của worker: /readyz chỉ trả 200 sau khi warmup xong,
+    để load balancer không gửi request tới worker còn lạnh.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.models: dict = {}
+        self.errors: dict = {}
+        self._lock = threading.Lock()
+
+    def mark_model(self, model_name: str, seconds: float) -> None:
+        with self._lock:
+            self.models[model_name] = round(seconds, 3)
+
+    def mark_error(self, name: str, error: Exception) -> None:
+        with self._lock:
+            self.errors[name] = f"{type(error).__name__}: {error}"
+
+    def set_ready(self) -> None:
+        with self._lock:
+            self.ready = True
+            self.ready_at = time.time()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "uptime_s": round(time.time() - self.started_at, 3),
+                "warmup_s": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+                "models": dict(self.models),
+                "errors": dict(self.errors),
+            }
+
+readiness = Readiness()
+
+def _warmup_style() -> Optional[np.ndarray]:
+    """Style đầu tiên của gallery (nếu có) làm style cho warmup."""
+    for style_id in style_gallery.ids():
+        try:
+            return style_gallery.get_image(style_id)
+        except Exception as e:
+            logger.warning(f"⚠ Warmup: cannot decode style '{style_id}': {e}")
+    return None
+
+def _warmup_one(model_name: str, shapes: List[Tuple[int, int]], style_img: Optional[np.ndarray]) -> None:
+    start = time.perf_counter()
+    try:
+        warmup_model(model_name, shapes, style_img)
+    except Exception as e:
+        logger.error(f"❌ Warmup '{model_name}' failed: {e}", extra={"model": model_name})
+        readiness.mark_error(model_name, e)
+        return
+    seconds = time.perf_counter() - start
+    readiness.mark_model(model_name, seconds)
+    logger.info(
+        f"🔥 Warmup '{model_name}' xong",
+        extra={"model": model_name, "seconds": round(seconds, 3), "shapes": [f"{w}x{h}" for w, h in shapes]}
+    )
+
+async def startup() -> None:
+    """
+    Load các model trong WARMUP_MODELS song song, chạy thử ở WARMUP_SHAPES, tính sẵn style gallery
+    rồi đánh dấu worker sẵn sàng. Model lỗi (vd. chưa có file ONNX) được ghi vào readiness.errors,
+    không chặn các model còn lại nhưng worker không ready (/readyz trả 503 kèm lỗi).
+    """
+    loop = asyncio.get_running_loop()
+    if config.WARMUP_ENABLED and config.WARMUP_MODELS:
+        shapes = parse_buckets(config.WARMUP_SHAPES)
+        style_img = await loop.run_in_executor(None, _warmup_style)
+        with ThreadPoolExecutor(max_workers=len(config.WARMUP_MODELS), thread_name_prefix="warmup") as pool:
+            await asyncio.gather(*[
+                loop.run_in_executor(pool, _warmup_one, model_name, shapes, style_img)
+                for model_name in config.WARMUP_MODELS
+            ])
+    if config.STYLE_GALLERY_WARMUP:
+        # Decode + encode style gallery 1 lần, request dùng style_id không cần upload style
+        await loop.run_in_executor(None, style_gallery.warmup)
+    failed = [m for m in config.WARMUP_MODELS if m in readiness.errors] if config.WARMUP_ENABLED else []
+    if failed:
+        logger.error("❌ Worker not ready: warmup failed", extra={"models": failed})
+        return
+    readiness.set_ready()
+    logger.info("✅ Worker ready", extra={"warmup_s": readiness.status()["warmup_s"]})
@@ -0,0 +1,266 @@
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Bucket (giây) cho latency: từ vài ms (preprocess ảnh nhỏ) tới vài chục giây (SANet ảnh lớn theo tile)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+# (tên metric kèm hậu tố, labels, giá trị)
+Sample = Tuple[str, Dict[str, str], float]
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: cần labels {self.labelnames}, nhận được {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Labels) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Giá trị chỉ tăng (số request, số lần load model...)."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total", self._labels(key), value
+
+class Gauge(_Metric):
+    """Giá trị tăng/giảm tuỳ ý (số job đang chạy, số session...)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+class Histogram(_Metric):
+    """Phân bố giá trị theo bucket cộng dồn (le), kèm _sum và _count."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (count theo từng bucket (không cộng dồn, phần tử cuối = +Inf), sum)
+        self._values: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager đo thời gian khối lệnh (giây)."""
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+class StageTimer:
+    """
+    Đo lần lượt các bước của 1 pipeline: mỗi lap() ghi thời gian kể từ lap trước vào
+    STAGE_SECONDS{stage, model}.
+    """
+
+    def __init__(self, model_name: str = ""):
+        self.model_name = model_name
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.last = now
+        STAGE_SECONDS.observe(seconds, stage=stage, model=self.model_name)
+        return seconds
+
+class Registry:
+    """
+    Tập metric của process, xuất ra text format của Prometheus (GET /metrics).
+
+    Ngoài metric cập nhật trực tiếp, `collectors` là các hàm được gọi lúc scrape để đọc
+    số liệu có sẵn (vd. stats() của cache, pool) thành gauge/counter.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        # (tên, mô tả, kind, hàm trả về list (labels, giá trị))
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric đã tồn tại: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(
+        self,
+        name: str,
+        documentation: str,
+        read: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+        kind: str = "gauge"
+    ) -> None:
+        """Đăng ký metric đọc lúc scrape. kind "counter" thì tên được thêm hậu tố _total."""
+        with self._lock:
+            self._collectors.append((name, documentation, kind, read))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, documentation, kind, read in collectors:
+            try:
+                values = list(read())
+            except Exception as e:
+                values = []
+                lines.append(f"# collector {name} failed: {type(e).__name__}")
+            sample_name = f"{name}_total" if kind == "counter" else name
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Metric dùng chung cho pipeline; metric đọc từ stats() của từng service được đăng ký ở api/health.py
+STAGE_SECONDS = REGISTRY.histogram(
+    "style_stage_seconds",
+    "Thời gian từng bước pipeline (decode, preprocess, inference, postprocess, encode, ...)",
+    ["stage", "model"]
+)
+ORT_RUN_SECONDS = REGISTRY.histogram("ort_session_run_seconds", "Thời gian session.run theo graph", ["graph"])
+STYLE_REQUESTS = REGISTRY.counter(
+    "style_requests", "Request style transfer theo model và nguồn kết quả", ["endpoint", "model", "result"]
+)
+MODEL_LOADS = REGISTRY.counter("model_loads", "Số lần tạo InferenceSession", ["graph", "source"])
+MODEL_LOAD_SECONDS = REGISTRY.histogram("model_load_seconds", "Thời gian tạo InferenceSession", ["graph"])
+BATCH_SIZE = REGISTRY.histogram(
+    "inference_batch_size", "Số request mỗi lần chạy batch", buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32)
+)
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "inference_pool_wait_seconds", "Thời gian job chờ trong hàng đợi inference pool (pool thread)"
+)
+WS_FRAMES = REGISTRY.counter("ws_frames", "Frame WebSocket video theo trạng thái", ["model", "status"])
+WS_FRAME_SECONDS = REGISTRY.histogram(
+    "ws_frame_seconds", "Thời gian từ lúc nhận frame tới lúc gửi kết quả", ["model"]
+)
+JOB_IMAGES = REGISTRY.counter("batch_job_images", "Ảnh đã xử lý bởi batch job (/api/jobs)", ["model", "status"])
+HTTP_REQUESTS = REGISTRY.counter("http_requests", "HTTP request theo route và status", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("http_request_seconds", "Latency HTTP theo route", ["method", "route"])
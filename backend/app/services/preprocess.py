@@ -1,15 +1,125 @@
+import threading
+from collections import OrderedDict
 import numpy as np
 from PIL import Image
 import cv2
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
-IMAGENET_MEAN = np.array([0.485, 0.456, 0.406])
-IMAGENET_STD = np.array([0.229, 0.224, 0.225])
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# uint8 -> float: x * scale + bias (gộp /255 và normalize thành 1 phép nhân + 1 phép cộng mỗi kênh)
+NORMALIZE_SCALE = (1.0 / (255.0 * IMAGENET_STD)).astype(np.float32)
+NORMALIZE_BIAS = (-IMAGENET_MEAN / IMAGENET_STD).astype(np.float32)
+# float -> [0, 255]: x * scale + bias rồi clip, +0.5 để phép cắt sang uint8 thành làm tròn
+DENORMALIZE_SCALE = (255.0 * IMAGENET_STD).astype(np.float32)
+DENORMALIZE_BIAS = (255.0 * IMAGENET_MEAN + 0.5).astype(np.float32)
+UNIT_SCALE = np.full(3, 1.0 / 255.0, dtype=np.float32)
+
+# Buffer tạm lớn hơn mức này không được giữ lại giữa các lần gọi
+MAX_SCRATCH_BYTES = 64 * 1024 * 1024
+MAX_SCRATCH_BUFFERS = 8
+
+_scratch = threading.local()
+
+def scratch_buffer(name: str, shape: Tuple[int, ...], dtype=np.float32) -> np.ndarray:
+    """
+    Buffer dùng lại theo (name, shape, dtype), riêng cho từng thread.
+
+    Nội dung bị ghi đè ở lần gọi sau cùng name/shape trong cùng thread: chỉ dùng cho tensor
+    được tiêu thụ ngay (vd. truyền thẳng vào session.run), không dùng cho tensor còn được giữ
+    lại (micro-batcher, cache).
+    """
+    shape = tuple(shape)
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if nbytes > MAX_SCRATCH_BYTES:
+        return np.empty(shape, dtype=dtype)
+
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = OrderedDict()
+    key = (name, shape, np.dtype(dtype))
+    buffer = buffers.get(key)
+    if buffer is None:
+        buffer = np.empty(shape, dtype=dtype)
+        buffers[key] = buffer
+        while len(buffers) > MAX_SCRATCH_BUFFERS:
+            buffers.popitem(last=False)
+    else:
+        buffers.move_to_end(key)
+    return buffer
+
+def hwc_to_nchw(
+    image: np.ndarray,
+    normalize: bool = True,
+    channel_order: str = "RGB",
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Ảnh HWC (thường uint8) -> tensor (1, 3, H, W) float32 RGB, đã scale (và normalize).
+
+    Mỗi kênh là 1 phép nhân ghi thẳng vào plane đích + 1 phép cộng tại chỗ: không có mảng
+    trung gian float64 hay bản copy transpose. Đảo kênh BGR -> RGB nằm trong việc chọn plane.
+
+    Args:
+        out: Buffer đích shape (1, 3, H, W) float32 (vd. scratch_buffer), None = cấp mới
+    """
+    h, w = image.shape[:2]
+    if out is None:
+        out = np.empty((1, 3, h, w), dtype=np.float32)
+    elif out.shape != (1, 3, h, w) or out.dtype != np.float32:
+        raise ValueError(f"out phải có shape (1, 3, {h}, {w}) float32, nhận được: {out.shape} {out.dtype}")
+
+    scale = NORMALIZE_SCALE if normalize else UNIT_SCALE
+    for c in range(3):
+        src = 2 - c if channel_order == "BGR" else c
+        plane = out[0, c]
+        np.multiply(image[..., src], scale[c], out=plane, casting="unsafe")
+        if normalize:
+            plane += NORMALIZE_BIAS[c]
+    return out
+
+def nchw_to_hwc(
+    tensor: np.ndarray,
+    denormalize: bool = True,
+    channel_order: str = "RGB",
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Tensor (1, 3, H, W) hoặc (3, H, W) float -> ảnh HWC uint8.
+
+    Denormalize + scale 255 + làm tròn + clip chạy trên 1 plane float32 dùng lại (scratch_buffer),
+    rồi ghi thẳng vào kênh tương ứng của ảnh uint8 (đảo kênh cho BGR nằm ở đây).
+
+    Args:
+        out: Buffer đích shape (H, W, 3) uint8, None = cấp mới
+    """
+    if tensor.ndim == 4:
+        tensor = tensor[0]
+    h, w = tensor.shape[1:]
+    if out is None:
+        out = np.empty((h, w, 3), dtype=np.uint8)
+
+    plane = scratch_buffer("postprocess_plane", (h, w))
+    for c in range(3):
+        dst = 2 - c if channel_order == "BGR" else c
+        if denormalize:
+            np.multiply(tensor[c], DENORMALIZE_SCALE[c], out=plane, casting="unsafe")
+            plane += DENORMALIZE_BIAS[c]
+        else:
+            np.multiply(tensor[c], np.float32(255.0), out=plane, casting="unsafe")
+            plane += np.float32(0.5)
+        np.clip(plane, 0.0, 255.0, out=plane)
+        out[..., dst] = plane
+    return out
 
 def preprocess_image(
     image: Union[np.ndarray, Image.Image],
     target_size: Tuple[int, int] = (512, 512),
-    normalize: bool = True
+    normalize: bool = True,
+    channel_order: str = "RGB",
+    out: Optional[np.ndarray] = None,
+    scratch: Optional[str] = None
 ) -> np.ndarray:
     """
     Tiền xử lý ảnh để đưa vào model.
@@ -18,17 +128,22 @@ def preprocess_image(
         image: Ảnh input (PIL Image hoặc numpy array shape (H, W, C))
         target_size: Kích thước target (width, height)
         normalize: Có normalize theo ImageNet stats không
+        channel_order: Thứ tự kênh của `image`: "RGB" (PIL) hoặc "BGR" (cv2.imdecode)
+        out: Buffer đích shape (1, 3, H, W) float32, None = cấp mới (xem hwc_to_nchw)
+        scratch: Nếu có và out là None: ghi vào scratch_buffer(scratch, ...) của thread hiện tại,
+            chỉ dùng khi tensor được đưa thẳng vào session.run
     
     Returns:
         np.ndarray: Tensor đã preprocess, shape (1, 3, H, W), dtype float32, range [0, 1] hoặc normalized
     """
+    _check_channel_order(channel_order)
     if isinstance(image, Image.Image):
-        image = np.array(image)
+        image = np.asarray(image)
     
     if len(image.shape) == 2:
         image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
     elif image.shape[2] == 4:
-        image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB if channel_order == "RGB" else cv2.COLOR_BGRA2BGR)
     if target_size is not None:
         h, w = image.shape[:2]
         target_w, target_h = target_size
@@ -36,19 +151,14 @@ def preprocess_image(
         if h != target_h or w != target_w:
             image = cv2.resize(image, (target_w, target_h), interpolation=cv2.INTER_AREA)
     
-    image = image.astype(np.float32) / 255.0
-    
-    if normalize:
-        image = (image - IMAGENET_MEAN) / IMAGENET_STD
-    
-    image = np.transpose(image, (2, 0, 1))
-    image = np.expand_dims(image, axis=0)
-    
-    return image.astype(np.float32)
+    if out is None and scratch is not None:
+        out = scratch_buffer(scratch, (1, 3) + image.shape[:2])
+    return hwc_to_nchw(image, normalize=normalize, channel_order=channel_order, out=out)
 
 def postprocess_tensor(
     tensor: np.ndarray,
-    denormalize: bool = True
+    denormalize: bool = True,
+    channel_order: str = "RGB"
 ) -> np.ndarray:
     """
     Hậu xử lý tensor từ model output thành ảnh.
@@ -56,22 +166,48 @@ def postprocess_tensor(
     Args:
         tensor: Output từ model, shape (1, 3, H, W) hoặc (batch, 3, H, W)
         denormalize: Có denormalize theo ImageNet stats không
+        channel_order: Thứ tự kênh của ảnh trả về: "RGB" (PIL) hoặc "BGR" (cv2.imencode)
     
     Returns:
-        np.ndarray: Ảnh RGB, shape (H, W, 3), dtype uint8, range [0, 255]
+        np.ndarray: Ảnh RGB (hoặc BGR), shape (H, W, 3), dtype uint8, range [0, 255]
     """
-    if len(tensor.shape) == 4:
-        tensor = tensor[0]
-    
-    tensor = np.transpose(tensor, (1, 2, 0))
-    
-    if denormalize:
-        tensor = tensor * IMAGENET_STD + IMAGENET_MEAN
-    
-    tensor = np.clip(tensor, 0, 1)
-    tensor = (tensor * 255.0).astype(np.uint8)
-    
-    return tensor
+    _check_channel_order(channel_order)
+    return nchw_to_hwc(tensor, denormalize=denormalize, channel_order=channel_order)
+
+def to_uint8_nhwc(
+    image: Union[np.ndarray, Image.Image],
+    target_size: Optional[Tuple[int, int]] = None,
+    channel_order: str = "RGB"
+) -> np.ndarray:
+    """
+    Input cho model fused (app/models/fuse_io.py): ảnh RGB uint8 shape (1, H, W, 3).
+    Ảnh RGB uint8 liền bộ nhớ không bị copy, BGR chỉ tốn 1 bản copy uint8.
+    """
+    _check_channel_order(channel_order)
+    image = np.asarray(image)
+    if len(image.shape) == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    elif image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB if channel_order == "RGB" else cv2.COLOR_BGRA2BGR)
+    if target_size is not None and (image.shape[1], image.shape[0]) != tuple(target_size):
+        image = cv2.resize(image, tuple(target_size), interpolation=cv2.INTER_AREA)
+    if channel_order == "BGR":
+        image = image[..., ::-1]
+    return np.ascontiguousarray(image, dtype=np.uint8)[None]
+
+def from_uint8_nhwc(output: np.ndarray, channel_order: str = "RGB") -> np.ndarray:
+    """
+    Output của model fused (1, H, W, 3) uint8 RGB -> ảnh (H, W, 3) theo channel_order.
+    """
+    _check_channel_order(channel_order)
+    image = output[0]
+    if channel_order == "BGR":
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    return image
+
+def _check_channel_order(channel_order: str) -> None:
+    if channel_order not in ("RGB", "BGR"):
+        raise ValueError(f"channel_order phải là 'RGB' hoặc 'BGR', nhận được: {channel_order}")
 
 def resize_image_keep_aspect(
     image: np.ndarray,
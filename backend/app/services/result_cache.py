@@ -0,0 +1,233 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app import config
+from app.models.loader import STAGES, get_model_path
+from app.services.style_cache import hash_image
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+def model_fingerprint(model_name: str) -> str:
+    """
+    Định danh phiên bản model theo precision và (size, mtime) các file ONNX: thay weights thì key đổi.
+    """
+    precision = config.MODEL_PRECISION
+    parts = [precision]
+    for stage in (None,) + STAGES:
+        paths = [get_model_path(model_name, stage)]
+        if precision != "fp32":
+            paths.append(get_model_path(model_name, stage, precision=precision))
+        for path in paths:
+            for p in (path, f"{path}.data"):
+                if os.path.exists(p):
+                    stat = os.stat(p)
+                    parts.append(f"{os.path.basename(p)}|{stat.st_size}|{stat.st_mtime_ns}")
+    return ";".join(parts)
+
+def make_result_key(
+    content_np: np.ndarray,
+    style_np: np.ndarray,
+    model_name: str,
+    alpha: float,
+    target_size: Optional[Tuple[int, int]] = (256, 256)
+) -> str:
+    """
+    Key content-addressed cho 1 kết quả: hash pixel content + style (đã decode), model
+    (kèm phiên bản file), alpha, kích thước style, thiết lập tile và shape bucket.
+    """
+    return make_result_keys(content_np, style_np, model_name, [alpha], target_size)[0]
+
+def make_result_keys(
+    content_np: np.ndarray,
+    style_np: np.ndarray,
+    model_name: str,
+    alphas: List[float],
+    target_size: Optional[Tuple[int, int]] = (256, 256)
+) -> List[str]:
+    """
+    Như make_result_key cho nhiều alpha, content và style chỉ hash 1 lần.
+    """
+    base = hashlib.blake2b(digest_size=20)
+    for part in (
+        hash_image(content_np),
+        hash_image(style_np),
+        model_name,
+        model_fingerprint(model_name),
+        repr(tuple(target_size) if target_size is not None else None),
+        repr((config.TILE_MAX_SIDE, config.TILE_SIZE, config.TILE_OVERLAP)),
+        # Bucket (pad / resize) đổi ảnh kết quả, đổi cấu hình thì ETag và cache cũ không còn khớp
+        repr((config.SHAPE_BUCKETS_ENABLED, config.SHAPE_BUCKET_MODE, config.SHAPE_BUCKETS)),
+    ):
+        base.update(part.encode())
+        base.update(b"\0")
+
+    keys = []
+    for alpha in alphas:
+        digest = base.copy()
+        digest.update(f"{float(alpha):.6f}".encode())
+        keys.append(digest.hexdigest())
+    return keys
+
+class ResultCache:
+    """
+    Cache 2 tầng cho ảnh kết quả đã encode (JPEG bytes), key tạo bởi make_result_key.
+
+    - Memory: LRU giới hạn theo tổng số byte.
+    - Disk (tuỳ chọn): mỗi kết quả 1 file `<dir>/<key[:2]>/<key>.jpg`, giới hạn tổng dung lượng;
+      vượt giới hạn thì xoá file truy cập lâu nhất (theo mtime, được cập nhật khi hit).
+      Hit trên disk được đưa lên tầng memory.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.disk_dir = disk_dir if disk_dir and max_disk_bytes > 0 else None
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        # key -> size của các file trên disk, thứ tự = LRU
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._scan_disk()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            on_disk = key in self._disk_entries
+
+        data = self._read_disk(key) if on_disk else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+        self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        nbytes = len(data)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            while self._entries and self.current_bytes + nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+            self._entries[key] = data
+            self.current_bytes += nbytes
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.jpg")
+
+    def _scan_disk(self) -> None:
+        if self.disk_dir is None:
+            return
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".jpg"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # đánh dấu vừa được dùng (LRU khi scan lại lúc khởi động)
+            return data
+        except OSError:
+            with self._lock:
+                size = self._disk_entries.pop(key, None)
+                if size is not None:
+                    self.disk_bytes -= size
+            return None
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        if self.disk_dir is None or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠ Result cache: cannot write: {e}", extra={"path": path})
+            return
+
+        with self._lock:
+            old = self._disk_entries.pop(key, None)
+            if old is not None:
+                self.disk_bytes -= old
+            self._disk_entries[key] = len(data)
+            self.disk_bytes += len(data)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        evicted = []
+        with self._lock:
+            while self._disk_entries and self.disk_bytes > self.max_disk_bytes:
+                key, size = self._disk_entries.popitem(last=False)
+                self.disk_bytes -= size
+                evicted.append(key)
+        for key in evicted:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+result_cache = ResultCache(
+    config.RESULT_CACHE_MAX_BYTES,
+    config.RESULT_CACHE_DIR,
+    config.RESULT_CACHE_DISK_MAX_BYTES
+)
@@ -0,0 +1,126 @@
+import threading
+from collections import Counter
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app import config
+
+BUCKET_MODES = ("pad", "resize")
+
+class BucketFit(NamedTuple):
+    """Cách ảnh được đưa về bucket, dùng để trả kết quả về kích thước gốc."""
+    height: int
+    width: int
+    bucket: Optional[Tuple[int, int]]  # (width, height), None = không vào bucket nào
+    mode: str
+
+def parse_buckets(spec: str) -> List[Tuple[int, int]]:
+    """
+    "512x384,384x512" -> [(512, 384), (384, 512)] (width, height), sắp xếp theo diện tích.
+    """
+    buckets = set()
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        width, height = (int(x) for x in item.split("x"))
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Bucket không hợp lệ: {item}")
+        buckets.add((width, height))
+    return sorted(buckets, key=lambda b: (b[0] * b[1], b))
+
+class ShapeBuckets:
+    """
+    Đưa content về 1 trong các kích thước chuẩn (bucket) trước khi inference để ORT dùng lại
+    memory plan của các shape đã gặp và request khác kích thước vẫn batch được với nhau.
+
+    - "pad": reflect-pad (phải/dưới) lên bucket nhỏ nhất chứa được ảnh, kết quả được crop lại.
+      Ảnh lớn hơn mọi bucket chạy ở kích thước gốc (miss).
+    - "resize": resize về bucket có tỉ lệ gần nhất, kết quả được resize lại. Luôn hit nhưng ảnh bị co giãn.
+    """
+
+    def __init__(self, buckets: List[Tuple[int, int]], mode: str = "pad"):
+        if mode not in BUCKET_MODES:
+            raise ValueError(f"mode phải là một trong {BUCKET_MODES}, nhận được: {mode}")
+        self.buckets = sorted(buckets, key=lambda b: (b[0] * b[1], b))
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.pad_pixels = 0
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def select(self, height: int, width: int) -> Optional[Tuple[int, int]]:
+        """Bucket (width, height) cho ảnh kích thước (height, width), None nếu không có."""
+        if not self.buckets:
+            return None
+        if self.mode == "pad":
+            return next((b for b in self.buckets if b[0] >= width and b[1] >= height), None)
+        aspect = np.log(width / height)
+        return min(
+            self.buckets,
+            key=lambda b: (abs(np.log(b[0] / b[1]) - aspect), abs(b[0] * b[1] - width * height))
+        )
+
+    def fit(self, image: np.ndarray) -> Tuple[np.ndarray, BucketFit]:
+        """
+        Đưa ảnh (H, W, C) về bucket.
+
+        Returns:
+            Tuple[np.ndarray, BucketFit]: Ảnh kích thước bucket (hoặc ảnh gốc nếu miss) và thông tin để restore
+        """
+        height, width = image.shape[:2]
+        bucket = self.select(height, width)
+        with self._lock:
+            if bucket is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._counts[bucket] += 1
+                if self.mode == "pad":
+                    self.pad_pixels += bucket[0] * bucket[1] - width * height
+        info = BucketFit(height, width, bucket, self.mode)
+
+        if bucket is None or bucket == (width, height):
+            return image, info
+        if self.mode == "resize":
+            interpolation = cv2.INTER_AREA if bucket[0] * bucket[1] < width * height else cv2.INTER_LINEAR
+            return cv2.resize(image, bucket, interpolation=interpolation), info
+        # Reflect cần cạnh >= 2, ảnh 1 pixel thì lặp lại biên
+        border = cv2.BORDER_REFLECT_101 if min(height, width) > 1 else cv2.BORDER_REPLICATE
+        padded = cv2.copyMakeBorder(np.asarray(image), 0, bucket[1] - height, 0, bucket[0] - width, border)
+        return padded, info
+
+    def restore(self, output: np.ndarray, info: BucketFit) -> np.ndarray:
+        """Đưa ảnh kết quả (H, W, C) về kích thước gốc."""
+        if output.shape[:2] == (info.height, info.width):
+            return output
+        if info.mode == "pad" and output.shape[0] >= info.height and output.shape[1] >= info.width:
+            return np.ascontiguousarray(output[:info.height, :info.width])
+        return cv2.resize(output, (info.width, info.height), interpolation=cv2.INTER_LINEAR)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "buckets": [f"{w}x{h}" for w, h in self.buckets],
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "pad_pixels": self.pad_pixels,
+                "per_bucket": {f"{w}x{h}": n for (w, h), n in self._counts.most_common()},
+            }
+
+def bucket_content(image: np.ndarray) -> Tuple[np.ndarray, Optional[BucketFit]]:
+    """Đưa content về bucket nếu SHAPE_BUCKETS_ENABLED, ngược lại trả nguyên ảnh."""
+    if not config.SHAPE_BUCKETS_ENABLED:
+        return image, None
+    return shape_buckets.fit(image)
+
+def unbucket_output(output: np.ndarray, info: Optional[BucketFit]) -> np.ndarray:
+    return output if info is None else shape_buckets.restore(output, info)
+
+shape_buckets = ShapeBuckets(parse_buckets(config.SHAPE_BUCKETS), config.SHAPE_BUCKET_MODE)
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from app import config
+
+StyleFeatures = Dict[str, np.ndarray]
+
+def hash_image(image: np.ndarray) -> str:
+    """
+    Hash nội dung pixel (đã decode) của ảnh, kèm shape và dtype.
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.shape}|{image.dtype}".encode())
+    digest.update(memoryview(image).cast("B"))
+    return digest.hexdigest()
+
+def make_style_key(
+    style_np: np.ndarray,
+    model_name: str,
+    target_size: Optional[Tuple[int, int]]
+) -> Tuple:
+    """
+    Key cache: (hash pixel style, model, target_size).
+    """
+    size = tuple(target_size) if target_size is not None else None
+    return (hash_image(style_np), model_name, size)
+
+class StyleFeatureCache:
+    """
+    LRU cache cho style features (AdaIN mean/std, SANet relu4_1/relu5_1),
+    giới hạn theo tổng số byte của các array.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[StyleFeatures, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[StyleFeatures]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, features: StyleFeatures) -> None:
+        nbytes = sum(arr.nbytes for arr in features.values())
+        if nbytes > self.max_bytes:
+            return
+
+        # Features được chia sẻ giữa các request -> chỉ đọc
+        for arr in features.values():
+            arr.setflags(write=False)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+
+            while self._entries and self.current_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+
+            self._entries[key] = (features, nbytes)
+            self.current_bytes += nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+style_cache = StyleFeatureCache(config.STYLE_CACHE_MAX_BYTES)
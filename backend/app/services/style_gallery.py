@@ -0,0 +1,218 @@
+import glob
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app import config
+from app.models.loader import MODEL_NAMES, get_model_path, has_stages, load_model
+from app.services.inference import encode_style
+from app.services.preprocess import preprocess_image
+from app.services.style_cache import StyleFeatures
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+STYLE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+class StyleGallery:
+    """
+    Các style có sẵn trong `config.STYLE_DIR`, tham chiếu bằng `style_id` (tên file không đuôi).
+
+    Mỗi style được decode + resize về `target_size` 1 lần, style features (hoặc style tensor nếu model
+    chưa tách stage) được tính 1 lần cho mỗi model và giữ trong memory (không bị LRU evict).
+    Nếu có `cache_dir`, ảnh đã resize và style features được lưu thành file `.npy` và lần khởi động sau
+    được mở bằng mmap, không cần decode hay chạy encoder nữa.
+    """
+
+    def __init__(
+        self,
+        style_dir: str = config.STYLE_DIR,
+        cache_dir: Optional[str] = config.STYLE_GALLERY_CACHE_DIR,
+        target_size: Tuple[int, int] = (256, 256)
+    ):
+        self.style_dir = style_dir
+        self.cache_dir = cache_dir or None
+        self.target_size = tuple(target_size)
+        self._paths: Dict[str, str] = {}
+        self._images: Dict[str, np.ndarray] = {}
+        # (style_id, model_name) -> style features (staged) hoặc style tensor (graph đầy đủ)
+        self._styles: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self.scan()
+
+    def scan(self) -> List[str]:
+        """Tìm lại các file style trong style_dir."""
+        paths = {}
+        for path in sorted(glob.glob(os.path.join(self.style_dir, "*"))):
+            stem, ext = os.path.splitext(os.path.basename(path))
+            if ext.lower() in STYLE_EXTENSIONS:
+                paths[stem] = path
+        with self._lock:
+            self._paths = paths
+        return self.ids()
+
+    def ids(self) -> List[str]:
+        return list(self._paths)
+
+    def filename(self, style_id: str) -> str:
+        return os.path.basename(self._path(style_id))
+
+    def __contains__(self, style_id: str) -> bool:
+        return style_id in self._paths
+
+    def get_image(self, style_id: str) -> np.ndarray:
+        """
+        Ảnh style RGB uint8 đã resize về target_size, shape (H, W, 3).
+        """
+        image = self._images.get(style_id)
+        if image is not None:
+            return image
+
+        path = self._path(style_id)
+        cache_path = self._cache_path(style_id, "image")
+        image = self._load_npy(cache_path)
+        if image is None:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError(f"Cannot decode style image: {path}")
+            image = cv2.resize(image, self.target_size, interpolation=cv2.INTER_AREA)
+            image = np.ascontiguousarray(image[..., ::-1])
+            image.setflags(write=False)
+            self._save_npy(cache_path, image)
+
+        with self._lock:
+            self._images[style_id] = image
+        return image
+
+    def get_style(self, style_id: str, model_name: str = "adain") -> Any:
+        """
+        Style đã chuẩn bị sẵn cho model: style features (dict, nếu model đã tách stage)
+        hoặc style tensor shape (1, 3, H, W) cho graph đầy đủ.
+        """
+        if model_name not in MODEL_NAMES:
+            raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+
+        key = (style_id, model_name)
+        style = self._styles.get(key)
+        if style is not None:
+            return style
+
+        image = self.get_image(style_id)
+        normalize = (model_name == "adain")
+        if has_stages(model_name):
+            style = self._load_features(style_id, model_name)
+            if style is None:
+                style_tensor = preprocess_image(image, target_size=self.target_size, normalize=normalize)
+                style = encode_style(load_model(model_name, stage="encoder"), style_tensor, model_name)
+                for name, value in style.items():
+                    value.setflags(write=False)
+                    self._save_npy(self._cache_path(style_id, f"{model_name}_{name}"), value)
+        else:
+            style = preprocess_image(image, target_size=self.target_size, normalize=normalize)
+            style.setflags(write=False)
+
+        with self._lock:
+            self._styles[key] = style
+        return style
+
+    def get_features(self, style_id: str, model_name: str = "adain") -> Optional[StyleFeatures]:
+        """Style features nếu model đã tách stage, ngược lại None."""
+        style = self.get_style(style_id, model_name)
+        return style if isinstance(style, dict) else None
+
+    def warmup(self, model_names: Iterable[str] = MODEL_NAMES) -> None:
+        """
+        Decode mọi style và tính style cho từng model (gọi lúc khởi động server).
+        Model chưa có file ONNX được bỏ qua, style sẽ được tính khi có request đầu tiên.
+        """
+        for model_name in model_names:
+            for style_id in self.ids():
+                try:
+                    self.get_style(style_id, model_name)
+                except FileNotFoundError as e:
+                    logger.warning(f"⚠ Style gallery: skip warmup for '{model_name}': {e}")
+                    break
+                except Exception as e:
+                    logger.error(f"❌ Style gallery: cannot prepare '{style_id}' ({model_name}): {e}")
+        logger.info("🎨 Style gallery ready", extra={"styles": len(self._images), "prepared": len(self._styles)})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+            self._styles.clear()
+
+    def stats(self) -> dict:
+        return {
+            "styles": len(self._paths),
+            "decoded": len(self._images),
+            "prepared": len(self._styles),
+            "cache_dir": self.cache_dir,
+        }
+
+    def _path(self, style_id: str) -> str:
+        path = self._paths.get(style_id)
+        if path is None:
+            raise KeyError(style_id)
+        return path
+
+    def _load_features(self, style_id: str, model_name: str) -> Optional[StyleFeatures]:
+        names = ("mean", "std") if model_name == "adain" else ("style4_1", "style5_1")
+        features = {}
+        for name in names:
+            value = self._load_npy(self._cache_path(style_id, f"{model_name}_{name}"))
+            if value is None:
+                return None
+            features[name] = value
+        return features
+
+    def _cache_path(self, style_id: str, name: str) -> Optional[str]:
+        """
+        File cache phụ thuộc vào file style, kích thước và (với features) file encoder + precision:
+        thay ảnh hoặc model thì tên file đổi, file cũ không còn được dùng.
+        """
+        if self.cache_dir is None:
+            return None
+        sources = [self._path(style_id)]
+        model_name = name.split("_", 1)[0]
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(repr(self.target_size).encode())
+        if name != "image" and model_name in MODEL_NAMES:
+            precision = config.MODEL_PRECISION
+            digest.update(precision.encode())
+            encoder_paths = [get_model_path(model_name, "encoder")]
+            if precision != "fp32":
+                encoder_paths.append(get_model_path(model_name, "encoder", precision=precision))
+            for encoder_path in encoder_paths:
+                sources += [p for p in (encoder_path, f"{encoder_path}.data") if os.path.exists(p)]
+
+        for source in sources:
+            stat = os.stat(source)
+            digest.update(f"{source}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        return os.path.join(self.cache_dir, f"{style_id}.{name}.{digest.hexdigest()}.npy")
+
+    def _load_npy(self, path: Optional[str]) -> Optional[np.ndarray]:
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            return np.load(path, mmap_mode="r")
+        except Exception as e:
+            logger.warning(f"⚠ Style gallery: ignore broken cache file: {e}", extra={"path": path})
+            return None
+
+    def _save_npy(self, path: Optional[str], value: np.ndarray) -> None:
+        if path is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠ Style gallery: cannot write cache file: {e}", extra={"path": path})
+
+style_gallery = StyleGallery()
@@ -1,48 +1,554 @@
 import numpy as np
-from typing import Union
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from PIL import Image
 
-from app.services.preprocess import preprocess_image, postprocess_tensor
-from app.services.inference import run_inference
-from app.models.loader import load_model
+from app.services.preprocess import (
+    preprocess_image, postprocess_tensor, to_uint8_nhwc, from_uint8_nhwc, resize_image_keep_aspect
+)
+from app.services.inference import (
+    run_inference, run_inference_batch, encode_style, run_staged_inference, run_alpha_sweep
+)
+from app.services.style_cache import style_cache, make_style_key
+from app.services.batching import create_batcher
+from app.services.executor import inference_pool, run_light
+from app.services.tiling import TileRunner, needs_tiling, stylize_tiled, tile_batches
+from app.services.shape_buckets import BucketFit, bucket_content, unbucket_output
+from app.services.metrics import BATCH_SIZE, StageTimer
+from app.models.loader import load_model, has_stages, has_fused
+from app import config
+
+def get_style_features(
+    style_img: Union[np.ndarray, Image.Image],
+    model_name: str = "adain",
+    target_size: tuple = (256, 256)
+) -> Dict[str, np.ndarray]:
+    """
+    Lấy style features từ cache, hoặc chạy encoder stage nếu chưa có.
+
+    Args:
+        style_img: Ảnh style (PIL Image hoặc numpy array shape (H, W, C))
+        model_name: "adain" hoặc "sanet"
+        target_size: Kích thước resize style (width, height)
+
+    Returns:
+        Dict[str, np.ndarray]: AdaIN: {"mean", "std"}, SANet: {"style4_1", "style5_1"}
+    """
+    style_np = np.asarray(style_img)
+    key = make_style_key(style_np, model_name, target_size)
+
+    features = style_cache.get(key)
+    if features is None:
+        encoder = load_model(model_name, stage="encoder")
+        normalize = (model_name == "adain")
+        style_tensor = preprocess_image(style_np, target_size=target_size, normalize=normalize)
+        features = encode_style(encoder, style_tensor, model_name)
+        style_cache.put(key, features)
+    return features
+
+def use_fused_io(model_name: str, staged: bool) -> bool:
+    """
+    Dùng biến thể fused (uint8 NHWC vào/ra, xem app/models/fuse_io.py) nếu được bật
+    và đã có file cho đường chạy tương ứng (stage hoặc graph đầy đủ) ở precision đang dùng.
+    """
+    if not config.FUSED_IO:
+        return False
+    precision = config.MODEL_PRECISION
+    if staged:
+        return has_stages(model_name, fused=True, precision=precision)
+    return has_fused(model_name, precision=precision)
 
 def apply_style(
     content_img: Union[np.ndarray, Image.Image],
     style_img: Union[np.ndarray, Image.Image],
     model_name: str = "adain",
     alpha: float = 1.0,
-    target_size: tuple = (256, 256)
+    target_size: tuple = (256, 256),
+    channel_order: str = "RGB",
+    tile_size: Optional[int] = None,
+    tile_overlap: int = config.TILE_OVERLAP,
+    tile_batch_size: int = config.TILE_BATCH_SIZE
 ) -> np.ndarray:
     """
     Pipeline tổng hợp để áp dụng style transfer.
-    
+
     Args:
         content_img: Ảnh content (PIL Image hoặc numpy array shape (H, W, C))
-        style_img: Ảnh style (PIL Image hoặc numpy array shape (H, W, C))
+        style_img: Ảnh style RGB (PIL Image hoặc numpy array shape (H, W, C))
         model_name: "adain" hoặc "sanet"
         alpha: Style strength (0.0 - 1.0), chỉ dùng cho AdaIN
         target_size: Kích thước target (width, height)
-    
+        channel_order: Thứ tự kênh của content và ảnh kết quả: "RGB" hoặc "BGR" (cv2)
+        tile_size: Nếu khác None và content có cạnh dài hơn tile_size -> chế độ tile
+            (xem services/tiling.py), style features chỉ tính 1 lần cho mọi tile
+        tile_overlap: Số pixel overlap giữa các tile
+        tile_batch_size: Số tile mỗi lần session.run
+
     Returns:
         np.ndarray: Ảnh kết quả đã styled, shape (H, W, C), dtype uint8, range [0, 255]
     """
     if model_name not in ["adain", "sanet"]:
         raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
-    
-    session = load_model(model_name)
-    
+
     normalize = (model_name == "adain")
-    content_tensor = preprocess_image(content_img, target_size=None, normalize=normalize)
-    style_tensor = preprocess_image(style_img, target_size=target_size, normalize=normalize)
-    
-    output_tensor = run_inference(
-        session,
+    content_np = np.asarray(content_img)
+    timer = StageTimer(model_name)
+    if needs_tiling(content_np, tile_size):
+        result = stylize_tiled(
+            content_np,
+            make_tile_runner(style_img, model_name, alpha, target_size),
+            tile_size=tile_size,
+            overlap=tile_overlap,
+            batch_size=tile_batch_size,
+            normalize=normalize,
+            channel_order=channel_order
+        )
+        timer.lap("tiled")
+        return result
+
+    # SHAPE_BUCKETS_ENABLED: chạy ở kích thước bucket, kết quả được crop/resize về kích thước gốc
+    content_np, bucket = bucket_content(content_np)
+    staged = has_stages(model_name)
+    fused = use_fused_io(model_name, staged)
+    if fused:
+        # Normalize / transpose / clip nằm trong graph, chỉ truyền ảnh uint8
+        content_tensor = to_uint8_nhwc(content_np, channel_order=channel_order)
+    else:
+        content_tensor = preprocess_image(
+            content_np, target_size=None, normalize=normalize, channel_order=channel_order, scratch="content"
+        )
+
+    timer.lap("preprocess")
+
+    if staged:
+        # Style features lấy từ cache -> chỉ còn encode content + decode
+        style_features = get_style_features(style_img, model_name, target_size)
+        timer.lap("style")
+        output_tensor = run_staged_inference(
+            load_model(model_name, stage="encoder", fused=fused),
+            load_model(model_name, stage="decoder", fused=fused),
+            content_tensor,
+            style_features,
+            alpha=alpha,
+            model_name=model_name
+        )
+    else:
+        session = load_model(model_name, fused=fused)
+        if fused:
+            style_tensor = to_uint8_nhwc(style_img, target_size=target_size)
+        else:
+            style_tensor = preprocess_image(style_img, target_size=target_size, normalize=normalize)
+        timer.lap("style")
+        output_tensor = run_inference(
+            session,
+            content_tensor,
+            style_tensor,
+            alpha=alpha,
+            model_name=model_name
+        )
+    timer.lap("inference")
+
+    if fused:
+        result_image = from_uint8_nhwc(output_tensor, channel_order=channel_order)
+    else:
+        result_image = postprocess_tensor(output_tensor, denormalize=normalize, channel_order=channel_order)
+    result_image = unbucket_output(result_image, bucket)
+    timer.lap("postprocess")
+    return result_image
+
+def tiled_timeout(content_img: Union[np.ndarray, Image.Image], runs: int = 1) -> Optional[float]:
+    """
+    Timeout cho job inference_pool chạy `runs` lần apply_style ở chế độ tile:
+    INFERENCE_TIMEOUT_S nhân theo số batch tile, vì mọi tile chạy tuần tự trong 1 job.
+    None = timeout mặc định của pool (ảnh không cần tile hoặc pool không giới hạn thời gian).
+    """
+    content_np = np.asarray(content_img)
+    if inference_pool.timeout_s is None or not needs_tiling(content_np, config.TILE_MAX_SIDE):
+        return None
+    height, width = content_np.shape[:2]
+    batches = tile_batches(height, width, config.TILE_SIZE, config.TILE_OVERLAP, config.TILE_BATCH_SIZE)
+    return inference_pool.timeout_s * batches * max(1, runs)
+
+def apply_style_alpha_sweep(
+    content_img: Union[np.ndarray, Image.Image],
+    style_img: Union[np.ndarray, Image.Image],
+    alphas: List[float],
+    target_size: tuple = (256, 256),
+    prepared_style: Any = None
+) -> List[np.ndarray]:
+    """
+    Stylize 1 content với nhiều alpha (chỉ AdaIN).
+
+    Nếu model đã tách stage: 1 lần encode content + style (style features lấy từ cache
+    hoặc `prepared_style`), các alpha chỉ còn blend + 1 lần decoder cho cả batch.
+    Nếu chưa tách stage hoặc ảnh cần chế độ tile: chạy từng alpha riêng.
+
+    Returns:
+        List[np.ndarray]: Ảnh kết quả RGB uint8 shape (H, W, 3), theo thứ tự alphas
+    """
+    if not alphas:
+        return []
+    if needs_tiling(np.asarray(content_img), config.TILE_MAX_SIDE):
+        # Ảnh lớn: feature map của cả ảnh không vừa bộ nhớ -> chế độ tile cho từng alpha
+        return [
+            apply_style(content_img, style_img, "adain", alpha, target_size, tile_size=config.TILE_SIZE)
+            for alpha in alphas
+        ]
+
+    timer = StageTimer("adain")
+    content_np, bucket = bucket_content(np.asarray(content_img))
+    content_tensor = preprocess_image(content_np, target_size=None, normalize=True, scratch="content")
+    timer.lap("preprocess")
+
+    if has_stages("adain"):
+        style_features = prepared_style
+        if style_features is None:
+            style_features = get_style_features(style_img, "adain", target_size)
+        output = run_alpha_sweep(
+            load_model("adain", stage="encoder"),
+            load_model("adain", stage="decoder"),
+            content_tensor,
+            style_features,
+            alphas
+        )
+        outputs = [output[i:i + 1] for i in range(len(alphas))]
+    else:
+        session = load_model("adain")
+        style_tensor = prepared_style
+        if style_tensor is None:
+            style_tensor = preprocess_image(style_img, target_size=target_size, normalize=True)
+        outputs = [run_inference(session, content_tensor, style_tensor, alpha, "adain") for alpha in alphas]
+    timer.lap("inference")
+
+    results = [unbucket_output(postprocess_tensor(output, denormalize=True), bucket) for output in outputs]
+    timer.lap("postprocess")
+    return results
+
+def make_tile_runner(
+    style_img: Union[np.ndarray, Image.Image],
+    model_name: str = "adain",
+    alpha: float = 1.0,
+    target_size: tuple = (256, 256)
+) -> TileRunner:
+    """
+    Tạo hàm chạy 1 batch tile content với style dùng chung: style features (staged)
+    hoặc style tensor (graph đầy đủ) chỉ được tính 1 lần cho cả ảnh.
+    """
+    if has_stages(model_name):
+        style_features = get_style_features(style_img, model_name, target_size)
+        encoder = load_model(model_name, stage="encoder")
+        decoder = load_model(model_name, stage="decoder")
+
+        def run_tiles(content_batch: np.ndarray) -> np.ndarray:
+            return run_staged_inference(encoder, decoder, content_batch, style_features, alpha, model_name)
+    else:
+        session = load_model(model_name)
+        normalize = (model_name == "adain")
+        style_tensor = preprocess_image(style_img, target_size=target_size, normalize=normalize)
+
+        def run_tiles(content_batch: np.ndarray) -> np.ndarray:
+            return run_inference_batch(session, content_batch, style_tensor, alpha, model_name)
+
+    return run_tiles
+
+def apply_style_with_features(
+    content_img: Union[np.ndarray, Image.Image],
+    style_features: Dict[str, np.ndarray],
+    model_name: str = "adain",
+    alpha: float = 1.0,
+    channel_order: str = "RGB"
+) -> np.ndarray:
+    """
+    Giống apply_style nhưng dùng style features đã tính sẵn (get_style_features),
+    bỏ qua cả bước hash ảnh style. Cần các file stage encoder/decoder.
+
+    Returns:
+        np.ndarray: Ảnh kết quả đã styled, shape (H, W, C), dtype uint8, cùng channel_order với content
+    """
+    normalize = (model_name == "adain")
+    timer = StageTimer(model_name)
+    content_np, bucket = bucket_content(np.asarray(content_img))
+    fused = use_fused_io(model_name, staged=True)
+    if fused:
+        content_tensor = to_uint8_nhwc(content_np, channel_order=channel_order)
+    else:
+        content_tensor = preprocess_image(
+            content_np, target_size=None, normalize=normalize, channel_order=channel_order, scratch="content"
+        )
+    timer.lap("preprocess")
+
+    output_tensor = run_staged_inference(
+        load_model(model_name, stage="encoder", fused=fused),
+        load_model(model_name, stage="decoder", fused=fused),
         content_tensor,
-        style_tensor,
+        style_features,
         alpha=alpha,
         model_name=model_name
     )
-    
-    result_image = postprocess_tensor(output_tensor, denormalize=normalize)
-    
+    timer.lap("inference")
+    if fused:
+        result_image = from_uint8_nhwc(output_tensor, channel_order=channel_order)
+    else:
+        result_image = postprocess_tensor(output_tensor, denormalize=normalize, channel_order=channel_order)
+    result_image = unbucket_output(result_image, bucket)
+    timer.lap("postprocess")
+    return result_image
+
+def _stack_style_features(features: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {name: np.concatenate([f[name] for f in features], axis=0) for name in features[0]}
+
+def run_style_batch(key: Tuple, items: List[Tuple[np.ndarray, Any]]) -> List[np.ndarray]:
+    """
+    Chạy 1 batch request cùng bucket (model, staged, alpha, shape content, target_size).
+
+    Args:
+        key: Bucket key tạo bởi apply_style_batched
+        items: List (content_tensor, style) với style là style features (staged)
+            hoặc style tensor (graph đầy đủ)
+
+    Returns:
+        List[np.ndarray]: Output tensor shape (1, 3, H, W) cho từng item
+    """
+    model_name, staged, alpha = key[:3]
+    BATCH_SIZE.observe(len(items))
+    timer = StageTimer(model_name)
+    content_batch = np.concatenate([content for content, _ in items], axis=0)
+
+    if staged:
+        output = run_staged_inference(
+            load_model(model_name, stage="encoder"),
+            load_model(model_name, stage="decoder"),
+            content_batch,
+            _stack_style_features([style for _, style in items]),
+            alpha=alpha,
+            model_name=model_name
+        )
+    else:
+        style_batch = np.concatenate([style for _, style in items], axis=0)
+        output = run_inference_batch(load_model(model_name), content_batch, style_batch, alpha, model_name)
+    timer.lap("inference")
+
+    return [output[i:i + 1] for i in range(len(items))]
+
+inference_batcher = create_batcher(run_style_batch, pool=inference_pool)
+
+def _prepare_inputs(
+    content_img: Union[np.ndarray, Image.Image],
+    style_img: Union[np.ndarray, Image.Image],
+    model_name: str,
+    target_size: tuple,
+    prepared_style: Any = None
+) -> Tuple[bool, np.ndarray, Any, Optional[BucketFit]]:
+    normalize = (model_name == "adain")
+    timer = StageTimer(model_name)
+    content_np, bucket = bucket_content(np.asarray(content_img))
+    content_tensor = preprocess_image(content_np, target_size=None, normalize=normalize)
+    timer.lap("preprocess")
+
+    staged = has_stages(model_name)
+    style = prepared_style if prepared_style is not None else prepare_style(style_img, model_name, target_size)
+    timer.lap("style")
+    return staged, content_tensor, style, bucket
+
+def prepare_style(
+    style_img: Union[np.ndarray, Image.Image],
+    model_name: str = "adain",
+    target_size: tuple = (256, 256)
+) -> Any:
+    """
+    Style dạng `prepared_style` cho _prepare_inputs / run_style_batch: style features nếu model
+    đã tách stage, ngược lại style tensor (1, 3, H, W). Dùng khi nhiều ảnh chung 1 style.
+    """
+    if has_stages(model_name):
+        return get_style_features(style_img, model_name, target_size)
+    return preprocess_image(style_img, target_size=target_size, normalize=(model_name == "adain"))
+
+def _finish_output(
+    output_tensor: np.ndarray,
+    normalize: bool,
+    bucket: Optional[BucketFit],
+    model_name: str = ""
+) -> np.ndarray:
+    timer = StageTimer(model_name)
+    result_image = unbucket_output(postprocess_tensor(output_tensor, normalize), bucket)
+    timer.lap("postprocess")
     return result_image
+
+async def apply_style_batched(
+    content_img: Union[np.ndarray, Image.Image],
+    style_img: Union[np.ndarray, Image.Image],
+    model_name: str = "adain",
+    alpha: float = 1.0,
+    target_size: tuple = (256, 256),
+    prepared_style: Any = None
+) -> np.ndarray:
+    """
+    Giống apply_style nhưng inference đi qua `inference_batcher`: các request đồng thời
+    cùng model và cùng kích thước content (cùng bucket nếu bật SHAPE_BUCKETS_ENABLED)
+    được gom thành 1 lần session.run.
+    Preprocess và inference chạy trong `inference_pool` (có thể raise PoolOverloaded/InferenceTimeout),
+    postprocess qua run_light để request đã inference xong không bị từ chối.
+
+    `prepared_style` (vd. từ `style_gallery.get_style`) bỏ qua bước preprocess/encode style:
+    style features nếu model đã tách stage, ngược lại style tensor (1, 3, H, W).
+
+    Ảnh có cạnh dài > config.TILE_MAX_SIDE không qua batcher mà chạy chế độ tile
+    trong 1 job của pool (các tile đã được batch bên trong), timeout theo tiled_timeout.
+    """
+    if model_name not in ["adain", "sanet"]:
+        raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+
+    if needs_tiling(np.asarray(content_img), config.TILE_MAX_SIDE):
+        return await inference_pool.run(
+            apply_style, content_img, style_img, model_name, alpha, target_size,
+            tile_size=config.TILE_SIZE, timeout=tiled_timeout(content_img)
+        )
+
+    staged, content_tensor, style, bucket = await inference_pool.run(
+        _prepare_inputs, content_img, style_img, model_name, target_size, prepared_style
+    )
+
+    key = (model_name, staged, alpha, content_tensor.shape, tuple(target_size))
+    output_tensor = await inference_batcher.submit(key, (content_tensor, style))
+
+    normalize = (model_name == "adain")
+    return await run_light(_finish_output, output_tensor, normalize, bucket, model_name)
+
+def _run_group(
+    key: Tuple,
+    group: List[Tuple[str, np.ndarray, Any, Optional[BucketFit]]]
+) -> Iterator[Tuple[str, Union[np.ndarray, Exception]]]:
+    model_name = key[0]
+    try:
+        outputs = run_style_batch(key, [(tensor, style) for _, tensor, style, _ in group])
+    except Exception as e:
+        for name, *_ in group:
+            yield name, e
+        return
+    for (name, _, _, bucket), output in zip(group, outputs):
+        yield name, _finish_output(output, model_name == "adain", bucket, model_name)
+
+def stylize_stream(
+    items: Iterable[Tuple[str, Any]],
+    load: Callable[[Any], np.ndarray],
+    style_img: Union[np.ndarray, Image.Image],
+    model_name: str = "adain",
+    alpha: float = 1.0,
+    target_size: tuple = (256, 256),
+    prepared_style: Any = None,
+    batch_size: int = 4,
+    max_side: int = 0,
+    prefetch: int = 16,
+    executor: Optional[Executor] = None
+) -> Iterator[Tuple[str, Union[np.ndarray, Exception]]]:
+    """
+    Stylize 1 dòng ảnh chung 1 style theo kiểu pipeline, RAM giới hạn theo `prefetch`:
+    load (decode) + preprocess chạy trước trong `executor` song song với inference, ảnh cùng shape
+    được gom thành batch `batch_size` cho run_style_batch. Style chỉ chuẩn bị 1 lần (prepare_style).
+
+    Args:
+        items: (tên, payload) lấy dần, vd. (tên file trong archive, bytes)
+        load: payload -> ảnh RGB (H, W, 3) uint8, chạy trong executor
+        max_side: Thu nhỏ ảnh có cạnh dài hơn (giữ tỉ lệ), 0 = giữ nguyên.
+            Ảnh còn lớn hơn TILE_MAX_SIDE chạy apply_style theo tile, không batch
+        prefetch: Số ảnh tối đa đang load + chờ gom batch
+        executor: None = tạo thread pool 1 worker riêng cho lần chạy này
+
+    Yields:
+        (tên, ảnh kết quả RGB uint8 hoặc Exception của riêng ảnh đó), theo thứ tự batch chạy xong
+    """
+    if model_name not in ["adain", "sanet"]:
+        raise ValueError(f"model_name phải là 'adain' hoặc 'sanet', nhận được: {model_name}")
+    if prepared_style is None:
+        prepared_style = prepare_style(style_img, model_name, target_size)
+    # prefetch <= 0 thì vòng load không lấy được ảnh nào và stream kết thúc rỗng
+    prefetch = max(1, prefetch)
+
+    def load_one(payload: Any) -> Tuple[np.ndarray, Optional[tuple]]:
+        content = np.asarray(load(payload))
+        if max_side:
+            content, _ = resize_image_keep_aspect(content, max_side)
+        if needs_tiling(content, config.TILE_MAX_SIDE):
+            return content, None
+        return content, _prepare_inputs(content, style_img, model_name, target_size, prepared_style)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stylize-load")
+    items = iter(items)
+    loading: Deque[Tuple[str, Future]] = deque()
+    groups: Dict[Tuple, List[Tuple[str, np.ndarray, Any, Optional[BucketFit]]]] = {}
+    held = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(loading) + held < prefetch:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                name, payload = item
+                loading.append((name, executor.submit(load_one, payload)))
+
+            if not loading:
+                break
+            name, future = loading.popleft()
+            try:
+                content, prepared = future.result()
+            except Exception as e:
+                yield name, e
+                continue
+
+            if prepared is None:
+                try:
+                    result = apply_style(
+                        content, style_img, model_name, alpha, target_size, tile_size=config.TILE_SIZE
+                    )
+                except Exception as e:
+                    result = e
+                yield name, result
+                continue
+
+            staged, content_tensor, style, bucket = prepared
+            key = (model_name, staged, alpha, content_tensor.shape, tuple(target_size))
+            group = groups.setdefault(key, [])
+            group.append((name, content_tensor, style, bucket))
+            held += 1
+            if len(group) < batch_size and held < prefetch:
+                continue
+            # Batch đủ, hoặc hết chỗ chờ: chạy nhóm đông nhất để load tiếp
+            if len(group) < batch_size:
+                key = max(groups, key=lambda k: len(groups[k]))
+            group = groups.pop(key)
+            held -= len(group)
+            yield from _run_group(key, group)
+
+        # Hết input: chạy nốt các nhóm chưa đủ batch
+        for key in list(groups):
+            yield from _run_group(key, groups.pop(key))
+    finally:
+        for _, future in loading:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def warmup_model(
+    model_name: str,
+    shapes: List[Tuple[int, int]],
+    style_img: Optional[np.ndarray] = None,
+    target_size: tuple = (256, 256)
+) -> None:
+    """
+    Load session và chạy thử các đường inference ở từng kích thước content (width, height):
+    apply_style (graph fused nếu có, dùng cho WebSocket) và run_style_batch (REST qua batcher),
+    để request đầu tiên không phải trả chi phí tạo session và cấp phát lần đầu.
+    """
+    rng = np.random.default_rng(0)
+    if style_img is None:
+        style_img = rng.integers(0, 256, (target_size[1], target_size[0], 3), dtype=np.uint8)
+    for width, height in shapes:
+        content = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        apply_style(content, style_img, model_name, target_size=target_size)
+        staged, content_tensor, style, _ = _prepare_inputs(content, style_img, model_name, target_size)
+        run_style_batch((model_name, staged, 1.0), [(content_tensor, style)])
@@ -0,0 +1,154 @@
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.preprocess import hwc_to_nchw, postprocess_tensor, scratch_buffer
+
+# (batch, 3, h, w) -> (batch, 3, h, w)
+TileRunner = Callable[[np.ndarray], np.ndarray]
+
+def tile_positions(length: int, tile: int, overlap: int) -> List[int]:
+    """
+    Vị trí bắt đầu các tile trên 1 trục; tile cuối được dồn về sát mép
+    để mọi tile có cùng kích thước (batch được).
+    """
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    positions = list(range(0, length - tile, stride))
+    positions.append(length - tile)
+    return positions
+
+def _ramp(length: int, overlap: int, start: bool, end: bool) -> np.ndarray:
+    weights = np.ones(length, dtype=np.float32)
+    if overlap <= 0:
+        return weights
+    ramp = (np.arange(overlap, dtype=np.float32) + 0.5) / overlap
+    n = min(overlap, length)
+    if start:
+        weights[:n] = np.minimum(weights[:n], ramp[:n])
+    if end:
+        weights[-n:] = np.minimum(weights[-n:], ramp[:n][::-1])
+    return weights
+
+def feather_mask(
+    tile_h: int,
+    tile_w: int,
+    overlap: int,
+    top: bool,
+    bottom: bool,
+    left: bool,
+    right: bool
+) -> np.ndarray:
+    """
+    Mask trọng số (tile_h, tile_w, 1) giảm tuyến tính trong vùng overlap ở các cạnh
+    có tile kề bên, luôn > 0 nên chia theo tổng trọng số không bị chia cho 0.
+    """
+    wy = _ramp(tile_h, overlap, top, bottom)
+    wx = _ramp(tile_w, overlap, left, right)
+    return (wy[:, None] * wx[None, :])[..., None]
+
+def stylize_tiled(
+    content_np: np.ndarray,
+    run_tiles: TileRunner,
+    tile_size: int = 512,
+    overlap: int = 32,
+    batch_size: int = 4,
+    normalize: bool = True,
+    channel_order: str = "RGB"
+) -> np.ndarray:
+    """
+    Stylize ảnh lớn theo từng tile có overlap rồi feather lại.
+
+    Bộ nhớ bị chặn theo tile: mỗi lần chỉ preprocess/inference `batch_size` tile, và ảnh
+    kết quả được ghép theo dải hàng (tối đa ~2 hàng tile ở dạng float32 cùng lúc).
+
+    Args:
+        content_np: Ảnh content uint8, shape (H, W, 3)
+        run_tiles: Hàm chạy model cho 1 batch tile tensor (style features dùng chung)
+        tile_size: Cạnh tile (nên là bội số của 16 cho SANet)
+        overlap: Số pixel overlap giữa 2 tile kề nhau
+        batch_size: Số tile mỗi lần session.run
+        normalize: Content/output có dùng ImageNet normalize không (AdaIN)
+        channel_order: Thứ tự kênh của content và kết quả
+
+    Returns:
+        np.ndarray: Ảnh kết quả uint8, shape (H, W, 3)
+    """
+    if overlap * 2 >= tile_size:
+        raise ValueError(f"overlap ({overlap}) phải nhỏ hơn tile_size / 2 ({tile_size})")
+
+    height, width = content_np.shape[:2]
+    tile_h, tile_w = min(tile_size, height), min(tile_size, width)
+    ys = tile_positions(height, tile_h, overlap)
+    xs = tile_positions(width, tile_w, overlap)
+
+    output = np.empty((height, width, 3), dtype=np.uint8)
+    # Tile được ghi thẳng vào batch buffer, không qua tensor riêng + concatenate
+    batch_buffer = scratch_buffer("tiles", (batch_size, 3, tile_h, tile_w))
+
+    # Dải hàng đang ghép: ảnh [band_top, band_top + len(band_acc))
+    band_top = 0
+    band_acc = np.zeros((0, width, 3), dtype=np.float32)
+    band_weight = np.zeros((0, width, 1), dtype=np.float32)
+
+    for row, y0 in enumerate(ys):
+        y1 = y0 + tile_h
+        band_bottom = band_top + band_acc.shape[0]
+        if y1 > band_bottom:
+            extra = y1 - band_bottom
+            band_acc = np.concatenate([band_acc, np.zeros((extra, width, 3), np.float32)])
+            band_weight = np.concatenate([band_weight, np.zeros((extra, width, 1), np.float32)])
+
+        tiles = [(y0, x0) for x0 in xs]
+        for start in range(0, len(tiles), batch_size):
+            chunk = tiles[start:start + batch_size]
+            batch = batch_buffer[:len(chunk)]
+            for i, (ty, tx) in enumerate(chunk):
+                hwc_to_nchw(
+                    content_np[ty:ty + tile_h, tx:tx + tile_w],
+                    normalize=normalize, channel_order=channel_order, out=batch[i:i + 1]
+                )
+            outputs = run_tiles(batch)
+
+            for i, (ty, tx) in enumerate(chunk):
+                tile = postprocess_tensor(outputs[i:i + 1], denormalize=normalize, channel_order=channel_order)
+                if tile.shape[:2] != (tile_h, tile_w):
+                    # Model làm tròn kích thước theo bội số của 8
+                    tile = cv2.resize(tile, (tile_w, tile_h), interpolation=cv2.INTER_LINEAR)
+                mask = feather_mask(
+                    tile_h, tile_w, overlap,
+                    top=ty > 0, bottom=ty + tile_h < height,
+                    left=tx > 0, right=tx + tile_w < width
+                )
+                rows = slice(ty - band_top, ty - band_top + tile_h)
+                band_acc[rows, tx:tx + tile_w] += tile.astype(np.float32) * mask
+                band_weight[rows, tx:tx + tile_w] += mask
+
+        # Các hàng phía trên tile row kế tiếp sẽ không còn tile nào ghi vào nữa
+        done_until = ys[row + 1] if row + 1 < len(ys) else height
+        n_done = done_until - band_top
+        output[band_top:done_until] = np.clip(
+            band_acc[:n_done] / band_weight[:n_done] + 0.5, 0, 255
+        ).astype(np.uint8)
+        band_acc = band_acc[n_done:].copy()
+        band_weight = band_weight[n_done:].copy()
+        band_top = done_until
+
+    return output
+
+def needs_tiling(content_np: np.ndarray, tile_size: Optional[int]) -> bool:
+    return tile_size is not None and max(content_np.shape[:2]) > tile_size
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: int) -> Tuple[int, int]:
+    """Số tile theo (hàng, cột)."""
+    return (
+        len(tile_positions(height, min(tile_size, height), overlap)),
+        len(tile_positions(width, min(tile_size, width), overlap)),
+    )
+
+def tile_batches(height: int, width: int, tile_size: int, overlap: int, batch_size: int) -> int:
+    """Số lần run_tiles của stylize_tiled (mỗi hàng tile chia thành các batch riêng)."""
+    rows, cols = tile_grid(height, width, tile_size, overlap)
+    return rows * -(-cols // batch_size)
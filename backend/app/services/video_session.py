@@ -0,0 +1,204 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.models.loader import has_stages
+from app.services.executor import inference_pool, PoolOverloaded
+from app.services.governor import FrameGovernor, fit_size
+from app.services.metrics import WS_FRAME_SECONDS, WS_FRAMES
+from app.services.style_gallery import style_gallery
+from app.services.style_transfer import get_style_features
+from app.utils import decode_frame, encode_frame, style_transfer_ndarray
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+def stylize_frame(
+    frame_bytes: bytes,
+    style_np: np.ndarray,
+    style_features: Optional[Dict[str, np.ndarray]],
+    model_name: str = "adain",
+    alpha: float = 1.0,
+    max_side: Optional[int] = None
+) -> Tuple[bytes, float]:
+    """
+    Stylize 1 frame JPEG (chạy trong inference pool, hàm module-level để picklable).
+
+    Chỉ 1 lần decode và 1 lần encode mỗi frame: frame BGR từ cv2 đi thẳng vào tensor
+    (đảo kênh trong preprocess) và kết quả BGR đi thẳng vào cv2.imencode.
+
+    Args:
+        max_side: Cạnh dài tối đa khi inference (do FrameGovernor chọn), None = giữ nguyên
+
+    Returns:
+        Tuple[bytes, float]: (JPEG kết quả, thời gian xử lý trong worker tính bằng giây)
+    """
+    start = time.perf_counter()
+    frame_bgr = decode_frame(frame_bytes)
+
+    size = fit_size(frame_bgr.shape[0], frame_bgr.shape[1], max_side)
+    if size is not None:
+        frame_bgr = cv2.resize(frame_bgr, size, interpolation=cv2.INTER_AREA)
+
+    result_bgr = style_transfer_ndarray(
+        frame_bgr, style_np, model_name, alpha, style_features=style_features, channel_order="BGR"
+    )
+    output_bytes = encode_frame(result_bgr)
+    return output_bytes, time.perf_counter() - start
+
+class VideoSession:
+    """
+    Trạng thái riêng của 1 WebSocket video connection: style, style features đã tính sẵn,
+    slot frame mới nhất, governor FPS/độ phân giải và task xử lý đang chạy.
+
+    Mỗi session chỉ có tối đa 1 job trong inference pool, frame đến khi đang bận sẽ ghi đè
+    slot `latest_frame` (chỉ xử lý frame mới nhất). Nhờ vậy pool dùng chung được chia đều
+    giữa các connection thay vì bị 1 client chiếm hết.
+    """
+
+    def __init__(
+        self,
+        send_bytes: Callable[[bytes], Awaitable[None]],
+        style_np: np.ndarray,
+        model_name: str = "adain",
+        alpha: float = 1.0,
+        session_id: Optional[str] = None,
+        send_json: Optional[Callable[[Any], Awaitable[None]]] = None,
+        governor: Optional[FrameGovernor] = None,
+        style_id: Optional[str] = None
+    ):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.send_bytes = send_bytes
+        self.send_json = send_json
+        self.style_np = style_np
+        self.model_name = model_name
+        self.alpha = alpha
+        # Style trong gallery: style features lấy từ style_gallery (đã tính sẵn lúc khởi động)
+        self.style_id = style_id
+        self.style_features: Optional[Dict[str, np.ndarray]] = None
+
+        self.governor = governor or FrameGovernor()
+        # (frame bytes, thời điểm nhận)
+        self.latest_frame: Optional[Tuple[bytes, float]] = None
+        self.task: Optional[asyncio.Task] = None
+
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    async def prepare(self) -> None:
+        """
+        Tính style features 1 lần cho cả session (nếu model đã được tách stage)
+        và gửi thiết lập ban đầu cho client.
+        """
+        if has_stages(self.model_name):
+            try:
+                if self.style_id is not None:
+                    self.style_features = await inference_pool.run(
+                        style_gallery.get_features, self.style_id, self.model_name
+                    )
+                else:
+                    self.style_features = await inference_pool.run(
+                        get_style_features, self.style_np, self.model_name
+                    )
+            except Exception as e:
+                # Không chặn session: frame sẽ đi đường apply_style (style cache vẫn áp dụng)
+                logger.warning(
+                    f"⚠ Cannot precompute style features: {e}", extra={"session": self.session_id[:8]}
+                )
+
+        await self._send_settings()
+
+    def submit_frame(self, frame_bytes: bytes) -> None:
+        """
+        Nhận frame từ client: áp giới hạn FPS của governor, giữ frame mới nhất và khởi động task xử lý.
+        """
+        self.frames_received += 1
+        WS_FRAMES.inc(model=self.model_name, status="received")
+
+        now = time.monotonic()
+        if not self.governor.accept(now):
+            self.frames_dropped += 1  # skip frame (too soon)
+            WS_FRAMES.inc(model=self.model_name, status="dropped_rate")
+            return
+
+        if self.latest_frame is not None:
+            self.frames_dropped += 1  # frame cũ chưa kịp xử lý bị thay thế
+            WS_FRAMES.inc(model=self.model_name, status="dropped_stale")
+        self.latest_frame = (frame_bytes, now)
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._process_loop())
+
+    async def _process_loop(self) -> None:
+        """Process newest frame only, skip old frames."""
+        while self.latest_frame is not None:
+            frame_bytes, received_at = self.latest_frame
+            self.latest_frame = None
+
+            try:
+                output_bytes, inference_s = await inference_pool.run(
+                    stylize_frame,
+                    frame_bytes,
+                    self.style_np,
+                    self.style_features,
+                    self.model_name,
+                    self.alpha,
+                    self.governor.max_side
+                )
+            except PoolOverloaded:
+                # Pool đầy -> bỏ frame này, chờ frame mới hơn
+                self.frames_dropped += 1
+                WS_FRAMES.inc(model=self.model_name, status="dropped_overloaded")
+                continue
+            except Exception as e:
+                logger.error(f"❌ Style transfer error: {e}", extra={"session": self.session_id[:8]})
+                self.frames_dropped += 1
+                WS_FRAMES.inc(model=self.model_name, status="error")
+                continue
+
+            try:
+                await self.send_bytes(output_bytes)
+            except Exception:
+                # Connection đã đóng
+                self.latest_frame = None
+                return
+            self.frames_processed += 1
+            WS_FRAMES.inc(model=self.model_name, status="processed")
+            WS_FRAME_SECONDS.observe(time.monotonic() - received_at, model=self.model_name)
+
+            if self.governor.record(inference_s, time.monotonic() - received_at):
+                await self._send_settings()
+
+    async def _send_settings(self) -> None:
+        if self.send_json is None:
+            return
+        try:
+            await self.send_json(self.governor.settings())
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        self.latest_frame = None
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        settings = self.governor.settings()
+        settings.pop("type")
+        return {
+            "session_id": self.session_id,
+            "model": self.model_name,
+            "frames_received": self.frames_received,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            **settings,
+        }
@@ -1,42 +1,210 @@
 import io
+from typing import Dict, List, Optional, Tuple
 from PIL import Image
+import cv2
 import numpy as np
-from app.services.style_transfer import apply_style
+from app.services.style_transfer import (
+    apply_style, apply_style_batched, apply_style_with_features, apply_style_alpha_sweep, tiled_timeout
+)
+from app.services.executor import inference_pool, run_light
+from app.services.style_gallery import style_gallery
+from app.services.result_cache import result_cache, make_result_key, make_result_keys
+from app.services.metrics import STYLE_REQUESTS, StageTimer
+from app.logger import get_logger
 from app import config
 import os
 
-def style_transfer_bytes(content_bytes: bytes, style_bytes: bytes, model_name: str = "adain") -> bytes:
-
-    if not content_bytes:
-        raise ValueError("Empty content_bytes")
-    if not style_bytes:
-        raise ValueError("Empty style_bytes")
-    try:
-        content_img = Image.open(io.BytesIO(content_bytes)).convert("RGB")
-    except Exception as e:
-        print("❌ Cannot decode content image:", e)
-        raise ValueError("Invalid content image bytes") from e
+logger = get_logger(__name__)
 
+def decode_image_bytes(image_bytes: bytes, name: str = "content") -> np.ndarray:
+    """
+    Decode bytes ảnh thành numpy array RGB uint8, shape (H, W, 3).
+    """
+    if not image_bytes:
+        raise ValueError(f"Empty {name}_bytes")
+    timer = StageTimer()
     try:
-        style_img = Image.open(io.BytesIO(style_bytes)).convert("RGB")
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
     except Exception as e:
-        print("❌ Cannot decode style image:", e)
-        raise ValueError("Invalid style image bytes") from e
-
-    content_np = np.asarray(content_img, dtype=np.uint8)
-    style_np = np.asarray(style_img, dtype=np.uint8)
-
-    result_np = apply_style(content_np, style_np, model_name)
+        logger.warning(f"❌ Cannot decode {name} image: {e}", extra={"image": name, "bytes": len(image_bytes)})
+        raise ValueError(f"Invalid {name} image bytes") from e
+    image_np = np.asarray(image, dtype=np.uint8)
+    timer.lap("decode")
+    return image_np
 
+def encode_result(result_np: np.ndarray) -> bytes:
+    """
+    Encode ảnh kết quả (H, W, 3) uint8 thành JPEG.
+    """
     # Bảo vệ output
     if not isinstance(result_np, np.ndarray):
         raise TypeError("apply_style must return numpy ndarray")
     if result_np.dtype != np.uint8:
         result_np = result_np.astype(np.uint8)
 
+    timer = StageTimer()
     result_pil = Image.fromarray(result_np)
 
     buffer = io.BytesIO()
     result_pil.save(buffer, format="JPEG", quality=95)
+    timer.lap("encode")
     return buffer.getvalue()
 
+def decode_frame(frame_bytes: bytes) -> np.ndarray:
+    """
+    Decode frame JPEG/PNG bằng OpenCV, trả về ảnh BGR uint8 shape (H, W, 3).
+    """
+    if not frame_bytes:
+        raise ValueError("Empty frame_bytes")
+    timer = StageTimer()
+    frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Invalid frame bytes")
+    timer.lap("decode")
+    return frame
+
+def encode_frame(frame_bgr: np.ndarray, quality: int = config.WS_JPEG_QUALITY) -> bytes:
+    """
+    Encode ảnh BGR uint8 thành JPEG bằng OpenCV.
+    """
+    timer = StageTimer()
+    ok, buffer = cv2.imencode(".jpg", frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Cannot encode frame")
+    timer.lap("encode")
+    return buffer.tobytes()
+
+def style_transfer_ndarray(
+    content_np: np.ndarray,
+    style_np: np.ndarray,
+    model_name: str = "adain",
+    alpha: float = 1.0,
+    style_features: Optional[Dict[str, np.ndarray]] = None,
+    channel_order: str = "BGR"
+) -> np.ndarray:
+    """
+    Entry point mức ndarray: frame đã decode -> tensor -> ảnh kết quả cùng channel_order,
+    không qua encode/decode trung gian. Mặc định BGR để dùng thẳng với cv2.imdecode/imencode.
+
+    Args:
+        content_np: Frame đã decode, shape (H, W, 3), dtype uint8
+        style_np: Ảnh style RGB, shape (H, W, 3), dtype uint8
+        style_features: Style features tính sẵn (get_style_features), nếu có sẽ bỏ qua style_np
+        channel_order: Thứ tự kênh của content_np và kết quả: "BGR" hoặc "RGB"
+    """
+    if style_features is not None:
+        return apply_style_with_features(content_np, style_features, model_name, alpha, channel_order=channel_order)
+    return apply_style(content_np, style_np, model_name, alpha, channel_order=channel_order)
+
+def style_transfer_bytes(content_bytes: bytes, style_bytes: bytes, model_name: str = "adain") -> bytes:
+
+    content_np = decode_image_bytes(content_bytes, "content")
+    style_np = decode_image_bytes(style_bytes, "style")
+
+    result_np = apply_style(content_np, style_np, model_name)
+
+    return encode_result(result_np)
+
+async def style_transfer_bytes_async(
+    content_bytes: bytes,
+    style_bytes: Optional[bytes],
+    model_name: str = "adain",
+    style_id: Optional[str] = None,
+    alpha: float = 1.0,
+    if_none_match: Optional[str] = None
+) -> Tuple[Optional[bytes], str]:
+    """
+    Bản async của style_transfer_bytes: decode/encode, hash key và result cache chạy qua run_light,
+    chỉ phần chạy model chiếm inference_pool; inference đi qua micro-batcher (xem services/batching.py).
+
+    Nếu có `style_id` (style trong gallery) thì bỏ qua style_bytes: ảnh style và
+    style features đã được chuẩn bị sẵn lúc khởi động (xem services/style_gallery.py).
+
+    Kết quả được cache theo make_result_key (services/result_cache.py), key cũng là ETag.
+
+    Returns:
+        Tuple[Optional[bytes], str]: (JPEG kết quả, ETag). JPEG là None nếu `if_none_match`
+        (header If-None-Match) đã chứa ETag này, tức client đang có đúng kết quả.
+    """
+    content_np = await run_light(decode_image_bytes, content_bytes, "content")
+
+    if style_id is not None:
+        if style_id not in style_gallery:
+            raise KeyError(style_id)
+        style_np = await run_light(style_gallery.get_image, style_id)
+    else:
+        style_np = await run_light(decode_image_bytes, style_bytes, "style")
+
+    key = await run_light(make_result_key, content_np, style_np, model_name, alpha)
+    etag = f'"{key}"'
+    if if_none_match and etag in if_none_match:
+        STYLE_REQUESTS.inc(endpoint="image", model=model_name, result="not_modified")
+        return None, etag
+
+    if config.RESULT_CACHE_ENABLED:
+        cached = await run_light(result_cache.get, key)
+        if cached is not None:
+            STYLE_REQUESTS.inc(endpoint="image", model=model_name, result="cached")
+            return cached, etag
+
+    prepared_style = None
+    if style_id is not None:
+        # Style gallery chưa warmup thì get_style chạy encoder -> cần slot của pool
+        prepared_style = await inference_pool.run(style_gallery.get_style, style_id, model_name)
+    result_np = await apply_style_batched(
+        content_np, style_np, model_name, alpha, prepared_style=prepared_style
+    )
+    result_bytes = await run_light(encode_result, result_np)
+
+    if config.RESULT_CACHE_ENABLED:
+        await run_light(result_cache.put, key, result_bytes)
+    STYLE_REQUESTS.inc(endpoint="image", model=model_name, result="computed")
+    return result_bytes, etag
+
+async def style_transfer_sweep_async(
+    content_bytes: bytes,
+    style_bytes: Optional[bytes],
+    alphas: List[float],
+    style_id: Optional[str] = None
+) -> List[Tuple[bytes, str]]:
+    """
+    Nhiều alpha cho cùng 1 cặp content/style (AdaIN): alpha nào đã có trong result cache
+    thì lấy ra, các alpha còn lại chạy chung 1 lần apply_style_alpha_sweep trong inference_pool
+    (các bước còn lại qua run_light như style_transfer_bytes_async).
+
+    Returns:
+        List[Tuple[bytes, str]]: (JPEG kết quả, ETag) theo thứ tự alphas
+    """
+    content_np = await run_light(decode_image_bytes, content_bytes, "content")
+
+    if style_id is not None:
+        if style_id not in style_gallery:
+            raise KeyError(style_id)
+        style_np = await run_light(style_gallery.get_image, style_id)
+    else:
+        style_np = await run_light(decode_image_bytes, style_bytes, "style")
+
+    keys = await run_light(make_result_keys, content_np, style_np, "adain", alphas)
+    results: List[Optional[bytes]] = [None] * len(alphas)
+    if config.RESULT_CACHE_ENABLED:
+        for i, key in enumerate(keys):
+            results[i] = await run_light(result_cache.get, key)
+
+    missing = [i for i, data in enumerate(results) if data is None]
+    STYLE_REQUESTS.inc(len(alphas) - len(missing), endpoint="sweep", model="adain", result="cached")
+    STYLE_REQUESTS.inc(len(missing), endpoint="sweep", model="adain", result="computed")
+    if missing:
+        prepared_style = None
+        if style_id is not None:
+            prepared_style = await inference_pool.run(style_gallery.get_style, style_id, "adain")
+        # Ảnh cần tile: mỗi alpha chạy lại toàn bộ tile trong cùng 1 job
+        images = await inference_pool.run(
+            apply_style_alpha_sweep, content_np, style_np, [alphas[i] for i in missing],
+            prepared_style=prepared_style, timeout=tiled_timeout(content_np, runs=len(missing))
+        )
+        for i, image in zip(missing, images):
+            results[i] = await run_light(encode_result, image)
+            if config.RESULT_CACHE_ENABLED:
+                await run_light(result_cache.put, keys[i], results[i])
+
+    return [(data, f'"{key}"') for data, key in zip(results, keys)]
@@ -1,2 +1,14 @@
 #!/bin/bash
+# ./run.sh       : dev, auto reload
+# ./run.sh prod  : production, không reload, WEB_CONCURRENCY worker (mặc định 1).
+#                  Mỗi worker tự load + warmup model, /readyz trả 200 khi xong.
+if [ "$1" = "prod" ]; then
+    export WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+    if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+        # Nhiều worker chung CPU: thread ORT rảnh không spin
+        export ORT_ALLOW_SPINNING=${ORT_ALLOW_SPINNING:-0}
+    fi
+    exec uvicorn app.main:app --host "${HOST:-0.0.0.0}" --port "${PORT:-8000}" \
+        --workers "$WEB_CONCURRENCY" --timeout-graceful-shutdown 30
+fi
 uvicorn app.main:app --reload --host localhost --port 8000
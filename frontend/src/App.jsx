@@ -154,10 +154,11 @@ function App() {
         fd.append("style_image", styleBlob);
 
         fd.append("model", model);
-        await fetch("/ws/set", { method: "POST", body: fd });
+        const setRes = await fetch("/ws/set", { method: "POST", body: fd });
+        const { session_id } = await setRes.json();
         // WebSocket streaming
         setProgress("Connecting to WebSocket...");
-        wsRef.current = new WebSocket("/ws/video");
+        wsRef.current = new WebSocket(`/ws/video?session_id=${session_id}`);
         wsRef.current.binaryType = "arraybuffer";
         wsRef.current.onopen = () => {
           console.log("WebSocket connected");
@@ -165,6 +166,16 @@ function App() {
         };
 
         wsRef.current.onmessage = (event) => {
+          // Control message (JSON) từ server: thiết lập FPS / độ phân giải hiện tại
+          if (typeof event.data === "string") {
+            const msg = JSON.parse(event.data);
+            if (msg.type === "settings") {
+              setProgress(`Streaming frames... (${msg.fps} FPS, max ${msg.max_side ?? "full"}px)`);
+            } else if (msg.type === "error") {
+              setProgress("Error: " + msg.detail);
+            }
+            return;
+          }
           const blob = new Blob([event.data], { type: "image/jpeg" });
           const url = URL.createObjectURL(blob);
           setResult(url);
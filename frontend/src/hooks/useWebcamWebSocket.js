@@ -11,6 +11,8 @@ export function useWebcamWebSocket(url, onFrame) {
 
     wsRef.current.onopen = () => console.log("WS connected");
     wsRef.current.onmessage = (event) => {
+      // Bỏ qua control message (JSON), chỉ xử lý frame ảnh
+      if (typeof event.data === "string") return;
       const blob = event.data;
       if (onFrame) onFrame(blob);  // callback để update canvas
     };
@@ -1,5 +1,6 @@
 from .adain import AdaINet, VGGEncoder, Decoder, VGGEncoderMultiLayer, AdaINLossMultiLayer
-from .sanet import Net as SANetModel, SANet, Transform, create_sanet_model, style_transfer_sanet, decoder, vgg
+from .sanet import (Net as SANetModel, SANet, Transform, SANetForTraining, SANetLoss,
+                    create_sanet_model, style_transfer_sanet, decoder, vgg)
 
 __all__ = [
     'AdaINet',
@@ -10,6 +11,8 @@ __all__ = [
     'SANetModel',
     'SANet',
     'Transform',
+    'SANetForTraining',
+    'SANetLoss',
     'create_sanet_model',
     'style_transfer_sanet',
     'decoder',
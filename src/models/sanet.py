@@ -1,3 +1,4 @@
+import os
 import torch
 import torch.nn as nn
 
@@ -183,7 +184,7 @@ class Net(nn.Module):
         target_mean, target_std = calc_mean_std(target)
         return self.mse_loss(input_mean, target_mean) + self.mse_loss(input_std, target_std)
     
-    def forward(self, content, style):
+    def forward(self, content, style, return_output=False):
         style_feats = self.encode_with_intermediate(style)
         content_feats = self.encode_with_intermediate(content)
         stylized = self.transform(content_feats[3], style_feats[3], content_feats[4], style_feats[4])
@@ -207,8 +208,54 @@ class Net(nn.Module):
         for i in range(1, 5):
             l_identity2 += self.calc_content_loss(Fcc[i], content_feats[i]) + self.calc_content_loss(Fss[i], style_feats[i])
         
+        if return_output:
+            return g_t, (loss_c, loss_s, l_identity1, l_identity2)
         return loss_c, loss_s, l_identity1, l_identity2
 
+class SANetForTraining(nn.Module):
+    """Bọc Net để dùng chung train_model: forward trả (ảnh sinh ra, các loss)."""
+    def __init__(self, network):
+        super(SANetForTraining, self).__init__()
+        self.network = network
+
+    def forward(self, content, style):
+        return self.network(content, style, return_output=True)
+
+    def checkpoint_state_dict(self):
+        """Chỉ lưu phần được train (bỏ VGG encoder đã freeze), cùng key với checkpoint của notebook."""
+        return {
+            'decoder': self.network.decoder.state_dict(),
+            'transform': self.network.transform.state_dict()
+        }
+
+    def load_checkpoint_state_dict(self, state):
+        self.network.decoder.load_state_dict(state['decoder'])
+        self.network.transform.load_state_dict(state['transform'])
+
+    def save_best(self, save_dir):
+        """Lưu weight tốt nhất theo đường dẫn mà config TESTING / notebook đọc."""
+        decoder_path = os.path.join(save_dir, "decoder_best.pth")
+        transform_path = os.path.join(save_dir, "transformer_best.pth")
+        torch.save(self.network.decoder.state_dict(), decoder_path)
+        torch.save(self.network.transform.state_dict(), transform_path)
+        return [decoder_path, transform_path]
+
+class SANetLoss(nn.Module):
+    """Gộp 4 loss của Net theo trọng số, cùng interface với AdaINLossMultiLayer."""
+    def __init__(self, content_weight=1.0, style_weight=3.0, identity_weight_1=50.0, identity_weight_2=1.0):
+        super(SANetLoss, self).__init__()
+        self.content_weight = content_weight
+        self.style_weight = style_weight
+        self.identity_weight_1 = identity_weight_1
+        self.identity_weight_2 = identity_weight_2
+
+    def forward(self, generated, losses, style):
+        loss_c, loss_s, l_identity1, l_identity2 = losses
+        c_loss = self.content_weight * loss_c
+        s_loss = self.style_weight * loss_s
+        total = c_loss + s_loss + self.identity_weight_1 * l_identity1 + self.identity_weight_2 * l_identity2
+        return total, c_loss, s_loss
+
 def create_sanet_model(vgg_path, device='cuda'):
     vgg_model = vgg
     vgg_model.load_state_dict(torch.load(vgg_path, map_location=device))
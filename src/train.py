@@ -0,0 +1,169 @@
+"""
+Train AdaINet / SANet từ file config, chạy một process hoặc phân tán bằng torchrun.
+
+    cd src
+    python train.py --config configs/adain_config.yaml
+    torchrun --nproc_per_node=4 train.py --config configs/adain_config.yaml
+
+    # Nhiều node (chạy lệnh trên từng node với node_rank tương ứng)
+    torchrun --nnodes=2 --node_rank=0 --nproc_per_node=8 \\
+        --master_addr=10.0.0.1 --master_port=29500 \\
+        train.py --config configs/sanet_config.yaml
+
+    # Không có GPU: DDP backend gloo trên CPU
+    torchrun --nproc_per_node=2 train.py --config configs/adain_config.yaml --backend gloo --epochs 1
+"""
+import argparse
+import math
+import os
+import yaml
+import torch
+from models import (AdaINet, VGGEncoderMultiLayer, AdaINLossMultiLayer,
+                    SANetForTraining, SANetLoss, create_sanet_model)
+from utils.data_utils import get_dataloaders, BatchAugment
+from utils.train_utils import train_model, setup_distributed, cleanup_distributed, is_main_process
+
+
+def build_adain(cfg, device):
+    model_cfg = cfg["MODEL"]
+    loss_cfg = cfg["TRAINING"]["LOSS"]
+
+    model = AdaINet(
+        path_vgg_weights=model_cfg["VGG_WEIGHTS_PATH"],
+        out_channels=model_cfg["OUT_CHANNELS"],
+        device=device
+    ).to(device)
+    criterion = AdaINLossMultiLayer(
+        VGGEncoderMultiLayer(path_vgg_weights=model_cfg["VGG_WEIGHTS_PATH"], device=device),
+        alpha=float(loss_cfg["ALPHA"]),
+        beta=float(loss_cfg["BETA"]),
+        eps=float(loss_cfg["EPSILON"])
+    )
+    # Encoder VGG đã freeze, chỉ train decoder
+    optimizer = torch.optim.Adam(
+        [p for p in model.parameters() if p.requires_grad],
+        lr=float(cfg["TRAINING"]["LEARNING_RATE"])
+    )
+    return model, criterion, optimizer, None
+
+
+def build_sanet(cfg, device):
+    train_cfg = cfg["TRAINING"]
+    loss_cfg = train_cfg["LOSS"]
+
+    network = create_sanet_model(cfg["MODEL"]["VGG_WEIGHTS_PATH"], device=device)
+    model = SANetForTraining(network)
+    criterion = SANetLoss(
+        content_weight=float(loss_cfg["CONTENT_WEIGHT"]),
+        style_weight=float(loss_cfg["STYLE_WEIGHT"]),
+        identity_weight_1=float(loss_cfg["IDENTITY_WEIGHT_1"]),
+        identity_weight_2=float(loss_cfg["IDENTITY_WEIGHT_2"])
+    )
+    optimizer = torch.optim.Adam([
+        {'params': network.decoder.parameters()},
+        {'params': network.transform.parameters()}
+    ], lr=float(train_cfg["LEARNING_RATE"]))
+
+    # Giảm LR theo số iteration như notebook: lr / (1 + decay * iter)
+    lr_decay = float(train_cfg.get("LR_DECAY", 0.0))
+    scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lambda it: 1.0 / (1.0 + lr_decay * it))
+    return model, criterion, optimizer, scheduler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train AdaINet / SANet (hỗ trợ torchrun + DDP)")
+    parser.add_argument("--config", required=True, help="File YAML trong configs/")
+    parser.add_argument("--model", choices=["adain", "sanet"], default=None,
+                        help="Mặc định suy ra từ config (có MODEL.IN_PLANES là sanet)")
+    parser.add_argument("--backend", default=None, help="nccl | gloo (mặc định: nccl nếu có CUDA)")
+    parser.add_argument("--device", default=None, help="Ghi đè MODEL.DEVICE khi chạy một process")
+    parser.add_argument("--content-dir", default=None, help="Ghi đè DATA.CONTENT_DIR")
+    parser.add_argument("--style-dir", default=None, help="Ghi đè DATA.STYLE_DIR")
+    parser.add_argument("--save-dir", default=None, help="Ghi đè TRAINING.SAVE_DIR")
+    parser.add_argument("--epochs", type=int, default=None, help="Ghi đè số epoch")
+    parser.add_argument("--batch-size", type=int, default=None, help="Batch mỗi rank, ghi đè DATALOADER.BATCH_SIZE")
+    parser.add_argument("--num-workers", type=int, default=None, help="Ghi đè DATALOADER.NUM_WORKERS")
+    parser.add_argument("--seed", type=int, default=2025, help="Seed cho sampler, ghép style và khởi tạo model")
+    parser.add_argument("--packed", action="store_true", help="Thư mục dữ liệu là shard của pack_image_folder")
+    parser.add_argument("--gpu-augment", action="store_true", help="Worker trả uint8, augment theo batch trên device")
+    parser.add_argument("--amp", action="store_true")
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--compile", action="store_true")
+    parser.add_argument("--grad-accum", type=int, default=1)
+    parser.add_argument("--log-every", type=int, default=50)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.config) as f:
+        cfg = yaml.safe_load(f)
+    model_name = args.model or ("sanet" if "IN_PLANES" in cfg["MODEL"] else "adain")
+
+    # torchrun đặt WORLD_SIZE; chạy python train.py thường thì là một process
+    distributed = int(os.environ.get("WORLD_SIZE", 1)) > 1
+    if distributed:
+        _, world_size, device = setup_distributed(args.backend)
+    else:
+        world_size = 1
+        device = torch.device(args.device or cfg["MODEL"]["DEVICE"])
+        if device.type == "cuda" and not torch.cuda.is_available():
+            device = torch.device("cpu")
+    torch.manual_seed(args.seed)
+
+    data_cfg = cfg["DATA"]
+    transform_cfg = data_cfg["TRANSFORM"]
+    loader_cfg = data_cfg["DATALOADER"]
+    use_normalize = transform_cfg.get("USE_NORMALIZE", True)
+
+    loaders = get_dataloaders(
+        content_folder=args.content_dir or data_cfg["CONTENT_DIR"],
+        style_folder=args.style_dir or data_cfg["STYLE_DIR"],
+        batch_size=args.batch_size or loader_cfg["BATCH_SIZE"],
+        num_workers=args.num_workers if args.num_workers is not None else loader_cfg["NUM_WORKERS"],
+        gray_ratio=transform_cfg["GRAY_RATIO"],
+        target_long=transform_cfg["TARGET_LONG"],
+        min_short=transform_cfg["MIN_SHORT"],
+        crop_size=transform_cfg["CROP_SIZE"],
+        packed=args.packed,
+        gpu_augment=args.gpu_augment,
+        use_normalize=use_normalize,
+        distributed=distributed,
+        seed=args.seed
+    )
+    augment = None
+    if args.gpu_augment:
+        augment = BatchAugment(gray_ratio=transform_cfg["GRAY_RATIO"], use_normalize=use_normalize)
+
+    build = build_sanet if model_name == "sanet" else build_adain
+    model, criterion, optimizer, scheduler = build(cfg, device)
+
+    # SANet cấu hình theo số iteration (MAX_ITER), quy đổi ra epoch
+    num_epochs = args.epochs or cfg["TRAINING"].get("NUM_EPOCHS")
+    if num_epochs is None:
+        steps_per_epoch = max(1, len(loaders["train"]) // args.grad_accum)
+        num_epochs = math.ceil(cfg["TRAINING"]["MAX_ITER"] / steps_per_epoch)
+
+    if is_main_process():
+        print(f"🚀 Train {model_name} | world_size={world_size} | device={device} | epochs={num_epochs}")
+
+    try:
+        train_model(
+            loaders["train"], loaders["valid"],
+            model, criterion, optimizer,
+            device, num_epochs,
+            save_dir=args.save_dir or cfg["TRAINING"]["SAVE_DIR"],
+            augment=augment,
+            amp=args.amp,
+            channels_last=args.channels_last,
+            compile_model=args.compile,
+            grad_accum_steps=args.grad_accum,
+            log_every=args.log_every,
+            scheduler=scheduler
+        )
+    finally:
+        cleanup_distributed()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
 from torch.utils.data import Dataset, DataLoader
+from torch.utils.data.distributed import DistributedSampler
 import torchvision.transforms as T
 import torchvision.transforms.functional as F
+from multiprocessing import Pool
 from tqdm import tqdm
 from PIL import Image
+import numpy as np
+import torch
+import torch.distributed as dist
+import hashlib
 import shutil
 import random
+import json
 import os
 import glob
 
@@ -12,84 +19,201 @@ import glob
 # ============================================================
 # STYLE SAMPLING
 # ============================================================
-def style_sampling(base_path, dest_path, n_samples=100, split=(0.8, 0.1, 0.1)):
+VALID_EXT = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+SAMPLING_MANIFEST = "manifest.json"
+
+
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _save_manifest(path, manifest):
+    """Ghi manifest atomically để dừng giữa chừng không làm hỏng file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def _select_style(args):
+    """Worker: chọn tối đa n_samples ảnh đọc được, không trùng nội dung, cho một style."""
+    style_path, style, n_samples, seed, known_hashes = args
+
+    files = sorted(f for f in os.listdir(style_path) if f.lower().endswith(VALID_EXT))
+    # Seed theo tên style: kết quả chọn không phụ thuộc thứ tự xử lý giữa các process
+    random.Random(f"{seed}:{style}").shuffle(files)
+
+    selected, skipped, seen = [], {}, set(known_hashes)
+    for name in files:
+        if len(selected) >= n_samples:
+            break
+        path = os.path.join(style_path, name)
+        try:
+            digest = _file_sha1(path)
+            with Image.open(path) as img:
+                img.verify()
+        except Exception as e:
+            skipped[f"{style}/{name}"] = f"corrupt: {e}"
+            continue
+        if digest in seen:
+            skipped[f"{style}/{name}"] = "duplicate"
+            continue
+        seen.add(digest)
+        selected.append([name, digest])
+
+    return style, selected, skipped
+
+
+def _split_selection(selected, split):
+    """Chia danh sách đã chọn thành train/valid/test, trả (subset, idx, name, digest)."""
+    n = len(selected)
+    n_train = int(n * split[0])
+    n_valid = int(n * split[1])
+
+    split_dict = {
+        "train": selected[:n_train],
+        "valid": selected[n_train:n_train + n_valid],
+        "test": selected[n_train + n_valid:]
+    }
+    for subset, imgs in split_dict.items():
+        for idx, (name, digest) in enumerate(imgs, start=1):
+            yield subset, idx, name, digest
+
+
+def _copy_image(args):
+    """Worker: copy ảnh sang đích, resize cạnh lớn về resize_long nếu ảnh lớn hơn."""
+    src, dst, dst_rel, resize_long = args
+    tmp = dst + ".tmp"
+    try:
+        with Image.open(src) as img:
+            w, h = img.size
+            if resize_long and max(w, h) > resize_long:
+                scale = resize_long / max(w, h)
+                img = img.convert("RGB").resize(
+                    (max(1, round(w * scale)), max(1, round(h * scale))), Image.Resampling.LANCZOS
+                )
+                img.save(tmp, format="JPEG", quality=95)
+            else:
+                shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        return dst_rel, None
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return dst_rel, str(e)
+
+
+def style_sampling(base_path, dest_path, n_samples=100, split=(0.8, 0.1, 0.1),
+                   num_workers=4, resize_long=None, seed=2025):
     """
     Lấy mẫu ảnh từ mỗi style và chia đều train/valid/test.
     Đặt tên file dạng style_001.jpg, style_002.jpg...
 
+    Chạy song song bằng process pool (chọn ảnh theo style, copy theo file) và
+    resume được: dest_path/manifest.json lưu ảnh đã chọn kèm sha1 và các file
+    đã copy xong, chạy lại chỉ làm phần còn thiếu. Ảnh hỏng hoặc trùng nội dung
+    (kể cả giữa các style) bị bỏ qua.
+
     Args:
         base_path (str): Thư mục chứa các folder style.
         dest_path (str): Thư mục lưu kết quả.
         n_samples (int): Số ảnh lấy mẫu cho mỗi style.
         split (tuple): Tỉ lệ chia train/valid/test.
+        num_workers (int): Số process song song.
+        resize_long (int | None): Resize cạnh lớn về giá trị này khi copy (None = giữ nguyên).
+        seed (int): Seed lấy mẫu.
     """
-    random.seed(2025)
-
     subsets = ["train", "valid", "test"]
     for subset in subsets:
         os.makedirs(os.path.join(dest_path, subset), exist_ok=True)
 
-    styles = [d for d in os.listdir(base_path)
-              if os.path.isdir(os.path.join(base_path, d))]
-
-    total_copied = 0
-
-    for style in tqdm(styles, desc="Sampling styles"):
-        style_path = os.path.join(base_path, style)
-
-        # Lọc file ảnh hợp lệ
-        image_files = [
-            f for f in os.listdir(style_path)
-            if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tiff'))
-        ]
-        if not image_files:
-            continue
-
-        # Lấy mẫu ngẫu nhiên
-        sample_imgs = random.sample(image_files, min(len(image_files), n_samples))
-        n = len(sample_imgs)
-
-        # Số lượng cho train/valid/test
-        n_train = int(n * split[0])
-        n_valid = int(n * split[1])
-        n_test = n - n_train - n_valid
-
-        # Chia ảnh
-        split_dict = {
-            "train": sample_imgs[:n_train],
-            "valid": sample_imgs[n_train:n_train + n_valid],
-            "test": sample_imgs[n_train + n_valid:]
-        }
-
-        # Copy ảnh sang folder tương ứng
-        for subset, imgs in split_dict.items():
-            dest_folder = os.path.join(dest_path, subset)
-            for idx, img_name in enumerate(imgs, start=1):
-                src = os.path.join(style_path, img_name)
-                dst_name = f"{style}_{idx:03d}.jpg"  # style_001.jpg
-                dst = os.path.join(dest_folder, dst_name)
-                shutil.copy(src, dst)
+    manifest_path = os.path.join(dest_path, SAMPLING_MANIFEST)
+    config = {"n_samples": n_samples, "split": list(split), "resize_long": resize_long, "seed": seed}
+    manifest = {"config": config, "selection": {}, "done": {}, "skipped": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["config"] != config:
+            raise ValueError(
+                f"{manifest_path} được tạo với cấu hình {manifest['config']}, khác {config}. "
+                f"Dùng dest_path khác hoặc xoá thư mục cũ."
+            )
+        print(f"🔄 Resume từ {manifest_path}: {len(manifest['done'])} ảnh đã xong")
+
+    styles = sorted(d for d in os.listdir(base_path)
+                    if os.path.isdir(os.path.join(base_path, d)))
+    pending = [s for s in styles if s not in manifest["selection"]]
+    seen = {digest for selected in manifest["selection"].values() for _, digest in selected}
+
+    with Pool(num_workers) as pool:
+        # Bước 1: chọn ảnh cho các style chưa có trong manifest
+        known = frozenset(seen)
+        jobs = [(os.path.join(base_path, s), s, n_samples, seed, known) for s in pending]
+        for style, selected, skipped in tqdm(pool.imap(_select_style, jobs), total=len(jobs),
+                                             desc="Sampling styles"):
+            # Trùng giữa các style: giữ ảnh ở style đứng trước (theo tên)
+            unique = []
+            for name, digest in selected:
+                if digest in seen:
+                    skipped[f"{style}/{name}"] = "duplicate"
+                    continue
+                seen.add(digest)
+                unique.append([name, digest])
+            manifest["selection"][style] = unique
+            manifest["skipped"].update(skipped)
+        _save_manifest(manifest_path, manifest)
+
+        # Bước 2: copy / resize các file chưa xong
+        tasks, digests = [], {}
+        for style in styles:
+            for subset, idx, name, digest in _split_selection(manifest["selection"][style], split):
+                dst_rel = f"{subset}/{style}_{idx:03d}.jpg"  # style_001.jpg
+                dst = os.path.join(dest_path, dst_rel)
+                if manifest["done"].get(dst_rel) == digest and os.path.exists(dst):
+                    continue
+                tasks.append((os.path.join(base_path, style, name), dst, dst_rel, resize_long))
+                digests[dst_rel] = digest
+
+        total_copied = 0
+        for i, (dst_rel, error) in enumerate(tqdm(pool.imap_unordered(_copy_image, tasks, chunksize=8),
+                                                  total=len(tasks), desc="Copying")):
+            if error:
+                manifest["skipped"][dst_rel] = f"copy failed: {error}"
+            else:
+                manifest["done"][dst_rel] = digests[dst_rel]
                 total_copied += 1
+            # Lưu định kỳ để bị ngắt giữa chừng vẫn resume được
+            if (i + 1) % 200 == 0:
+                _save_manifest(manifest_path, manifest)
 
-    print(f"Đã sao chép {total_copied} ảnh từ {len(styles)} style vào {dest_path}/train, valid, test")
+    _save_manifest(manifest_path, manifest)
+    print(f"Đã sao chép {total_copied} ảnh từ {len(styles)} style vào {dest_path}/train, valid, test "
+          f"(tổng {len(manifest['done'])} ảnh, bỏ qua {len(manifest['skipped'])} ảnh lỗi/trùng)")
 
 
 # ============================================================
 # TRANSFORM
 # ============================================================
 class TransformImageNet:
-    def __init__(self, target_long=512, min_short=256, crop_size=None, gray_ratio=0.0):
+    def __init__(self, target_long=512, min_short=256, crop_size=None, gray_ratio=0.0,
+                 use_normalize=True):
         """
         Args:
             target_long (int): Cạnh lớn của ảnh sau khi resize.
             min_short (int): Nếu cạnh nhỏ < min_short, sẽ padding.
             crop_size (int | None): Kích thước crop ngẫu nhiên (None = không crop).
             gray_ratio (float): Xác suất chuyển ảnh sang grayscale.
+            use_normalize (bool): Normalize theo ImageNet (SANet train trên ảnh [0, 1]).
         """
         self.target_long = target_long
         self.min_short = min_short
         self.crop_size = crop_size
         self.gray_ratio = gray_ratio
+        self.use_normalize = use_normalize
 
         self.to_tensor = T.ToTensor()
         self.normalize = T.Normalize(
@@ -132,14 +256,134 @@ class TransformImageNet:
             img = T.RandomCrop(self.crop_size)(img)
 
         img = self.to_tensor(img)
-        img = self.normalize(img)
+        if self.use_normalize:
+            img = self.normalize(img)
         return img
 
 
+def random_crop_hwc(arr, crop_size):
+    """Random crop ảnh np.uint8 (H, W, C), trả bản copy liên tục của vùng crop."""
+    if not crop_size:
+        return np.array(arr)
+
+    h, w = arr.shape[:2]
+    if h < crop_size or w < crop_size:
+        raise ValueError(
+            f"Required crop size {(crop_size, crop_size)} is larger than input image size {(h, w)}"
+        )
+    top = random.randint(0, h - crop_size)
+    left = random.randint(0, w - crop_size)
+    return np.array(arr[top:top + crop_size, left:left + crop_size])
+
+
+class TransformImageNetUInt8(TransformImageNet):
+    """
+    Bản rút gọn của TransformImageNet cho DataLoader worker: chỉ resize, pad và
+    crop, trả tensor uint8 (C, H, W). Grayscale + normalize làm theo batch bằng
+    BatchAugment trên device, nên worker nhẹ hơn và copy host→device nhỏ hơn 4 lần.
+    """
+
+    def __call__(self, img):
+        img = self.resize_and_pad(img)
+        arr = random_crop_hwc(np.asarray(img), self.crop_size)
+        return torch.from_numpy(arr).permute(2, 0, 1)
+
+
+class BatchAugment:
+    # Hệ số giống PIL convert("L") như TransformImageNet
+    GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+    def __init__(self, crop_size=None, gray_ratio=0.0, use_normalize=True,
+                 mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)):
+        """
+        Augment cả batch uint8 (N, 3, H, W) trên device sau DataLoader.
+
+        Args:
+            crop_size (int | None): Random crop từng ảnh trong batch (None = giữ nguyên,
+                dùng khi worker đã crop sẵn).
+            gray_ratio (float): Xác suất chuyển grayscale cho từng ảnh.
+            use_normalize (bool): Normalize theo mean/std (False = giữ ảnh [0, 1]).
+            mean, std (tuple): Tham số normalize (ImageNet).
+        """
+        self.crop_size = crop_size
+        self.gray_ratio = gray_ratio
+        self.use_normalize = use_normalize
+        self.mean = mean
+        self.std = std
+        self._consts = {}
+
+    def _constants(self, device):
+        """Cache mean/std/gray weights theo device để không tạo tensor mỗi batch."""
+        if device not in self._consts:
+            self._consts[device] = tuple(
+                torch.tensor(v, dtype=torch.float32, device=device).view(1, 3, 1, 1)
+                for v in (self.mean, self.std, self.GRAY_WEIGHTS)
+            )
+        return self._consts[device]
+
+    def random_crop(self, x):
+        """Crop mỗi ảnh một vị trí ngẫu nhiên riêng bằng một phép gather."""
+        n, c, h, w = x.shape
+        size = self.crop_size
+        if h < size or w < size:
+            raise ValueError(
+                f"Required crop size {(size, size)} is larger than input image size {(h, w)}"
+            )
+        if h == size and w == size:
+            return x
+
+        top = torch.randint(0, h - size + 1, (n, 1), device=x.device)
+        left = torch.randint(0, w - size + 1, (n, 1), device=x.device)
+        steps = torch.arange(size, device=x.device)
+        rows = (top + steps)[:, None, :, None]
+        cols = (left + steps)[:, None, None, :]
+        batch = torch.arange(n, device=x.device)[:, None, None, None]
+        channels = torch.arange(c, device=x.device)[None, :, None, None]
+        return x[batch, channels, rows, cols]
+
+    def __call__(self, x):
+        if self.crop_size:
+            x = self.random_crop(x)
+
+        mean, std, gray_weights = self._constants(x.device)
+        x = x.float().div_(255)
+
+        # Grayscale augmentation theo mask từng ảnh
+        if self.gray_ratio > 0:
+            mask = torch.rand(x.shape[0], 1, 1, 1, device=x.device) < self.gray_ratio
+            gray = (x * gray_weights).sum(dim=1, keepdim=True)
+            x = torch.where(mask, gray.expand_as(x), x)
+
+        if not self.use_normalize:
+            return x
+        return x.sub_(mean).div_(std)
+
+
 # ============================================================
 # DATASET
 # ============================================================
-class CustomImageDataset(Dataset):
+class StylePairing:
+    """
+    Chọn ảnh style ngẫu nhiên cho mỗi content.
+
+    Mặc định dùng random toàn cục như trước. Khi có pair_seed (train phân tán),
+    style của mỗi sample tất định theo (pair_seed, rank, epoch, idx) nên chạy
+    lại cho cùng kết quả, không phụ thuộc số worker hay thứ tự worker lấy sample.
+    """
+    pair_seed = None
+    rank = 0
+    epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def style_index(self, idx, n_styles):
+        if self.pair_seed is None:
+            return random.randrange(n_styles)
+        return random.Random(f"{self.pair_seed}:{self.rank}:{self.epoch}:{idx}").randrange(n_styles)
+
+
+class CustomImageDataset(Dataset, StylePairing):
     def __init__(self, content_folder, style_folder, subset,
                  transform=None, gray_ratio=0.2,
                  valid_ext=('.jpg', '.jpeg', '.png', '.bmp', '.tiff')):
@@ -183,7 +427,7 @@ class CustomImageDataset(Dataset):
         content_img = Image.open(content_path).convert("RGB")
         
         # Style image (random)
-        style_path = random.choice(self.style_files)
+        style_path = self.style_files[self.style_index(idx, len(self.style_files))]
         style_img = Image.open(style_path).convert("RGB")
         
         # Apply transform
@@ -194,40 +438,268 @@ class CustomImageDataset(Dataset):
         return content_img, style_img
 
 
+# ============================================================
+# PACKED SHARDS (ảnh đã resize, đọc qua memory-map)
+# ============================================================
+SHARD_INDEX = "index.json"
+
+
+def _load_resized(args):
+    """Worker: đọc ảnh và resize + pad như TransformImageNet. Trả None nếu ảnh hỏng."""
+    path, target_long, min_short = args
+    try:
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+        img = TransformImageNet(target_long=target_long, min_short=min_short).resize_and_pad(img)
+        return os.path.basename(path), np.asarray(img, dtype=np.uint8)
+    except Exception as e:
+        print(f"⚠️ Bỏ qua ảnh lỗi {path}: {e}")
+        return os.path.basename(path), None
+
+
+def pack_image_folder(src_folder, dest_folder, subsets=("train", "valid", "test"),
+                      target_long=512, min_short=256, shard_size_mb=1024, num_workers=4,
+                      valid_ext=('.jpg', '.jpeg', '.png', '.bmp', '.tiff')):
+    """
+    Pack ảnh thành các shard uint8 (HWC, RGB) đã resize sẵn để train không phải
+    decode JPEG + resize LANCZOS lại mỗi epoch.
+
+    Mỗi subset tạo ra:
+        dest_folder/<subset>/shard_00000.bin, shard_00001.bin, ...
+        dest_folder/<subset>/index.json  (vị trí [shard, offset, h, w] của từng ảnh)
+
+    Args:
+        src_folder (str): Thư mục chứa subfolder 'train', 'valid', 'test'.
+        dest_folder (str): Thư mục lưu shard.
+        subsets (tuple): Các subset cần pack.
+        target_long (int): Cạnh lớn sau resize (giống TransformImageNet).
+        min_short (int): Cạnh nhỏ tối thiểu, pad nếu thiếu.
+        shard_size_mb (int): Kích thước tối đa mỗi shard.
+        num_workers (int): Số process decode + resize song song.
+    """
+    shard_limit = shard_size_mb * 1024 * 1024
+
+    for subset in subsets:
+        src_dir = os.path.join(src_folder, subset)
+        out_dir = os.path.join(dest_folder, subset)
+        os.makedirs(out_dir, exist_ok=True)
+
+        files = []
+        for ext in valid_ext:
+            files.extend(glob.glob(os.path.join(src_dir, f"*{ext}")))
+        files = sorted(files)
+        if not files:
+            print(f"⚠️ Không có ảnh trong {src_dir}, bỏ qua")
+            continue
+
+        shards, items, names = [], [], []
+        shard_file, offset = None, 0
+        jobs = [(p, target_long, min_short) for p in files]
+
+        with Pool(num_workers) as pool:
+            for name, arr in tqdm(pool.imap(_load_resized, jobs, chunksize=16),
+                                  total=len(jobs), desc=f"Packing {subset}"):
+                if arr is None:
+                    continue
+                # Mở shard mới khi shard hiện tại đầy
+                if shard_file is None or offset + arr.nbytes > shard_limit:
+                    if shard_file is not None:
+                        shard_file.close()
+                    shards.append(f"shard_{len(shards):05d}.bin")
+                    shard_file = open(os.path.join(out_dir, shards[-1] + ".tmp"), "wb")
+                    offset = 0
+                h, w = arr.shape[:2]
+                shard_file.write(np.ascontiguousarray(arr).tobytes())
+                items.append([len(shards) - 1, offset, h, w])
+                names.append(name)
+                offset += arr.nbytes
+
+        if shard_file is not None:
+            shard_file.close()
+        # Chỉ rename khi pack xong cả subset, tránh đọc nhầm shard dở dang
+        for shard in shards:
+            os.replace(os.path.join(out_dir, shard + ".tmp"), os.path.join(out_dir, shard))
+
+        with open(os.path.join(out_dir, SHARD_INDEX), "w") as f:
+            json.dump({
+                "target_long": target_long,
+                "min_short": min_short,
+                "shards": shards,
+                "items": items,
+                "names": names,
+            }, f)
+
+        print(f"📦 {subset}: {len(items)}/{len(files)} ảnh → {len(shards)} shard tại {out_dir}")
+
+
+class PackedShards:
+    def __init__(self, root, subset):
+        """
+        Đọc ảnh từ shard đã pack, trả về view np.uint8 (H, W, 3) không copy.
+
+        Args:
+            root (str): Thư mục output của pack_image_folder.
+            subset (str): Tên tập con ('train', 'valid', 'test').
+        """
+        self.folder = os.path.join(root, subset)
+        index_path = os.path.join(self.folder, SHARD_INDEX)
+        if not os.path.exists(index_path):
+            raise RuntimeError(f"No packed shards found in {self.folder}")
+
+        with open(index_path) as f:
+            index = json.load(f)
+        self.shard_paths = [os.path.join(self.folder, s) for s in index["shards"]]
+        # Giữ index dạng numpy (không phải list Python) để worker fork không
+        # copy-on-read toàn bộ index do refcount
+        self.items = np.asarray(index["items"], dtype=np.int64).reshape(-1, 4)
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        shard, offset, h, w = self.items[idx]
+        mm = self._maps.get(shard)
+        if mm is None:
+            mm = np.memmap(self.shard_paths[shard], dtype=np.uint8, mode="r")
+            self._maps[shard] = mm
+        return mm[offset:offset + h * w * 3].reshape(h, w, 3)
+
+    def __getstate__(self):
+        # Mỗi DataLoader worker tự mở memmap của nó
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+
+class PackedImageDataset(Dataset, StylePairing):
+    def __init__(self, content_root, style_root, subset, crop_size=256, gray_ratio=0.2, uint8=False,
+                 use_normalize=True):
+        """
+        Dataset content/style đọc từ shard đã pack. Resize đã làm offline nên
+        mỗi sample chỉ còn random crop, grayscale và normalize.
+
+        Args:
+            content_root (str): Thư mục shard content (output của pack_image_folder).
+            style_root (str): Thư mục shard style.
+            subset (str): Tên tập con ('train', 'valid', 'test').
+            crop_size (int | None): Kích thước crop ngẫu nhiên (None = không crop).
+            gray_ratio (float): Xác suất chuyển grayscale.
+            uint8 (bool): Chỉ crop, trả tensor uint8 (C, H, W); grayscale +
+                normalize để BatchAugment làm trên device.
+            use_normalize (bool): Normalize theo ImageNet (SANet train trên ảnh [0, 1]).
+        """
+        self.content = PackedShards(content_root, subset)
+        self.style = PackedShards(style_root, subset)
+
+        if len(self.content) == 0:
+            raise RuntimeError(f"No content images found in {self.content.folder}")
+        if len(self.style) == 0:
+            raise RuntimeError(f"No style images found in {self.style.folder}")
+
+        self.crop_size = crop_size
+        self.gray_ratio = gray_ratio
+        self.uint8 = uint8
+        self.use_normalize = use_normalize
+        self.normalize = T.Normalize(
+            mean=[0.485, 0.456, 0.406],
+            std=[0.229, 0.224, 0.225]
+        )
+
+    def __len__(self):
+        return len(self.content)
+
+    def transform(self, arr):
+        # Random crop trên view memmap, chỉ copy vùng được crop
+        img = torch.from_numpy(random_crop_hwc(arr, self.crop_size)).permute(2, 0, 1)
+        if self.uint8:
+            return img
+
+        img = img.float().div_(255)
+
+        # Grayscale augmentation
+        if random.random() < self.gray_ratio:
+            img = F.rgb_to_grayscale(img, num_output_channels=3)
+
+        if self.use_normalize:
+            img = self.normalize(img)
+        return img
+
+    def __getitem__(self, idx):
+        content_img = self.transform(self.content[idx])
+        style_img = self.transform(self.style[self.style_index(idx, len(self.style))])
+        return content_img, style_img
+
+
 # ============================================================
 # DATALOADER FACTORY
 # ============================================================
 def get_dataloaders(content_folder, style_folder,
                     batch_size=8, num_workers=4, gray_ratio=0.2,
-                    target_long=512, min_short=256, crop_size=256):
+                    target_long=512, min_short=256, crop_size=256, packed=False,
+                    gpu_augment=False, use_normalize=True, distributed=False, seed=2025):
     """
     Tạo DataLoader cho train/valid/test.
     Giả sử content_folder và style_folder đã có subfolder 'train', 'valid', 'test'.
     Có thể bật tqdm để quan sát tiến trình load dữ liệu.
+
+    packed=True: content_folder/style_folder là output của pack_image_folder,
+    target_long/min_short đã cố định lúc pack nên bị bỏ qua.
+
+    gpu_augment=True: worker chỉ resize/crop và trả tensor uint8, grayscale +
+    normalize cần làm trên device bằng BatchAugment(gray_ratio=gray_ratio)
+    (truyền vào train_model qua tham số augment).
+
+    distributed=True: cần init_process_group trước (xem setup_distributed).
+    Mỗi rank dùng DistributedSampler với cùng seed để lấy phần dữ liệu riêng,
+    style ghép với content tất định theo (seed, rank, epoch, idx). train_model
+    gọi set_epoch cho sampler và dataset mỗi epoch. batch_size là batch của
+    từng rank.
     """
-    transform = TransformImageNet(
+    transform_cls = TransformImageNetUInt8 if gpu_augment else TransformImageNet
+    transform = transform_cls(
         target_long=target_long,
         min_short=min_short,
         crop_size=crop_size,
-        gray_ratio=gray_ratio
+        gray_ratio=gray_ratio,
+        use_normalize=use_normalize
     )
 
     loaders = {}
     for subset in ["train", "valid", "test"]:
-        dataset = CustomImageDataset(
-            content_folder,
-            style_folder,
-            subset=subset,
-            transform=transform,
-            gray_ratio=gray_ratio
-        )
+        if packed:
+            dataset = PackedImageDataset(
+                content_folder,
+                style_folder,
+                subset=subset,
+                crop_size=crop_size,
+                gray_ratio=gray_ratio,
+                uint8=gpu_augment,
+                use_normalize=use_normalize
+            )
+        else:
+            dataset = CustomImageDataset(
+                content_folder,
+                style_folder,
+                subset=subset,
+                transform=transform,
+                gray_ratio=gray_ratio
+            )
 
         shuffle = (subset == "train")
+        sampler = None
+
+        if distributed:
+            dataset.pair_seed = seed
+            dataset.rank = dist.get_rank()
+            sampler = DistributedSampler(dataset, shuffle=shuffle, seed=seed)
+            shuffle = False
 
         loader = DataLoader(
             dataset,
             batch_size=batch_size,
             shuffle=shuffle,
+            sampler=sampler,
             num_workers=num_workers,
             pin_memory=True
         )
@@ -1,88 +1,269 @@
 import os
+import time
+import contextlib
 import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 from tqdm import tqdm
 from torchvision.utils import save_image
 
+def setup_distributed(backend=None):
+    """
+    Khởi tạo process group từ biến môi trường của torchrun
+    (RANK, WORLD_SIZE, LOCAL_RANK, MASTER_ADDR, MASTER_PORT).
+
+    Args:
+        backend (str | None): None = nccl nếu có CUDA, ngược lại gloo (chạy được trên CPU).
+
+    Returns:
+        (rank, world_size, device)
+    """
+    if backend is None:
+        backend = "nccl" if torch.cuda.is_available() else "gloo"
+    dist.init_process_group(backend=backend)
+
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    if backend == "nccl":
+        torch.cuda.set_device(local_rank)
+        device = torch.device("cuda", local_rank)
+    else:
+        device = torch.device("cpu")
+    return dist.get_rank(), dist.get_world_size(), device
+
+def cleanup_distributed():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+def is_main_process():
+    return not (dist.is_available() and dist.is_initialized()) or dist.get_rank() == 0
+
+def _set_epoch(loader, epoch):
+    """Đổi thứ tự DistributedSampler và RNG ghép style theo epoch."""
+    for obj in (loader.sampler, loader.dataset):
+        if hasattr(obj, "set_epoch"):
+            obj.set_epoch(epoch)
+
+def _model_state(model):
+    """State dict lưu vào checkpoint; model có thể tự chọn phần cần lưu (vd. SANetForTraining)."""
+    if hasattr(model, "checkpoint_state_dict"):
+        return model.checkpoint_state_dict()
+    return model.state_dict()
+
+def _load_model_state(model, state):
+    if hasattr(model, "load_checkpoint_state_dict"):
+        model.load_checkpoint_state_dict(state)
+    else:
+        model.load_state_dict(state)
+
+def _save_best(model, save_dir):
+    """Lưu weight tốt nhất, trả danh sách file. Mặc định best_model.pth, model có save_best thì dùng hàm đó."""
+    if hasattr(model, "save_best"):
+        return model.save_best(save_dir)
+    best_path = os.path.join(save_dir, "best_model.pth")
+    torch.save(model.state_dict(), best_path)
+    return [best_path]
+
+def _all_reduce(tensor):
+    if dist.is_available() and dist.is_initialized():
+        dist.all_reduce(tensor)
+    return tensor
+
 def train_model(
     train_loader, test_loader,
     model, criterion, optimizer,
     device, num_epochs,
-    save_dir="../checkpoints"
+    save_dir="../checkpoints",
+    augment=None,
+    amp=False,
+    amp_dtype=None,
+    channels_last=False,
+    compile_model=False,
+    grad_accum_steps=1,
+    log_every=50,
+    scheduler=None
 ):
-    os.makedirs(save_dir, exist_ok=True)
+    """
+    augment: callable chạy trên batch sau khi đưa lên device (vd. BatchAugment
+    khi get_dataloaders(gpu_augment=True) trả tensor uint8).
+
+    Chế độ nhanh (opt-in):
+        amp: autocast + GradScaler (GradScaler chỉ bật với float16 trên CUDA).
+        amp_dtype: None = float16 trên CUDA, bfloat16 trên CPU.
+        channels_last: model và input dùng memory format NHWC.
+        compile_model: bọc model bằng torch.compile.
+        grad_accum_steps: cộng dồn gradient qua nhiều batch trước khi optimizer.step().
+        log_every: loss cộng dồn trên device, chỉ sync về CPU mỗi log_every step.
+
+    scheduler: LR scheduler, step() sau mỗi lần optimizer.step().
+
+    Train phân tán: gọi setup_distributed() và get_dataloaders(distributed=True)
+    trước. Model được bọc DistributedDataParallel; checkpoint, ảnh mẫu và log
+    chỉ do rank 0 ghi; loss train/val được all-reduce giữa các rank.
+    """
+    distributed = dist.is_available() and dist.is_initialized()
+    main_process = is_main_process()
+    if main_process:
+        os.makedirs(save_dir, exist_ok=True)
+
+    device_type = torch.device(device).type
+    if amp_dtype is None:
+        amp_dtype = torch.float16 if device_type == "cuda" else torch.bfloat16
+    scaler = torch.amp.GradScaler("cuda", enabled=amp and device_type == "cuda" and amp_dtype == torch.float16)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+
+    # Checkpoint luôn lưu/nạp từ model gốc (torch.compile thêm tiền tố _orig_mod.)
+    raw_model = model
+    if channels_last:
+        raw_model.to(memory_format=torch.channels_last)
+
+    def to_device(x):
+        x = x.to(device, non_blocking=True)
+        if augment is not None:
+            x = augment(x)
+        return x.contiguous(memory_format=memory_format)
 
     # ====================== LOAD CHECKPOINT ======================
     checkpoint_path = os.path.join(save_dir, "latest_checkpoint.pth")
     start_epoch = 0
     best_val_loss = float("inf")
 
-    if os.path.exists(checkpoint_path):
+    # Rank 0 đọc checkpoint rồi broadcast, các node khác không cần chung filesystem
+    ckpt = None
+    if main_process and os.path.exists(checkpoint_path):
         print(f"🔄 Loading checkpoint from {checkpoint_path}")
-        ckpt = torch.load(checkpoint_path, map_location=device)
-        model.load_state_dict(ckpt["model"])
+        ckpt = torch.load(checkpoint_path, map_location="cpu")
+    if distributed:
+        holder = [ckpt]
+        dist.broadcast_object_list(holder, src=0)
+        ckpt = holder[0]
+
+    if ckpt is not None:
+        _load_model_state(raw_model, ckpt["model"])
         optimizer.load_state_dict(ckpt["optimizer"])
+        # Checkpoint train không AMP lưu scaler rỗng: bỏ qua để bật AMP giữa chừng được
+        if ckpt.get("scaler"):
+            scaler.load_state_dict(ckpt["scaler"])
+        if scheduler is not None and ckpt.get("scheduler") is not None:
+            scheduler.load_state_dict(ckpt["scheduler"])
         start_epoch = ckpt["epoch"] + 1
         best_val_loss = ckpt["best_val_loss"]
-        print(f"➡ Continue from epoch {start_epoch}, best_val_loss={best_val_loss:.4f}")
+        if main_process:
+            print(f"➡ Continue from epoch {start_epoch}, best_val_loss={best_val_loss:.4f}")
+
+    ddp_model = None
+    if distributed:
+        device_ids = None
+        if device_type == "cuda":
+            index = torch.device(device).index
+            device_ids = [index if index is not None else torch.cuda.current_device()]
+        model = ddp_model = DistributedDataParallel(raw_model, device_ids=device_ids)
+
+    if compile_model:
+        model = torch.compile(model)
 
     # ====================== TRAIN LOOP ======================
     for epoch in range(start_epoch, num_epochs):
         model.train()
-        running_loss = 0.0
-        pbar = tqdm(train_loader, desc=f"Epoch {epoch} Training")
+        # [loss, content, style] cộng dồn trên device, tránh .item() mỗi step
+        running = torch.zeros(3, device=device)
+        window = torch.zeros(3, device=device)
+        window_steps = 0
+        n_images = 0
+        num_batches = len(train_loader)
+        epoch_start = time.perf_counter()
+        _set_epoch(train_loader, epoch)
+        _set_epoch(test_loader, epoch)
+        pbar = tqdm(train_loader, desc=f"Epoch {epoch} Training", disable=not main_process)
+
+        optimizer.zero_grad(set_to_none=True)
+        for step, (content, style) in enumerate(pbar):
+            content, style = to_device(content), to_device(style)
 
-        for content, style in pbar:
-            content, style = content.to(device), style.to(device)
+            sync_step = (step + 1) % grad_accum_steps == 0 or step + 1 == num_batches
+            # Chỉ all-reduce gradient ở micro-batch cuối của mỗi lần cộng dồn
+            no_sync = ddp_model.no_sync() if ddp_model is not None and not sync_step else contextlib.nullcontext()
 
-            optimizer.zero_grad()
-            generated, t = model(content, style)
-            loss, c_loss, s_loss = criterion(generated, t, style)
-            loss.backward()
-            optimizer.step()
+            with no_sync:
+                with torch.autocast(device_type, dtype=amp_dtype, enabled=amp):
+                    generated, t = model(content, style)
+                    loss, c_loss, s_loss = criterion(generated, t, style)
+                scaler.scale(loss / grad_accum_steps).backward()
 
-            running_loss += loss.item()
-            pbar.set_postfix({
-                "Loss": f"{loss.item():.4f}",
-                "Content": f"{c_loss.item():.4f}",
-                "Style": f"{s_loss.item():.4f}",
-            })
+            if sync_step:
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad(set_to_none=True)
+                if scheduler is not None:
+                    scheduler.step()
 
-        avg_train_loss = running_loss / len(train_loader)
+            losses = torch.stack([loss.detach(), c_loss.detach(), s_loss.detach()]).float()
+            running += losses
+            window += losses
+            window_steps += 1
+            n_images += content.shape[0]
+
+            if main_process and (window_steps == log_every or step + 1 == num_batches):
+                avg = (window / window_steps).tolist()
+                pbar.set_postfix({
+                    "Loss": f"{avg[0]:.4f}",
+                    "Content": f"{avg[1]:.4f}",
+                    "Style": f"{avg[2]:.4f}",
+                })
+                window.zero_()
+                window_steps = 0
+
+        # [tổng loss, số batch, số ảnh] của mọi rank
+        totals = _all_reduce(torch.stack([
+            running[0], torch.tensor(float(num_batches), device=device), torch.tensor(float(n_images), device=device)
+        ]))
+        avg_train_loss = (totals[0] / totals[1]).item()
+        n_images = int(totals[2].item())
+        epoch_time = time.perf_counter() - epoch_start
 
         # ====================== VALIDATION ======================
         model.eval()
-        val_loss = 0.0
+        val_loss = torch.zeros((), device=device)
         sample_saved = False
 
         with torch.no_grad():
             for batch_idx, (content, style) in enumerate(test_loader):
-                content, style = content.to(device), style.to(device)
-                generated, target_feat = model(content, style)
-                loss, _, _ = criterion(generated, target_feat, style)
-                val_loss += loss.item()
+                content, style = to_device(content), to_device(style)
+                with torch.autocast(device_type, dtype=amp_dtype, enabled=amp):
+                    generated, target_feat = model(content, style)
+                    loss, _, _ = criterion(generated, target_feat, style)
+                val_loss += loss.detach().float()
 
-                if not sample_saved:
+                if not sample_saved and main_process:
                     img_path = os.path.join(save_dir, f"epoch_{epoch}_sample.png")
-                    save_image(generated.clamp(0,1), img_path)
+                    save_image(generated.float().clamp(0,1), img_path)
                     sample_saved = True
 
-        avg_val_loss = val_loss / len(test_loader)
-        print(f"✅ Epoch {epoch} | Train: {avg_train_loss:.4f} | Val: {avg_val_loss:.4f}")
+        val_totals = _all_reduce(torch.stack([val_loss, torch.tensor(float(len(test_loader)), device=device)]))
+        avg_val_loss = (val_totals[0] / val_totals[1]).item()
+        if not main_process:
+            # Mọi rank có cùng avg_val_loss nên best_val_loss vẫn đồng bộ
+            best_val_loss = min(best_val_loss, avg_val_loss)
+            continue
+
+        print(f"✅ Epoch {epoch} | Train: {avg_train_loss:.4f} | Val: {avg_val_loss:.4f} "
+              f"| {n_images / epoch_time:.1f} img/s ({epoch_time:.0f}s)")
 
         # ====================== SAVE BEST MODEL ======================
         if avg_val_loss < best_val_loss:
             best_val_loss = avg_val_loss
-            best_path = os.path.join(save_dir, "best_model.pth")
-            torch.save(model.state_dict(), best_path)
-            print(f"🏆 Best model updated! Saved: {best_path}")
+            best_paths = _save_best(raw_model, save_dir)
+            print(f"🏆 Best model updated! Saved: {', '.join(best_paths)}")
 
         # ====================== SAVE CHECKPOINT (Resume) ======================
         torch.save({
             "epoch": epoch,
-            "model": model.state_dict(),
+            "model": _model_state(raw_model),
             "optimizer": optimizer.state_dict(),
+            "scaler": scaler.state_dict(),
+            "scheduler": scheduler.state_dict() if scheduler is not None else None,
             "best_val_loss": best_val_loss,
         }, checkpoint_path)
 
-    print("🎯 Training Completed!")
-    return best_val_loss
\ No newline at end of file
+    if main_process:
+        print("🎯 Training Completed!")
+    return best_val_loss